@@ -31,7 +31,13 @@ if __name__ == "__main__":
           package_dir      = {'':PACKAGE_SOURCE_DIR},
           
           #non-source files
-          package_data     =   {'': ['*.so', '*.dll']},
+          package_data     =   {'': ['*.so', '*.dll', '*.json']},
+
+          #the 'concurrent.futures' backport, part of the standard library on Python 3
+          install_requires =   ['futures; python_version < "3"'],
+
+          #optional features: 'FLI.aio' needs an asyncio event loop
+          extras_require   = {'aio': ['trollius']},
 
           **PACKAGE_METADATA
          )
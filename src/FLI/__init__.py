@@ -9,3 +9,6 @@
 from camera import USBCamera
 from filter_wheel import USBFilterWheel
 from focuser import USBFocuser
+from camera_array import CameraArray
+from calibration import Calibrator
+from autofocus import Autofocus
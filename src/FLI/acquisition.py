@@ -0,0 +1,191 @@
+"""
+ FLI.acquisition.py
+
+ Pipelined multi-frame acquisition for FLI USB cameras
+"""
+
+__date__ = '2026-10-17'
+
+import sys, time, threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+###############################################################################
+DEFAULT_QUEUE_SIZE     = 2
+DEFAULT_LATE_THRESHOLD = 0.010 #seconds
+PUT_TIMEOUT            = 0.1   #seconds, how often a blocked producer checks for stop
+###############################################################################
+class _Failure(object):
+    "carries an exception raised on the acquisition thread to the consumer"
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+_DONE = object()
+
+class FrameSequence(object):
+    """ Iterator over 'n' frames acquired back to back on a background thread.
+
+        The acquisition thread starts the next exposure as soon as a frame has
+        been read out and queued, so the consumer's processing overlaps the
+        next integration.  At most 'queue_size' frames wait for the consumer;
+        when the queue is full the thread either blocks (backpressure) or, if
+        'drop_frames' is set, discards the new frame and counts it as dropped.
+        An exposure that starts more than 'late_threshold' seconds after the
+        previous readout finished is counted as late.
+
+        Frames are checked out from the camera's 'frame_pool' and may be
+        handed back with 'camera.release_frame' once processed.  The camera
+        must not be used from other threads while the sequence is running.
+    """
+    def __init__(self, camera, n,
+                 queue_size = DEFAULT_QUEUE_SIZE,
+                 drop_frames = False,
+                 late_threshold = DEFAULT_LATE_THRESHOLD,
+                ):
+        self.camera = camera
+        self.n = n
+        self.drop_frames = drop_frames
+        self.late_threshold = late_threshold
+        self.frame_info = []   #one dict of timestamps per delivered frame
+        self.dropped = 0
+        self.late = 0
+        self._queue = queue.Queue(maxsize = queue_size)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._exposure_time = 0.0
+        self._t_first = None
+        self._t_last = None
+
+    def __iter__(self):
+        self.start()
+        return self
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def start(self):
+        "start the acquisition thread, called implicitly on iteration"
+        if self._thread is None:
+            self._thread = threading.Thread(target = self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """ask the acquisition thread to finish after the current frame and
+           wait for it, frames still in the queue are released
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            while self._thread.is_alive():
+                self._drain()
+                self._thread.join(PUT_TIMEOUT)
+        self._drain()
+
+    def next(self):
+        while True:
+            try:
+                item = self._queue.get(timeout = PUT_TIMEOUT)
+                break
+            except queue.Empty:
+                if self._thread is None or not self._thread.is_alive():
+                    raise StopIteration #stopped before the end of the sequence
+        if item is _DONE:
+            self._thread.join()
+            raise StopIteration
+        if isinstance(item, _Failure):
+            self._thread.join()
+            exc_type, exc_value, tb = item.exc_info
+            raise exc_type, exc_value, tb
+        return item
+
+    __next__ = next
+
+    def _drain(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if not (item is _DONE or isinstance(item, _Failure)):
+                self.camera.release_frame(item)
+
+    def _put(self, item):
+        "block until 'item' is queued, returns False if stopped meanwhile"
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout = PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        cam = self.camera
+        t_prev_readout = None
+        try:
+            for i in range(self.n):
+                if self._stop_event.is_set():
+                    break
+                t_start = time.time()
+                if t_prev_readout is not None and t_start - t_prev_readout > self.late_threshold:
+                    self.late += 1
+                cam.start_exposure()
+                timing = cam.wait_for_exposure()
+                t_exposed = time.time()
+                frame = cam.fetch_image()
+                t_readout = time.time()
+                t_prev_readout = t_readout
+                self._exposure_time += t_exposed - t_start
+                if self._t_first is None:
+                    self._t_first = t_start
+                self._t_last = t_readout
+                #the info is in place before the consumer can get the frame
+                self.frame_info.append({'index'          : i,
+                                        'exposure_start' : t_start,
+                                        'exposure_end'   : t_exposed,
+                                        'readout_end'    : t_readout,
+                                        'readout_latency': timing.readout_latency,
+                                       })
+                if self.drop_frames:
+                    try:
+                        self._queue.put_nowait(frame)
+                    except queue.Full:
+                        self.frame_info.pop()
+                        cam.release_frame(frame)
+                        self.dropped += 1
+                        continue
+                elif not self._put(frame):
+                    self.frame_info.pop()
+                    cam.release_frame(frame)
+                    break
+            self._put(_DONE)
+        except Exception:
+            self._put(_Failure(sys.exc_info()))
+
+    def get_stats(self):
+        """ returns a dict summarizing the sequence so far:
+               'frames'     - frames delivered to the queue
+               'dropped'    - frames discarded because the queue was full
+               'late'       - exposures started later than 'late_threshold'
+               'elapsed'    - seconds from first exposure start to last readout
+               'duty_cycle' - fraction of 'elapsed' spent integrating
+        """
+        elapsed = 0.0
+        if self._t_first is not None:
+            elapsed = self._t_last - self._t_first
+        duty_cycle = 0.0
+        if elapsed > 0:
+            duty_cycle = self._exposure_time/elapsed
+        return {'frames'     : len(self.frame_info),
+                'dropped'    : self.dropped,
+                'late'       : self.late,
+                'elapsed'    : elapsed,
+                'duty_cycle' : duty_cycle,
+               }
@@ -0,0 +1,219 @@
+"""
+ FLI.aio.py
+
+ asyncio interface for handling FLI USB devices
+
+ Each wrapped device gets a dedicated single worker executor on which all of
+ its libfli calls are made, so calls to one device are serialized while
+ several devices can be driven concurrently from one event loop.  Methods
+ return asyncio futures which can be yielded from coroutines; on Python 2
+ the event loop is that of 'trollius' (install the 'aio' extra):
+
+     from trollius import From, Return
+
+     @asyncio.coroutine
+     def snap():
+         cam = AsyncUSBCamera(USBCamera.find_devices()[0])
+         img = yield From(cam.take_photo())
+         raise Return(img)
+
+ Any other method of the wrapped device is also available and runs on the
+ executor, e.g. 'yield From(cam.set_exposure(100))'.
+"""
+
+__date__ = '2026-10-17'
+
+import functools
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+from camera import USBCamera
+from filter_wheel import USBFilterWheel
+from focuser import USBFocuser
+###############################################################################
+DEFAULT_POLL_INTERVAL = 0.05 #seconds
+
+###############################################################################
+def _then(dst, src, func):
+    """when future 'src' succeeds call 'func' with its result, otherwise
+       pass its failure on to future 'dst'
+    """
+    def callback(src):
+        if dst.cancelled():
+            return
+        if src.cancelled():
+            dst.cancel()
+            return
+        exc = src.exception()
+        if exc is not None:
+            dst.set_exception(exc)
+        else:
+            func(src.result())
+    src.add_done_callback(callback)
+
+def _chain(src, dst):
+    "copy the outcome of future 'src' to future 'dst' when it is done"
+    _then(dst, src, dst.set_result)
+
+class AsyncUSBDevice(object):
+    """ base class for asyncio wrappers of FLI USB devices"""
+    _device_class = None
+
+    def __init__(self, device, loop = None):
+        self.device = device
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers = 1)
+
+    @classmethod
+    def find_devices(cls, loop = None):
+        """locates all devices of the wrapped class (blocking) and returns a
+           list of wrapper objects
+        """
+        return [cls(dev, loop = loop) for dev in cls._device_class.find_devices()]
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def __getattr__(self, name):
+        if name == 'device':
+            raise AttributeError(name)
+        attr = getattr(self.device, name)
+        if not callable(attr):
+            return attr
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            return self.run(attr, *args, **kwargs)
+        return wrapper
+
+    def run(self, func, *args, **kwargs):
+        "run the blocking 'func' on the device's executor, returns a future"
+        return self.loop.run_in_executor(self._executor,
+                                         functools.partial(func, *args, **kwargs))
+
+    def poll(self, query, delay, finish = None):
+        """ Returns a future for a polled operation: 'query' is run on the
+            executor and 'delay' is called on its result in the event loop,
+            returning the seconds to wait before querying again or None when
+            done.  The future resolves to the result of 'finish' (run on the
+            executor) or else of the last 'query'.  No thread is blocked
+            between polls.
+        """
+        loop = self.loop
+        fut = asyncio.Future(loop = loop)
+        def step():
+            if not fut.cancelled():
+                self.run(query).add_done_callback(on_result)
+        def on_result(qfut):
+            if fut.cancelled():
+                return
+            exc = qfut.exception()
+            if exc is not None:
+                fut.set_exception(exc)
+                return
+            value = qfut.result()
+            try:
+                wait = delay(value)
+            except Exception as exc:
+                fut.set_exception(exc)
+                return
+            if wait is not None:
+                loop.call_later(wait, step)
+            elif finish is not None:
+                _chain(self.run(finish), fut)
+            else:
+                fut.set_result(value)
+        step()
+        return fut
+
+    def close(self):
+        "shut down the device's executor after pending calls complete"
+        self._executor.shutdown(wait = True)
+
+###############################################################################
+class AsyncUSBCamera(AsyncUSBDevice):
+    _device_class = USBCamera
+
+    def take_photo(self, out = None):
+        """ Expose the frame, wait for completion without blocking the event
+            loop, and fetch the image data.  Returns a future for the
+            numpy.ndarray; cancelling it cancels the exposure.
+        """
+        cam = self.device
+        fut = asyncio.Future(loop = self.loop)
+        def fetch(result):
+            _chain(self.run(cam.fetch_image, out = out), fut)
+        def wait(result):
+            _then(fut, self.wait_for_exposure(), fetch)
+        def on_done(fut):
+            if fut.cancelled():
+                self.run(cam.cancel_exposure)
+        fut.add_done_callback(on_done)
+        _then(fut, self.run(cam.start_exposure), wait)
+        return fut
+
+    def start_cooling(self, target, **kwargs):
+        """ Start cooling the CCD to 'target', see 'USBCamera.start_cooling';
+            returns a future for the stable temperature, cancelling it stops
+            the controller.
+        """
+        cooler = self.device.start_cooling(target, **kwargs)
+        return asyncio.wrap_future(cooler.future, loop = self.loop)
+
+    def wait_for_exposure(self):
+        "returns a future which resolves when the current exposure is complete"
+        def delay(timeleft):
+            if timeleft == 0:
+                return None
+            return timeleft/1000.0 #milliseconds
+        return self.poll(self.device.get_exposure_timeleft, delay)
+
+###############################################################################
+class AsyncUSBFocuser(AsyncUSBDevice):
+    _device_class = USBFocuser
+
+    def __init__(self, device, loop = None, poll_interval = DEFAULT_POLL_INTERVAL):
+        AsyncUSBDevice.__init__(self, device, loop = loop)
+        self.poll_interval = poll_interval
+
+    def step_motor(self, steps, force = False):
+        """ Start moving the stepper motor and poll until it stops; returns a
+            future for the final stepper position.
+        """
+        fut = asyncio.Future(loop = self.loop)
+        def wait(result):
+            _chain(self.wait_for_motion(), fut)
+        _then(fut, self.run(self.device.step_motor, steps, blocking = False, force = force), wait)
+        return fut
+
+    def wait_for_motion(self):
+        "returns a future for the stepper position once the motor has stopped"
+        def delay(steps_remaining):
+            if steps_remaining > 0:
+                return self.poll_interval
+            return None
+        return self.poll(self.device.get_steps_remaining, delay,
+                         finish = self.device.get_stepper_position)
+
+###############################################################################
+class AsyncUSBFilterWheel(AsyncUSBDevice):
+    """ 'set_filter_pos' returns a future which resolves once the wheel has
+        stopped, while the rotation runs on the wheel's own mover thread.
+    """
+    _device_class = USBFilterWheel
+
+    def set_filter_pos(self, pos):
+        "start rotating to slot 'pos', returns a future for the position"
+        fut = asyncio.Future(loop = self.loop)
+        def wait(move):
+            _chain(asyncio.wrap_future(move, loop = self.loop), fut)
+        #checking 'pos' may query the wheel, so it is started on the executor
+        _then(fut, self.run(self.device.set_filter_pos, pos, blocking = False), wait)
+        return fut
@@ -0,0 +1,289 @@
+"""
+ FLI.archive.py
+
+ Background compression and archival of camera frames
+
+ Frames are compressed with zlib after shuffling the bytes of the pixels
+ into planes (all the high bytes, then all the low bytes), which for 16 bit
+ sensor data compresses much better than the interleaved bytes.  The work
+ is done by a pool of processes; the pixel data reach them through files
+ in shared memory ('/dev/shm' when available) which the workers map, so
+ frames are never pickled.
+
+     archiver = FrameArchiver()
+     for i in range(n):
+         img = archiver.checkout_frame(cam)
+         cam.take_photo(out = img)
+         archiver.submit(img, "frame%04d.shz" % i)
+     archiver.close()
+     print archiver.get_stats()
+"""
+
+__date__ = '2026-10-17'
+
+import os, time, json, zlib, struct, tempfile, threading, weakref
+
+import numpy
+
+from concurrent.futures import ProcessPoolExecutor
+
+###############################################################################
+MAGIC = 'FLIZ'
+DEFAULT_LEVEL = 1                         #zlib level, favors throughput
+DEFAULT_MAX_INFLIGHT_BYTES = 256*2**20
+SHM_DIR = '/dev/shm'
+###############################################################################
+def _shm_dir():
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+def shuffle_bytes(arr):
+    "returns the bytes of 'arr' as an array of (itemsize, size) byte planes"
+    arr = numpy.ascontiguousarray(arr)
+    planes = arr.reshape(-1).view(numpy.uint8).reshape(-1, arr.dtype.itemsize)
+    return numpy.ascontiguousarray(planes.T)
+
+def _compress_frame(shm_path, shape, dtype, filename, level):
+    """ worker side: compress the frame held in the shared memory file
+        'shm_path' into 'filename', the shared memory file is removed;
+        returns (raw_bytes, compressed_bytes, cpu_seconds)
+    """
+    t0 = time.clock()
+    try:
+        img = numpy.memmap(shm_path, dtype = dtype, mode = 'r', shape = tuple(shape))
+        payload = zlib.compress(shuffle_bytes(img).data, level)
+        raw_bytes = img.nbytes
+        del img
+    finally:
+        os.unlink(shm_path)
+    header = json.dumps({'shape'   : list(shape),
+                         'dtype'   : numpy.dtype(dtype).str,
+                         'shuffle' : True,
+                         'codec'   : 'zlib',
+                        })
+    tmp = filename + '.part'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(payload)
+    os.rename(tmp, filename) #only complete files ever appear
+    return raw_bytes, len(payload), time.clock() - t0
+
+def load_frame(filename):
+    "read back a frame written by 'FrameArchiver' as a numpy array"
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not an archived frame" % filename)
+        size, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(size))
+        data = zlib.decompress(f.read())
+    dtype = numpy.dtype(str(header['dtype']))
+    shape = tuple(header['shape'])
+    buf = numpy.frombuffer(data, dtype = numpy.uint8)
+    if header['shuffle']:
+        buf = numpy.ascontiguousarray(buf.reshape(dtype.itemsize, -1).T)
+    return buf.view(dtype).reshape(shape)
+
+###############################################################################
+class FrameArchiver(object):
+    """ Compresses and writes frames in a 'ProcessPoolExecutor'.
+
+        'submit' only copies the frame into shared memory (or nothing at all
+        for frames obtained from 'checkout_frame') and returns, so the
+        acquisition loop is never held up by compression or disk writes.
+        The shared memory of the frames not yet written is limited to
+        'max_inflight_bytes'; past that 'checkout_frame' and 'submit' block
+        until the workers catch up, and the time spent waiting is reported
+        as 'blocked' by 'get_stats'.  A checked out frame which is not
+        submitted gives its room back when it is passed to 'release' or
+        garbage collected.
+    """
+    def __init__(self, max_workers = None,
+                 level = DEFAULT_LEVEL,
+                 max_inflight_bytes = DEFAULT_MAX_INFLIGHT_BYTES,
+                ):
+        self.level = level
+        self.max_inflight_bytes = max_inflight_bytes
+        self._executor = ProcessPoolExecutor(max_workers = max_workers)
+        self._shm_dir = _shm_dir()
+        self._owned = {}       #shm path of a checked out array -> (weakref, nbytes)
+        self._counter = 0
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._errors = []
+        #statistics
+        self.frames = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_time = 0.0
+        self.blocked = 0.0
+        self._t_first = None
+        self._t_last = None
+
+    def _reserve(self, nbytes):
+        "wait for room for 'nbytes' more bytes in flight"
+        if nbytes > self.max_inflight_bytes:
+            raise ValueError("frame of %d bytes exceeds 'max_inflight_bytes'" % nbytes)
+        with self._cond:
+            if self._inflight + nbytes > self.max_inflight_bytes:
+                t0 = time.time()
+                while self._inflight + nbytes > self.max_inflight_bytes:
+                    self._cond.wait()
+                self.blocked += time.time() - t0
+            self._inflight += nbytes
+            if self._t_first is None:
+                self._t_first = time.time()
+
+    def _free(self, nbytes):
+        with self._cond:
+            self._inflight -= nbytes
+            self._cond.notify_all()
+
+    def _new_shm(self, shape, dtype):
+        with self._cond:
+            self._counter += 1
+            name = "fli-archive-%d-%d" % (os.getpid(), self._counter)
+        path = os.path.join(self._shm_dir, name)
+        return path, numpy.memmap(path, dtype = dtype, mode = 'w+', shape = shape)
+
+    def checkout(self, shape, dtype):
+        """ returns an array of 'shape' and 'dtype' backed by shared memory,
+            which is handed to the workers without a copy by 'submit'
+        """
+        dtype = numpy.dtype(dtype)
+        nbytes = int(numpy.prod(shape))*dtype.itemsize
+        self._reserve(nbytes)
+        try:
+            path, arr = self._new_shm(tuple(shape), dtype)
+        except:
+            self._free(nbytes)
+            raise
+        #the weak reference gives the room back if the frame is dropped
+        ref = weakref.ref(arr, lambda ref, path = path: self._discard(path))
+        with self._cond:
+            self._owned[path] = (ref, nbytes)
+        return arr
+
+    def _take(self, img):
+        """returns the shm path of 'img' if it is a whole array checked out
+           here and not yet submitted, and forgets it; else None
+        """
+        path = getattr(img, 'filename', None)
+        if path is None:
+            return None
+        with self._cond:
+            entry = self._owned.get(path)
+            if entry is None or entry[0]() is not img:
+                return None #another array, or a view of the frame
+            del self._owned[path]
+            return path
+
+    def _discard(self, path):
+        "drop the checked out frame 'path' and give its room back"
+        with self._cond:
+            entry = self._owned.pop(path, None)
+        if entry is None:
+            return
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        self._free(entry[1])
+
+    def release(self, img):
+        """ give back a frame from 'checkout' which will not be submitted;
+            it must not be used afterwards
+        """
+        path = self._take(img)
+        if path is None:
+            raise ValueError("not a frame checked out from this archiver")
+        os.unlink(path)
+        self._free(img.nbytes)
+
+    def checkout_frame(self, camera):
+        "'checkout' a frame for the current geometry and bit depth of 'camera'"
+        row_width, img_rows, img_size = camera.get_image_size()
+        return self.checkout((img_rows, row_width), camera.get_image_dtype())
+
+    def submit(self, img, filename):
+        """ Queue the frame 'img' to be compressed and written to 'filename',
+            returns a future of (raw_bytes, compressed_bytes, cpu_seconds).
+
+            Frames from 'checkout' are passed on as is and must not be used
+            afterwards; any other array is copied and may be reused as soon
+            as this returns.
+        """
+        if self._errors:
+            raise self._errors.pop(0)
+        path = self._take(img)
+        nbytes = img.nbytes
+        if path is None:
+            self._reserve(nbytes)
+            try:
+                path, shm = self._new_shm(img.shape, img.dtype)
+                shm[...] = img
+                del shm
+            except:
+                self._free(nbytes)
+                raise
+        else:
+            img.flush()
+        future = self._executor.submit(_compress_frame, path, img.shape,
+                                       img.dtype.str, filename, self.level)
+        future.add_done_callback(lambda f: self._done(f, nbytes))
+        return future
+
+    def _done(self, future, nbytes):
+        self._free(nbytes)
+        with self._cond:
+            self._t_last = time.time()
+            exc = future.exception()
+            if exc is not None:
+                self._errors.append(exc)
+                return
+            raw_bytes, compressed_bytes, cpu_time = future.result()
+            self.frames += 1
+            self.raw_bytes += raw_bytes
+            self.compressed_bytes += compressed_bytes
+            self.cpu_time += cpu_time
+
+    def close(self, wait = True):
+        """ shut down the workers, by default after all the queued frames
+            have been written; raises the first error of a worker if any
+        """
+        self._executor.shutdown(wait = wait)
+        for path in list(self._owned):
+            self._discard(path)
+        if self._errors:
+            raise self._errors.pop(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close(wait = exc_type is None)
+        return False
+
+    def get_stats(self):
+        """ returns a dict with the number of 'frames' written, their
+            'raw_bytes' and 'compressed_bytes', the compression 'ratio', the
+            'throughput' in raw MB/s from the first submit to the last
+            completion, the worker 'cpu_time', the bytes still 'inflight'
+            and the seconds the producer was 'blocked' waiting for room
+        """
+        with self._cond:
+            elapsed = 0.0
+            if self._t_first is not None and self._t_last is not None:
+                elapsed = self._t_last - self._t_first
+            return {'frames'           : self.frames,
+                    'raw_bytes'        : self.raw_bytes,
+                    'compressed_bytes' : self.compressed_bytes,
+                    'ratio'            : float(self.raw_bytes)/self.compressed_bytes
+                                         if self.compressed_bytes else 0.0,
+                    'throughput'       : self.raw_bytes/elapsed/1e6 if elapsed > 0 else 0.0,
+                    'cpu_time'         : self.cpu_time,
+                    'inflight'         : self._inflight,
+                    'blocked'          : self.blocked,
+                   }
@@ -0,0 +1,345 @@
+"""
+ FLI.autofocus.py
+
+ V-curve autofocus with a 'USBFocuser' and a 'USBCamera', overlapping the
+ focuser motion with the readout and the frame scoring with the motion
+
+     af = Autofocus(cam, foc, exptime = 2000, start = 4000, step = 100, count = 21)
+     result = af.run()
+     print result.best_position, result.elapsed
+"""
+
+__date__ = '2026-10-17'
+
+import time
+
+import numpy
+
+from concurrent.futures import ThreadPoolExecutor
+
+from lib import FLIError
+###############################################################################
+DEFAULT_METRIC        = 'hfd'
+DEFAULT_BOX           = 64     #pixels, side of the box measured around the star
+DEFAULT_MIN_EACH_SIDE = 3      #samples needed on each side of the fitted best focus
+DEFAULT_VERTEX_TOLERANCE = 0.5  #sweep steps, standard error of the best focus to stop early
+MIN_FIT_POINTS        = 5      #samples of the fit around the best one, at least
+DEFAULT_POLL_INTERVAL = 0.01   #seconds, focuser status polling
+PEAK_BLOCK            = 4      #pixels, binning used to locate the star
+###############################################################################
+# Focus metrics, computed on a raw frame
+def half_flux_diameter(img, box = DEFAULT_BOX):
+    """ half flux diameter in pixels of the brightest star of 'img', smaller
+        is better focused
+
+        The star is located as the brightest PEAK_BLOCK square block, which
+        is insensitive to single hot pixels, and measured in a 'box' pixels
+        square around it after subtracting the median of the box border.
+        The diameter is estimated, as usual, by twice the flux weighted mean
+        distance from the centroid.
+    """
+    rows, cols = img.shape
+    b = PEAK_BLOCK
+    blocks = img[:rows - rows % b, :cols - cols % b].reshape(rows//b, b, cols//b, b)
+    blocks = blocks.sum(axis = (1, 3), dtype = numpy.float64)
+    r, c = numpy.unravel_index(numpy.argmax(blocks), blocks.shape)
+    r0 = min(max(0, r*b + b//2 - box//2), max(0, rows - box))
+    c0 = min(max(0, c*b + b//2 - box//2), max(0, cols - box))
+    stamp = img[r0:r0 + box, c0:c0 + box].astype(numpy.float64)
+    border = numpy.concatenate((stamp[0], stamp[-1], stamp[1:-1, 0], stamp[1:-1, -1]))
+    stamp -= numpy.median(border)
+    numpy.maximum(stamp, 0, out = stamp)
+    total = stamp.sum()
+    if total <= 0:
+        return numpy.nan
+    y = numpy.arange(stamp.shape[0])[:, None]
+    x = numpy.arange(stamp.shape[1])[None, :]
+    yc = (stamp.sum(axis = 1)*y[:, 0]).sum()/total
+    xc = (stamp.sum(axis = 0)*x[0]).sum()/total
+    radius = numpy.sqrt((y - yc)**2 + (x - xc)**2)
+    return 2.0*(stamp*radius).sum()/total
+
+def gradient_energy(img):
+    """ mean squared difference between neighbouring pixels of 'img', larger
+        is better focused; it needs no star detection, so it also works on
+        extended objects and crowded fields
+    """
+    img = img.astype(numpy.float32)
+    dx = numpy.diff(img, axis = 1)
+    dy = numpy.diff(img, axis = 0)
+    return (numpy.square(dx, out = dx).sum(dtype = numpy.float64) +
+            numpy.square(dy, out = dy).sum(dtype = numpy.float64))/img.size
+
+#name -> (function, True if smaller scores are better)
+METRICS = {
+    'hfd'      : (half_flux_diameter, True),
+    'gradient' : (gradient_energy,    False),
+}
+
+###############################################################################
+def _fit_window(positions, scores, minimize, points):
+    """ the non NaN samples as float arrays (positions, scores, cost), only
+        the 'points' of them around the best score if given
+    """
+    positions = numpy.asarray(positions, dtype = numpy.float64)
+    scores = numpy.asarray(scores, dtype = numpy.float64)
+    good = ~numpy.isnan(scores)
+    positions, scores = positions[good], scores[good]
+    cost = scores if minimize else -scores
+    if points is not None and points < len(scores):
+        best = numpy.argmin(cost)
+        lo = min(max(0, best - points//2), len(scores) - points)
+        window = slice(lo, lo + points)
+        positions, scores, cost = positions[window], scores[window], cost[window]
+    return positions, scores, cost
+
+def fit_vcurve(positions, scores, minimize = True, points = None):
+    """ least squares parabola through the samples around the best score,
+        'points' of them (by default all), returns (vertex, coefficients)
+        with 'coefficients' as of numpy.polyfit, or (None, None) if the
+        samples do not bracket an extremum of the right kind
+    """
+    vertex, coefficients, error = fit_vcurve_error(positions, scores, minimize, points)
+    return vertex, coefficients
+
+def fit_vcurve_error(positions, scores, minimize = True, points = None):
+    """ as 'fit_vcurve', returns (vertex, coefficients, error) where 'error'
+        is the standard error of the vertex estimated from the scatter of
+        the samples about the parabola, None with only 3 samples
+    """
+    positions, scores, cost = _fit_window(positions, scores, minimize, points)
+    if len(scores) < 3:
+        return None, None, None
+    #center the positions to keep the fit well conditioned
+    center = positions.mean()
+    x = positions - center
+    design = numpy.column_stack((x**2, x, numpy.ones_like(x)))
+    (a, b, c), residuals = numpy.linalg.lstsq(design, cost, rcond = None)[:2]
+    if a <= 0:
+        return None, None, None
+    vertex = center - b/(2*a)
+    if not positions.min() <= vertex <= positions.max():
+        return None, None, None
+    error = None
+    dof = len(scores) - 3
+    if dof > 0:
+        variance = (residuals[0] if len(residuals) else 0.0)/dof
+        covariance = variance*numpy.linalg.inv(numpy.dot(design.T, design))[:2, :2]
+        jacobian = numpy.array([b/(2*a*a), -1/(2*a)])   #of the vertex in (a, b)
+        error = numpy.sqrt(numpy.dot(jacobian, numpy.dot(covariance, jacobian)))
+    coefficients = numpy.polyfit(positions, scores, 2)
+    return vertex, coefficients, error
+
+###############################################################################
+class AutofocusResult(object):
+    """ outcome of an 'Autofocus' run:
+            best_position - focuser position of the fitted best focus, or of
+                            the best sample if the fit failed
+            positions     - focuser positions of the frames, in sweep order
+            scores        - metric of each frame
+            coefficients  - parabola of the fit (numpy.polyfit order), or None
+            error         - standard error of the fitted best focus in
+                            focuser steps, or None
+            stopped_early - True if the sweep ended before its last position
+            elapsed       - wall time of the run in seconds
+    """
+    def __init__(self, best_position, positions, scores, coefficients,
+                 stopped_early, elapsed, error = None):
+        self.best_position = best_position
+        self.positions = positions
+        self.scores = scores
+        self.coefficients = coefficients
+        self.stopped_early = stopped_early
+        self.elapsed = elapsed
+        self.error = error
+
+    def __repr__(self):
+        return "AutofocusResult(best_position=%r, frames=%d, stopped_early=%r, elapsed=%.2f)" \
+               % (self.best_position, len(self.positions), self.stopped_early, self.elapsed)
+
+###############################################################################
+class Autofocus(object):
+    """ Sweeps 'focuser' over 'count' positions 'start + i*step', exposing a
+        frame of 'exptime' milliseconds at each one, and moves it to the best
+        focus found by fitting a parabola to the metric around its extremum.
+
+        The steps of consecutive frames overlap:  as soon as the integration
+        of a frame has ended the focuser is started towards the next position
+        with 'step_motor(blocking = False)', so the move runs during the
+        readout, and the frame is scored by the 'metric' (see METRICS) on a
+        worker thread while the focuser travels.  With 'overlap' = False the
+        move, exposure, readout and scoring are done one after the other,
+        which is how the gain is measured.
+
+        The V-curve is fitted again after each frame, with a parabola
+        through the 'fit_points' samples around the best one (by default
+        '2*min_each_side + 1', at least MIN_FIT_POINTS).  With 'early_stop'
+        the sweep ends once the fitted best focus has 'min_each_side'
+        samples on either side and its standard error, from the scatter of
+        the samples about the fit, is at most 'vertex_tolerance' steps of
+        the sweep.  A frame which would end the sweep if it landed on the
+        current fit is scored before the focuser is moved on, so that the
+        last move is not wasted.
+
+        The camera exposure and image area settings are left to the caller.
+        Raises ValueError if a position is outside the focuser's range.
+    """
+    def __init__(self, camera, focuser, exptime, start, step, count,
+                 metric = DEFAULT_METRIC,
+                 min_each_side = DEFAULT_MIN_EACH_SIDE,
+                 early_stop = True,
+                 vertex_tolerance = DEFAULT_VERTEX_TOLERANCE,
+                 fit_points = None,
+                 overlap = True,
+                 move_to_best = True,
+                 poll_interval = DEFAULT_POLL_INTERVAL,
+                ):
+        if not metric in METRICS:
+            raise ValueError("'metric' must be one of %s" % ", ".join(sorted(METRICS)))
+        if step == 0 or count < 3:
+            raise ValueError("at least 3 positions with a non zero 'step' are needed")
+        positions = [start + i*step for i in range(count)]
+        extent = focuser.stepper_max_extent
+        for pos in positions:
+            if not 0 <= pos <= extent:
+                raise ValueError("focus position %d is outside the focuser range [0, %d]" % (pos, extent))
+        self.camera = camera
+        self.focuser = focuser
+        self.exptime = exptime
+        self.sweep = positions
+        self.metric = metric
+        self.min_each_side = min_each_side
+        self.early_stop = early_stop
+        self.vertex_tolerance = vertex_tolerance
+        if fit_points is None:
+            fit_points = max(2*min_each_side + 1, MIN_FIT_POINTS)
+        self.fit_points = fit_points
+        self.fit = (None, None, None)   #(vertex, coefficients, error) of the last fit
+        self.overlap = overlap
+        self.move_to_best = move_to_best
+        self.poll_interval = poll_interval
+        self._score, self._minimize = METRICS[metric]
+        self.positions = []
+        self.scores = []
+
+    def _move_to(self, position, blocking):
+        foc = self.focuser
+        current = foc.stepper_position
+        if current is None:
+            current = foc.get_stepper_position()
+        steps = position - current
+        if steps:
+            foc.step_motor(steps, blocking = blocking)
+
+    def _wait_focuser(self):
+        foc = self.focuser
+        while foc.get_steps_remaining() > 0:
+            time.sleep(self.poll_interval)
+        return foc.get_stepper_position()
+
+    def _measure(self, img):
+        "score 'img' and hand it back to the camera's frame pool"
+        try:
+            return self._score(img)
+        finally:
+            self.camera.release_frame(img)
+
+    def _add(self, position, score):
+        self.positions.append(position)
+        self.scores.append(score)
+        self.fit = fit_vcurve_error(self.positions, self.scores,
+                                    minimize = self._minimize, points = self.fit_points)
+
+    def _done(self, positions = None, fit = None):
+        """True once the fitted best focus is bracketed by 'min_each_side'
+           samples on either side and known to 'vertex_tolerance' steps
+        """
+        if positions is None:
+            positions, fit = self.positions, self.fit
+        vertex, coefficients, error = fit
+        if vertex is None or error is None:
+            return False
+        n = self.min_each_side
+        positions = numpy.asarray(positions)
+        if (positions < vertex).sum() < n or (positions > vertex).sum() < n:
+            return False
+        step = abs(self.sweep[1] - self.sweep[0])
+        return error <= self.vertex_tolerance*step
+
+    def _may_stop(self, position):
+        """ True if a sample at 'position' could end the sweep, i.e. if the
+            best sample so far would then have 'min_each_side' samples on
+            either side counting itself, as the fitted best focus needs; the
+            error of the fit cannot be told before the sample is scored
+        """
+        costs = numpy.array(self.scores, dtype = numpy.float64)
+        if len(costs) == 0 or numpy.isnan(costs).all():
+            return False
+        if not self._minimize:
+            costs = -costs
+        best = self.positions[numpy.nanargmin(costs)]
+        positions = numpy.array(self.positions + [position])
+        n = self.min_each_side
+        #the fitted best focus may lie on either side of the best sample
+        return (positions <= best).sum() >= n and (positions >= best).sum() >= n
+
+    def run(self):
+        "do the sweep, returns an 'AutofocusResult'"
+        cam = self.camera
+        cam.set_exposure(self.exptime)
+        self.positions = []
+        self.scores = []
+        self.fit = (None, None, None)
+        stopped_early = False
+        t_start = time.time()
+        executor = ThreadPoolExecutor(max_workers = 1)
+        pending = None    #(position, future) of the frame being scored
+        try:
+            self._move_to(self.sweep[0], blocking = not self.overlap)
+            for i, target in enumerate(self.sweep):
+                position = self._wait_focuser()
+                if position != target:
+                    raise FLIError("focuser at %d instead of %d" % (position, target))
+                if pending is not None:
+                    #scored while the focuser moved here
+                    self._add(pending[0], pending[1].result())
+                    pending = None
+                    if self.early_stop and self._done():
+                        stopped_early = True
+                        break
+                cam.start_exposure()
+                cam.wait_for_exposure()
+                last = i + 1 == len(self.sweep)
+                #no speculative move for a frame which may end the sweep
+                overlap = self.overlap and not (self.early_stop and self._may_stop(position))
+                if overlap and not last:
+                    self._move_to(self.sweep[i + 1], blocking = False)
+                img = cam.fetch_image()
+                if overlap:
+                    pending = (position, executor.submit(self._measure, img))
+                else:
+                    self._add(position, self._measure(img))
+                    if self.early_stop and self._done():
+                        stopped_early = not last
+                        break
+                    if not last:
+                        self._move_to(self.sweep[i + 1], blocking = True)
+            if pending is not None:
+                self._add(pending[0], pending[1].result())
+        finally:
+            executor.shutdown(wait = True)
+        vertex, coefficients, error = self.fit
+        if vertex is None:
+            costs = numpy.array(self.scores, dtype = numpy.float64)
+            if numpy.isnan(costs).all():
+                raise FLIError("no frame of the focus sweep could be measured")
+            best = numpy.nanargmin(costs) if self._minimize else numpy.nanargmax(costs)
+            best_position = self.positions[best]
+        else:
+            best_position = int(round(vertex))
+        if self.move_to_best:
+            self._wait_focuser()
+            self._move_to(best_position, blocking = True)
+        return AutofocusResult(best_position, list(self.positions), list(self.scores),
+                               coefficients, stopped_early, time.time() - t_start,
+                               error = error)
@@ -0,0 +1,458 @@
+"""
+ FLI.bench.py
+
+ Benchmark suite for the camera readout and control hot paths
+
+ Runs against the first camera of the loaded backend, real hardware by
+ default or the simulated library when FLI_BACKEND=sim is set:
+
+     FLI_BACKEND=sim python -m FLI.bench --output results.json
+     FLI_BACKEND=sim python -m FLI.bench --baseline results.json
+     FLI_BACKEND=sim python -m FLI.bench --baseline sim
+
+ Results are timings in seconds keyed by benchmark name.  When a baseline
+ file from an earlier run is given, every timing that got slower by more
+ than the tolerance is reported and the exit status is 1.  'sim' stands for
+ SIM_BASELINE, the results of the simulator recorded with the package;
+ timings depend on the host, so it is a reference for the relations between
+ them more than for their values.
+
+ The 'host.*' benchmarks always use private zero-latency simulated
+ libraries, so they measure the Python side overhead alone.
+"""
+
+__date__ = '2026-10-17'
+
+import os, sys, time, json, warnings, tempfile
+
+import numpy
+
+from lib import FLILibrary, FLIWarning
+from device import DeviceIndex
+from camera import USBCamera
+from camera_array import CameraArray
+from calibration import Calibrator, CALIBRATED_DTYPE
+from filter_wheel import USBFilterWheel
+from focuser import USBFocuser
+from autofocus import Autofocus
+from sequencer import ObservationSequencer, Target
+from sim import SimulatedLibFLI, zero_latency
+###############################################################################
+DEFAULT_REPEAT    = 5
+DEFAULT_TOLERANCE = 0.2  #fractional slowdown reported as a regression
+DEFAULT_EXPTIME   = 10   #milliseconds
+BINNINGS     = ((1,1),(2,2),(4,4))
+BITDEPTHS    = ('16bit','8bit')
+HOST_SIZES   = (1024, 2048, 4096)
+ARRAY_COUNTS = (1,2,4,8)
+ROI_SIZES    = (16, 32, 64, 128, 256, 512)
+SIM_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline_sim.json')
+
+###############################################################################
+def timeit(func, repeat = DEFAULT_REPEAT):
+    """returns the median wall time in seconds of 'repeat' calls of 'func',
+       after an untimed call which pays the one-time costs such as buffer
+       allocation and the simulator's scene generation
+    """
+    func()
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    times.sort()
+    return times[len(times)//2]
+
+def _fetch(cam):
+    cam.release_frame(cam.fetch_image())
+
+###############################################################################
+def bench_fetch_image(cam, results, repeat = DEFAULT_REPEAT, exptime = DEFAULT_EXPTIME):
+    """per frame time of 'fetch_image' for each binning, bit depth and
+       readout mode supported by the camera
+    """
+    cam.set_exposure(exptime)
+    for bitdepth in BITDEPTHS:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FLIWarning)
+            cam.set_bitdepth(bitdepth)
+        if cam.bitdepth != bitdepth:
+            continue #not supported by this camera
+        for hbin, vbin in BINNINGS:
+            cam.set_image_binning(hbin, vbin)
+            for mode in ('row','frame'):
+                cam.set_readout_mode(mode)
+                def run():
+                    cam.start_exposure()
+                    while cam.get_exposure_timeleft() > 0:
+                        time.sleep(0.001)
+                    t0 = time.time()
+                    _fetch(cam)
+                    return time.time() - t0
+                try:
+                    times = sorted(run() for i in range(repeat))
+                except Exception: #bulk grabs not supported
+                    continue
+                name = "fetch_image.%s.%dx%d.%s" % (bitdepth, hbin, vbin, mode)
+                results[name] = times[len(times)//2]
+    cam.set_bitdepth('16bit')
+    cam.set_image_binning(1, 1)
+    cam.set_readout_mode('auto')
+
+def bench_take_photo(cam, results, repeat = DEFAULT_REPEAT, exptime = DEFAULT_EXPTIME):
+    "latency of 'take_photo' from the nominal exposure end to data in hand"
+    cam.set_exposure(exptime)
+    for hbin, vbin in BINNINGS:
+        cam.set_image_binning(hbin, vbin)
+        started = []
+        start_exposure = cam.start_exposure
+        def timed_start():
+            start_exposure()
+            started.append(time.time())
+        cam.start_exposure = timed_start
+        try:
+            latencies = []
+            for i in range(repeat):
+                img = cam.take_photo()
+                latencies.append(time.time() - (started[-1] + exptime/1000.0))
+                cam.release_frame(img)
+        finally:
+            del cam.start_exposure
+        latencies.sort()
+        results["take_photo.latency.%dx%d" % (hbin, vbin)] = latencies[len(latencies)//2]
+    cam.set_image_binning(1, 1)
+
+def bench_trigger_latency(cam, results, repeat = DEFAULT_REPEAT, exptime = DEFAULT_EXPTIME):
+    """time from the 'start_exposure' call to the shutter opening, when
+       'FLIExposeFrame' returns, with the CCD flushed up front versus kept
+       clean by the background flushing of the ready mode
+    """
+    cam.set_exposure(exptime)
+    for name, ready in (('flush', False), ('ready', True)):
+        cam.set_ready_mode(ready)
+        latencies = []
+        for i in range(repeat):
+            cam.arm()
+            cam.start_exposure()
+            latencies.append(cam.exposure_timing.trigger_latency)
+            cam.wait_for_exposure()
+            _fetch(cam)
+        latencies.sort()
+        results["trigger_latency.%s" % name] = latencies[len(latencies)//2]
+    cam.set_ready_mode(False)
+
+def bench_metadata(cam, results, repeat = DEFAULT_REPEAT):
+    "cost of the metadata and temperature queries"
+    results["get_info.uncached"]     = timeit(lambda: cam.get_info(refresh = True), repeat)
+    results["get_info.cached"]       = timeit(cam.get_info, repeat)
+    results["get_temperature"]       = timeit(cam.get_temperature, repeat)
+    results["read_CCD_temperature"]  = timeit(cam.read_CCD_temperature, repeat)
+    results["get_cooler_power"]      = timeit(cam.get_cooler_power, repeat)
+    results["get_exposure_timeleft"] = timeit(cam.get_exposure_timeleft, repeat)
+
+def bench_enumeration(results, repeat = DEFAULT_REPEAT):
+    """time to enumerate and open the devices of each class, to list them
+       without opening, and to locate the first one by serial number with
+       and without a device index
+    """
+    for cls in (USBCamera, USBFocuser, USBFilterWheel):
+        name = cls.__name__
+        results["find_devices.%s" % name] = timeit(cls.find_devices, repeat)
+        results["list_devices.%s" % name] = timeit(cls.list_devices, repeat)
+        devs = cls.list_devices()
+        if not devs:
+            continue
+        serial_number = devs[-1].get_serial_number()
+        del devs
+        index = DeviceIndex(os.path.join(tempfile.mkdtemp(), "index.json"))
+        cls.locate_device(serial_number, index = index) #populate the index
+        results["locate_device.%s.indexed" % name] = \
+            timeit(lambda: cls.locate_device(serial_number, index = index), repeat)
+        results["locate_device.%s.scan" % name] = \
+            timeit(lambda: cls.locate_device(serial_number, index = False), repeat)
+        os.remove(index.path)
+        os.rmdir(os.path.dirname(index.path))
+
+def bench_host_readout(results, repeat = DEFAULT_REPEAT, sizes = HOST_SIZES):
+    """Python side overhead of row by row versus whole frame readout against
+       a zero-latency simulated library
+    """
+    for size in sizes:
+        cam = zero_latency(sensor_size = (size, size)).open_devices(USBCamera)[0]
+        cam.set_exposure(0)
+        for mode in ('row','frame'):
+            cam.set_readout_mode(mode)
+            def run():
+                cam.start_exposure()
+                _fetch(cam)
+            results["host.fetch_image.%dx%d.%s" % (size, size, mode)] = timeit(run, repeat)
+
+def bench_host_camera_array(results, repeat = DEFAULT_REPEAT, counts = ARRAY_COUNTS,
+                            size = 1024, exptime = DEFAULT_EXPTIME,
+                            usb_bytes_per_second = 40e6):
+    """time per frame set of 'CameraArray.take_photos' for each number of
+       cameras, each with its own simulated USB bandwidth; the aggregate
+       throughput is also recorded in MB/s
+    """
+    for count in counts:
+        dll = zero_latency(cameras = count, sensor_size = (size, size),
+                           usb_bytes_per_second = usb_bytes_per_second)
+        array = CameraArray(dll.open_devices(USBCamera))
+        array.set_exposure(exptime)
+        outs = [cam.checkout_frame() for cam in array]
+        dt = timeit(lambda: array.take_photos(out = outs), repeat)
+        nbytes = sum(img.nbytes for img in outs)
+        results["host.camera_array.%d" % count] = dt
+        results["host.camera_array.%d.MBps" % count] = nbytes/dt/1e6
+
+def bench_host_row_stream(results, repeat = DEFAULT_REPEAT, size = 2048,
+                          usb_bytes_per_second = 200e6):
+    """frame to result latency of a reduction (sum, saturated count and row
+       medians) done after 'fetch_image' versus overlapped with the readout
+       by a 'row_callback', with a simulated USB bandwidth
+    """
+    dll = zero_latency(sensor_size = (size, size),
+                       usb_bytes_per_second = usb_bytes_per_second)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(0)
+    img = cam.checkout_frame()
+    totals = [0.0, 0]
+    def reduce_block(row_start, block):
+        totals[0] += block.sum(dtype = 'float64')
+        totals[1] += numpy.count_nonzero(block >= 65535)
+        numpy.median(block, axis = 1)
+    def after():
+        cam.start_exposure()
+        cam.fetch_image(out = img)
+        reduce_block(0, img)
+    def overlapped():
+        cam.start_exposure()
+        cam.fetch_image(out = img, row_callback = reduce_block)
+    for name, func in (('after', after), ('overlapped', overlapped)):
+        results["host.row_stream.%dx%d.%s" % (size, size, name)] = timeit(func, repeat)
+
+def bench_host_calibration(results, repeat = DEFAULT_REPEAT, size = 2048,
+                           usb_bytes_per_second = 200e6, exptime = DEFAULT_EXPTIME):
+    """readout time of 'fetch_calibrated' against plain 'fetch_image' with a
+       simulated USB bandwidth, and the throughput in MB/s of raw frames of
+       'Calibrator.calibrate' on its own
+    """
+    dll = zero_latency(sensor_size = (size, size),
+                       usb_bytes_per_second = usb_bytes_per_second)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(exptime)
+    shape = (size, size)
+    cal = Calibrator()
+    cal.set_masters(bias = numpy.full(shape, 1000.0), dark = numpy.full(shape, 0.5),
+                    flat = numpy.random.uniform(0.9, 1.1, shape))
+    cam.calibrator = cal
+    img = cam.checkout_frame()
+    out = numpy.empty(shape, dtype = CALIBRATED_DTYPE)
+    def raw():
+        cam.start_exposure()
+        cam.fetch_image(out = img)
+    def calibrated():
+        cam.start_exposure()
+        cam.fetch_calibrated(out = out)
+    results["host.calibration.%dx%d.raw" % shape] = timeit(raw, repeat)
+    results["host.calibration.%dx%d.calibrated" % shape] = timeit(calibrated, repeat)
+    dt = timeit(lambda: cal.calibrate(img, exptime, out = out), repeat)
+    results["host.calibration.MBps"] = img.nbytes/dt/1e6
+
+def bench_host_roi(results, repeat = DEFAULT_REPEAT, sizes = ROI_SIZES,
+                   sensor_size = 2048, call_latency = 0.0002,
+                   usb_bytes_per_second = 40e6):
+    """guiding cycle time of 'take_subframe' for square subframes of each
+       size centered on the sensor, and of the full frame, with a simulated
+       per call latency and USB bandwidth and no exposure time or flushes
+    """
+    dll = zero_latency(sensor_size = (sensor_size, sensor_size),
+                       call_latency = call_latency,
+                       usb_bytes_per_second = usb_bytes_per_second)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(0)
+    cam.set_flushes(0)
+    for size in sizes + (sensor_size,):
+        ul = (sensor_size - size)//2
+        cam.set_image_area(ul, ul, ul + size, ul + size)
+        results["host.roi.%dx%d" % (size, size)] = timeit(cam.take_subframe, repeat)
+    cam.reset_image_area()
+
+def bench_host_autofocus(results, repeat = DEFAULT_REPEAT, sensor_size = 1024,
+                         count = 11, step = 100, usb_bytes_per_second = 40e6,
+                         exptime = 100):
+    """wall time of a full focus sweep of 'count' frames done step by step
+       versus with the focuser motion and scoring overlapped, see 'Autofocus'
+    """
+    dll = zero_latency(sensor_size = (sensor_size, sensor_size),
+                       usb_bytes_per_second = usb_bytes_per_second,
+                       best_focus = 5000)
+    cam = dll.open_devices(USBCamera)[0]
+    foc = dll.open_devices(USBFocuser)[0]
+    start = 5000 - (count//2)*step
+    for name, overlap in (('serial', False), ('overlapped', True)):
+        af = Autofocus(cam, foc, exptime, start, step, count,
+                       early_stop = False, overlap = overlap, move_to_best = False)
+        def sweep():
+            foc.step_motor(start - foc.get_stepper_position())
+            af.run()
+        results["host.autofocus.%d.%s" % (count, name)] = timeit(sweep, repeat)
+
+def bench_host_sequence(results, repeat = DEFAULT_REPEAT, sensor_size = 1024,
+                        usb_bytes_per_second = 40e6, exptime = 100, count = 2,
+                        save_time = 0.05):
+    """wall time of a three target sequence, each a filter change, a focus
+       offset and 'count' frames saved in 'save_time' seconds, run step by
+       step versus pipelined, see 'ObservationSequencer'
+    """
+    dll = zero_latency(sensor_size = (sensor_size, sensor_size),
+                       usb_bytes_per_second = usb_bytes_per_second)
+    cam = dll.open_devices(USBCamera)[0]
+    wheel = dll.open_devices(USBFilterWheel)[0]
+    foc = dll.open_devices(USBFocuser)[0]
+    targets = [Target('t%d' % i, exptime, count = count, filter = 2*i, focus_offset = 200*i)
+               for i in range(3)]
+    def save(img, target, index):
+        time.sleep(save_time)
+    for name, pipelined in (('serial', False), ('pipelined', True)):
+        seq = ObservationSequencer(cam, wheel = wheel, focuser = foc,
+                                   base_focus = 1000, pipelined = pipelined)
+        def run():
+            wheel.set_filter_pos(0)
+            foc.step_motor(1000 - foc.get_stepper_position())
+            seq.run(targets, save = save)
+        results["host.sequence.%s" % name] = timeit(run, repeat)
+
+def bench_host_exposure_detection(results, repeat = DEFAULT_REPEAT, exptime = 50,
+                                  call_latency = 0.0002, coarse_resolution = 10,
+                                  status_lag = 0.002):
+    """median delay between the data of an exposure becoming readable and
+       the host noticing it, sleeping for the time left as 'take_photo' used
+       to versus 'wait_for_exposure', and the number of status queries of
+       the latter; an end noticed early costs nothing, since the readout
+       blocks until the data is there.
+
+       The 'coarse.' variant is a camera which rounds the time left up to
+       'coarse_resolution' milliseconds and makes the data readable
+       'status_lag' seconds after the integration; the exposure times are
+       spread over a 'coarse_resolution' interval below 'exptime', as they
+       are not in general a multiple of the resolution.
+    """
+    for prefix, options in (('', {}),
+                            ('coarse.', {'timeleft_resolution' : coarse_resolution,
+                                         'status_lag'          : status_lag})):
+        dll = zero_latency(sensor_size = (256, 256), call_latency = call_latency,
+                           **options)
+        cam = dll.open_devices(USBCamera)[0]
+        sim_cam = dll.devices[0]
+        exptimes = [exptime]
+        if prefix:
+            exptimes = [exptime - coarse_resolution + 1 + i for i in range(coarse_resolution)]
+        def sleep():
+            while True:
+                timeleft = cam.get_exposure_timeleft()
+                if timeleft == 0:
+                    break
+                time.sleep(timeleft/1000.0)
+        polls = []
+        def adaptive():
+            polls.append(cam.wait_for_exposure().polls)
+        for name, wait in (('sleep', sleep), ('adaptive', adaptive)):
+            delays = []
+            for i in range(max(repeat, len(exptimes))):
+                cam.set_exposure(exptimes[i % len(exptimes)])
+                cam.start_exposure()
+                wait()
+                readable = sim_cam.exposure_end + dll.status_lag
+                delays.append(max(0.0, time.time() - readable))
+                _fetch(cam)
+            delays.sort()
+            results["host.exposure_detect.%s%s" % (prefix, name)] = delays[len(delays)//2]
+        results["host.exposure_detect.%spolls" % prefix] = sorted(polls)[len(polls)//2]
+
+###############################################################################
+def run_suite(repeat = DEFAULT_REPEAT, host = True):
+    """run all the benchmarks, returns a dict with the 'results' and a
+       description of the 'backend'
+    """
+    results = {}
+    dll = FLILibrary.getDll()
+    if isinstance(dll, SimulatedLibFLI):
+        backend = 'sim'
+        dll.bitdepth_settable = True
+    else:
+        backend = 'libfli %s' % FLILibrary.getVersion()
+    bench_enumeration(results, repeat = repeat)
+    cams = USBCamera.find_devices()
+    if cams:
+        cam = cams[0]
+        bench_metadata(cam, results, repeat = repeat)
+        bench_fetch_image(cam, results, repeat = repeat)
+        bench_take_photo(cam, results, repeat = repeat)
+        bench_trigger_latency(cam, results, repeat = repeat)
+    if host:
+        bench_host_readout(results, repeat = repeat)
+        bench_host_camera_array(results, repeat = repeat)
+        bench_host_row_stream(results, repeat = repeat)
+        bench_host_calibration(results, repeat = repeat)
+        bench_host_roi(results, repeat = repeat)
+        bench_host_autofocus(results, repeat = repeat)
+        bench_host_sequence(results, repeat = repeat)
+        bench_host_exposure_detection(results, repeat = repeat)
+    return {'backend' : backend,
+            'date'    : time.strftime("%Y-%m-%d %H:%M:%S"),
+            'repeat'  : repeat,
+            'results' : results,
+           }
+
+def compare(results, baseline, tolerance = DEFAULT_TOLERANCE):
+    """returns a list of (name, value, baseline_value) for the timings which
+       are slower than the baseline by more than 'tolerance'; throughputs
+       (names ending in 'MBps') regress when they drop instead
+    """
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        value = results.get(name)
+        if value is None or base <= 0:
+            continue
+        if name.endswith('MBps'):
+            slower = value < base*(1.0 - tolerance)
+        else:
+            slower = value > base*(1.0 + tolerance)
+        if slower:
+            regressions.append((name, value, base))
+    return regressions
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(description = "FLI benchmark suite")
+    parser.add_argument('--repeat', type = int, default = DEFAULT_REPEAT)
+    parser.add_argument('--output', help = "write the results as JSON to this file")
+    parser.add_argument('--baseline', help = "compare against the results in this JSON file,"
+                                             " or 'sim' for the recorded simulator results")
+    parser.add_argument('--tolerance', type = float, default = DEFAULT_TOLERANCE)
+    parser.add_argument('--no-host', action = 'store_true',
+                        help = "skip the host overhead benchmarks")
+    args = parser.parse_args(argv)
+    report = run_suite(repeat = args.repeat, host = not args.no_host)
+    for name, value in sorted(report['results'].items()):
+        print "%-40s %12.6f" % (name, value)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 1, sort_keys = True, separators = (',', ': '))
+    if args.baseline:
+        path = SIM_BASELINE if args.baseline == 'sim' else args.baseline
+        with open(path) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(report['results'], baseline, tolerance = args.tolerance)
+        for name, value, base in regressions:
+            print "REGRESSION %-40s %12.6f (baseline %.6f)" % (name, value, base)
+        if regressions:
+            return 1
+    return 0
+
+###############################################################################
+#  TEST CODE
+###############################################################################
+if __name__ == "__main__":
+    sys.exit(main())
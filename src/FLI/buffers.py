@@ -0,0 +1,76 @@
+"""
+ FLI.buffers.py
+
+ Reusable image buffers for zero-allocation readout
+"""
+
+__date__ = '2026-10-17'
+
+import threading
+
+import numpy
+
+###############################################################################
+DEFAULT_MAX_FREE = 4
+###############################################################################
+class FramePool(object):
+    """ pool of reusable numpy frame buffers keyed by shape and dtype
+
+        Buffers are handed out with 'checkout' and returned with 'release';
+        a buffer must not be used by the caller after it has been released.
+        Buffers that are never released are simply garbage collected.
+    """
+    def __init__(self, max_free = DEFAULT_MAX_FREE):
+        self.max_free  = max_free   #free buffers kept per (shape, dtype)
+        self.allocated = 0
+        self.reused    = 0
+        self._free = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(shape, dtype):
+        return (tuple(shape), numpy.dtype(dtype).str)
+
+    def checkout(self, shape, dtype):
+        """returns an uninitialized C-contiguous array of 'shape' and 'dtype',
+           reusing a released buffer when available
+        """
+        key = self._key(shape, dtype)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self.reused += 1
+                return free.pop()
+            self.allocated += 1
+        return numpy.empty(shape, dtype = dtype)
+
+    def release(self, arr):
+        """return 'arr' to the pool, buffers beyond 'max_free' for its
+           geometry are dropped
+
+           raises ValueError if 'arr' is not an owning C-contiguous array or
+           has already been released
+        """
+        if arr.base is not None or not arr.flags.c_contiguous:
+            raise ValueError("only owning C-contiguous arrays can be released to the pool")
+        key = self._key(arr.shape, arr.dtype)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            for buf in free:
+                if buf is arr:
+                    raise ValueError("buffer has already been released to the pool")
+            if len(free) < self.max_free:
+                free.append(arr)
+
+    def clear(self):
+        "drop all free buffers"
+        with self._lock:
+            self._free.clear()
+
+    def get_stats(self):
+        "returns a dict of pool usage counters"
+        with self._lock:
+            nfree = sum(len(free) for free in self._free.values())
+            nbytes = sum(buf.nbytes for free in self._free.values() for buf in free)
+        return {'allocated': self.allocated, 'reused': self.reused,
+                'free': nfree, 'free_bytes': nbytes}
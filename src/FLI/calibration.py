@@ -0,0 +1,165 @@
+"""
+ FLI.calibration.py
+
+ Bias, dark and flat field calibration of camera frames
+"""
+
+__date__ = '2026-10-17'
+
+import threading
+
+import numpy
+
+###############################################################################
+CALIBRATED_DTYPE = numpy.dtype(numpy.float32)
+###############################################################################
+class CalibrationMasters(object):
+    """ master frames for one binning, stored as float32:
+            bias  - bias level in counts
+            dark  - dark current in counts per second, bias subtracted
+            flat  - flat field, normalized to a mean of 1 when set
+        Any of them may be None.  'origin' is the (ul_x, ul_y) in unbinned
+        pixels of the sensor of their first pixel, see 'Calibrator'.  The per pixel offset 'bias + dark*t' is
+        combined once per exposure time and the flat is kept as its
+        reciprocal, so calibrating costs a subtraction and a multiplication.
+    """
+    def __init__(self, shape, bias = None, dark = None, flat = None, origin = (0,0)):
+        self.shape = tuple(shape)
+        self.origin = tuple(origin)
+        self.bias = self._as_master(bias)
+        self.dark = self._as_master(dark)
+        self.flat = None
+        self._gain = None
+        if flat is not None:
+            flat = self._as_master(flat)
+            flat /= flat.mean()
+            self.flat = flat
+            #pixels with no response are zeroed rather than blown up
+            self._gain = numpy.zeros(self.shape, dtype = CALIBRATED_DTYPE)
+            numpy.divide(1.0, flat, out = self._gain, where = flat > 0)
+        self._offset = None
+        self._offset_exptime = None
+        self._lock = threading.Lock()
+
+    def _as_master(self, frame):
+        if frame is None:
+            return None
+        frame = numpy.array(frame, dtype = CALIBRATED_DTYPE)
+        if frame.shape != self.shape:
+            raise ValueError("master frame has shape %r, expected %r" % (frame.shape, self.shape))
+        return frame
+
+    def get_offset(self, exptime):
+        """returns the float32 'bias + dark*t' for the exposure time 'exptime'
+           in milliseconds, or None if there is neither bias nor dark
+        """
+        with self._lock:
+            if self._offset is None or self._offset_exptime != exptime:
+                if self.dark is None:
+                    offset = self.bias
+                else:
+                    offset = self.dark*CALIBRATED_DTYPE.type(exptime/1000.0)
+                    if self.bias is not None:
+                        offset += self.bias
+                self._offset = offset
+                self._offset_exptime = exptime
+            return self._offset
+
+    def apply(self, raw, out, exptime, row_start = 0, col_start = 0):
+        """ calibrate 'raw', whose first pixel is at row 'row_start' and
+            column 'col_start' of the masters, into the float32 array 'out'
+            of the same shape:
+                out = (raw - bias - dark*t)/flat
+            Each step works in place on 'out', so on a block of rows that
+            fits in the cache it amounts to a single pass over memory.
+        """
+        rows, cols = raw.shape
+        if row_start < 0 or col_start < 0 or \
+           row_start + rows > self.shape[0] or col_start + cols > self.shape[1]:
+            raise ValueError("the frame is not inside the calibration masters")
+        window = (slice(row_start, row_start + rows), slice(col_start, col_start + cols))
+        offset = self.get_offset(exptime)
+        out[...] = raw
+        if offset is not None:
+            out -= offset[window]
+        if self._gain is not None:
+            out *= self._gain[window]
+        return out
+
+###############################################################################
+class Calibrator(object):
+    """ Holds the calibration masters of any number of binnings, and applies
+        them to frames of that binning read from any image area inside them:
+
+            cal = Calibrator()
+            cal.set_masters((2,2), bias = bias, dark = dark, flat = flat,
+                            origin = cam.get_visible_area()[:2])
+            cam.calibrator = cal
+            cam.set_image_area(500, 500, 1000, 1000)
+            img = cam.take_photo(calibrate = True)
+
+        The masters are normally full frames, and the image areas are given
+        in the unbinned pixels of 'USBCamera.get_image_area'.
+    """
+    def __init__(self):
+        self._masters = {}
+
+    def set_masters(self, binning = (1,1), bias = None, dark = None, flat = None,
+                    origin = (0,0)):
+        """set the masters used for frames of 'binning' (hbin, vbin), whose
+           first pixel is at 'origin' (ul_x, ul_y) in unbinned pixels, see
+           'CalibrationMasters'
+        """
+        frames = [f for f in (bias, dark, flat) if f is not None]
+        if not frames:
+            raise ValueError("at least one of 'bias', 'dark' or 'flat' must be given")
+        shape = numpy.shape(frames[0])
+        masters = CalibrationMasters(shape, bias = bias, dark = dark, flat = flat,
+                                     origin = origin)
+        self._masters[tuple(binning)] = masters
+        return masters
+
+    def remove_masters(self, binning = (1,1)):
+        "forget the masters of 'binning'"
+        self._masters.pop(tuple(binning), None)
+
+    def get_masters(self, binning):
+        "returns the 'CalibrationMasters' for 'binning', else raises ValueError"
+        try:
+            return self._masters[tuple(binning)]
+        except KeyError:
+            raise ValueError("no calibration masters for binning %dx%d" % tuple(binning))
+
+    def locate(self, binning, area, shape):
+        """ returns (masters, row_start, col_start) for a frame of 'shape'
+            (rows, columns) read with 'binning' from the image 'area'
+            (ul_x, ul_y, lr_x, lr_y) in unbinned pixels, see
+            'CalibrationMasters.apply'; raises ValueError if there are no
+            masters for 'binning', if the frame is not inside them or if its
+            pixels do not line up with theirs
+        """
+        hbin, vbin = binning
+        masters = self.get_masters(binning)
+        col_start, col_rest = divmod(area[0] - masters.origin[0], hbin)
+        row_start, row_rest = divmod(area[1] - masters.origin[1], vbin)
+        rows, cols = shape
+        if row_rest or col_rest:
+            raise ValueError("the binned pixels of image area %r do not line up with the calibration masters" % (tuple(area),))
+        if row_start < 0 or col_start < 0 or \
+           row_start + rows > masters.shape[0] or col_start + cols > masters.shape[1]:
+            raise ValueError("image area %r is not inside the calibration masters for binning %dx%d"
+                             % ((tuple(area),) + tuple(binning)))
+        return masters, row_start, col_start
+
+    def calibrate(self, raw, exptime, binning = (1,1), out = None, area = None):
+        """returns the float32 calibrated frame of 'raw', taken with binning
+           'binning' and exposure time 'exptime' in milliseconds from the
+           image 'area', by default the one starting at the masters' origin
+        """
+        if area is None:
+            masters = self.get_masters(binning)
+            area = masters.origin
+        masters, row_start, col_start = self.locate(binning, area, raw.shape)
+        if out is None:
+            out = numpy.empty(raw.shape, dtype = CALIBRATED_DTYPE)
+        return masters.apply(raw, out, exptime, row_start = row_start, col_start = col_start)
@@ -10,7 +10,12 @@
 __author__ = 'Craig Wm. Versek'
 __date__ = '2012-08-08'
 
-import sys, time, warnings, traceback
+import sys, time, warnings, traceback, threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 try:
     from collections import OrderedDict
@@ -24,28 +29,122 @@ from ctypes import pointer, POINTER, byref, sizeof, Structure, c_char,\
 import numpy
 
 from lib import FLILibrary, FLIError, FLIWarning, flidomain_t, flidev_t,\
-                fliframe_t, FLIDOMAIN_USB, FLIDEVICE_CAMERA,\
+                fliframe_t, flibitdepth_t, FLIDOMAIN_USB, FLIDEVICE_CAMERA,\
                 FLI_FRAME_TYPE_NORMAL, FLI_FRAME_TYPE_DARK,\
                 FLI_FRAME_TYPE_RBI_FLUSH, FLI_MODE_8BIT, FLI_MODE_16BIT,\
-                FLI_TEMPERATURE_CCD, FLI_TEMPERATURE_BASE
+                FLI_TEMPERATURE_CCD, FLI_TEMPERATURE_BASE,\
+                FLI_CAMERA_STATUS_UNKNOWN, FLI_CAMERA_STATUS_MASK,\
+                FLI_CAMERA_STATUS_IDLE, FLI_CAMERA_STATUS_READING_CCD,\
+                FLI_CAMERA_DATA_READY, FLI_BGFLUSH_START, FLI_BGFLUSH_STOP,\
+                flibgflush_t
 
 from device import USBDevice
+from buffers import FramePool
+from acquisition import FrameSequence, DEFAULT_QUEUE_SIZE, DEFAULT_LATE_THRESHOLD
+from video import VideoStream, DEFAULT_VIDEO_BUFFERS
+from fits import FITSImageFile, DEFAULT_CHUNK_BYTES
+from calibration import CALIBRATED_DTYPE
+from scheduler import PRIORITY_READOUT, coalesced
+from cooling import CoolingController
 ###############################################################################
 DEBUG = False
 DEFAULT_BITDEPTH = '16bit'
+DEFAULT_READOUT_MODE = 'auto'
+READOUT_MODES = ('auto', 'frame', 'row')
+DEFAULT_BLOCK_BYTES = 256*2**10 #row block size for streaming readout
+DEFAULT_POLL_GUARD    = 0.010   #seconds before the expected end of an exposure to start fine polling
+DEFAULT_POLL_INTERVAL = 0.001   #seconds, fine polling period
+DEFAULT_NFLUSHES = 1            #flushes before an exposure until 'set_flushes' is used
+###############################################################################
+class ExposureTiming(object):
+    """ host side timing of an exposure, times from time.time():
+            trigger       - when 'start_exposure' was called
+            start         - when 'start_exposure' returned, which
+                            'FLIExposeFrame' does once the shutter is open
+            end           - estimated end of the integration: the midpoint
+                            between the last status query which found it
+                            running and the first which found it complete
+            detected      - when the completion was detected
+            readout_start - when the readout began, None until then
+            polls         - status queries made while waiting
+    """
+    def __init__(self, start, exptime, trigger = None):
+        self.trigger = trigger
+        self.start = start
+        self.exptime = exptime
+        self.end = None
+        self.detected = None
+        self.readout_start = None
+        self.polls = 0
+
+    @property
+    def trigger_latency(self):
+        "seconds from the exposure request to the shutter opening"
+        if self.trigger is None or self.start is None:
+            return None
+        return self.start - self.trigger
+
+    @property
+    def detection_latency(self):
+        "seconds from the estimated end of the integration to its detection"
+        if self.end is None or self.detected is None:
+            return None
+        return self.detected - self.end
+
+    @property
+    def readout_latency(self):
+        "seconds from the estimated end of the integration to the start of the readout"
+        if self.end is None or self.readout_start is None:
+            return None
+        return self.readout_start - self.end
+
+    def __repr__(self):
+        return "ExposureTiming(exptime=%r, polls=%d, trigger_latency=%r, detection_latency=%r, readout_latency=%r)" \
+               % (self.exptime, self.polls, self.trigger_latency, self.detection_latency,
+                  self.readout_latency)
+
 ###############################################################################
 class USBCamera(USBDevice):
     #load the DLL
     _libfli = FLILibrary.getDll(debug=DEBUG)
     _domain = flidomain_t(FLIDOMAIN_USB | FLIDEVICE_CAMERA)
     
-    def __init__(self, dev_name, model, bitdepth = DEFAULT_BITDEPTH):
+    def __init__(self, dev_name, model, bitdepth = DEFAULT_BITDEPTH,
+                 readout_mode = DEFAULT_READOUT_MODE):
         USBDevice.__init__(self, dev_name = dev_name, model = model)
         self.hbin  = 1
         self.vbin  = 1
         self.bitdepth = bitdepth
+        self.set_readout_mode(readout_mode)
+        self.frame_pool = FramePool()
+        #cached metadata, see 'invalidate_geometry'
+        self._info = None
+        self._visible_area = None
+        self._image_size = None
+        self._image_area = None       #subframe, None for the whole visible area
+        self._subframe = None         #buffer reused by 'take_subframe'
+        self.metadata_calls_saved = 0 #libfli queries answered from the caches
+        self.exptime = None           #milliseconds, as last set by 'set_exposure'
+        self.frametype = None         #as last set by 'set_exposure'
+        self.calibrator = None        #'Calibrator' used by 'fetch_calibrated'
+        #completion polling, see 'wait_for_exposure'
+        self.poll_guard = DEFAULT_POLL_GUARD
+        self.poll_interval = DEFAULT_POLL_INTERVAL
+        self.exposure_timing = None   #'ExposureTiming' of the last exposure
+        self._device_status_supported = None #unknown until first queried
+        #background flushing while idle, see 'set_ready_mode'
+        self.ready_mode = False
+        self._bgflush = False
+        self.nflushes = None          #as last set by 'set_flushes', None if never
 
-    def get_info(self):
+    def get_info(self, refresh = False):
+        """ returns an OrderedDict of the camera's static properties, queried
+            once and then cached until the camera mode changes or 'refresh'
+            is set
+        """
+        if self._info is not None and not refresh:
+            self.metadata_calls_saved += 6
+            return self._info.copy()
         info = OrderedDict()
         tmp1, tmp2, tmp3, tmp4   = (c_long(),c_long(),c_long(),c_long())
         d1, d2                   = (c_double(),c_double())        
@@ -60,8 +159,31 @@ class USBCamera(USBDevice):
         info['array_area'] = (tmp1.value,tmp2.value,tmp3.value,tmp4.value)
         self._libfli.FLIGetVisibleArea(self._dev, byref(tmp1), byref(tmp2), byref(tmp3), byref(tmp4))
         info['visible_area'] = (tmp1.value,tmp2.value,tmp3.value,tmp4.value)        
-        return info
-        
+        self._info = info
+        self._visible_area = info['visible_area']
+        return info.copy()
+
+    def invalidate_geometry(self, visible_area = False):
+        """ drop the cached image size, and if 'visible_area' is set also the
+            cached visible area and info, so they are queried again on next use;
+            a subframe set by 'set_image_area' is then dropped too
+        """
+        self._image_size = None
+        if visible_area:
+            self._visible_area = None
+            self._info = None
+            self._image_area = None
+
+    def get_visible_area(self):
+        "returns the cached (ul_x, ul_y, lr_x, lr_y) of the visible pixels"
+        if self._visible_area is not None:
+            self.metadata_calls_saved += 1
+            return self._visible_area
+        left, top, right, bottom   = (c_long(),c_long(),c_long(),c_long())        
+        self._libfli.FLIGetVisibleArea(self._dev, byref(left), byref(top), byref(right), byref(bottom))    
+        self._visible_area = (left.value, top.value, right.value, bottom.value)
+        return self._visible_area
+
     def get_camera_mode_string(self):
         #("FLIGetCameraModeString", [flidev_t, flimode_t, c_char_p, c_size_t]),
         #(flidev_t dev, flimode_t mode_index, char *mode_string, size_t siz);
@@ -78,32 +200,76 @@ class USBCamera(USBDevice):
         return mode_index
 
     def set_camera_mode(self, mode_index):
+        """ The visible area may change with the mode, so the image area set
+            by 'set_image_area' is clipped to the new one and sent again,
+            or the whole new visible area is read out if nothing is left.
+        """
         #LIBFLIAPI FLIGetCameraMode(flidev_t dev, flimode_t *mode_index);
         index = c_long(mode_index)
+        area = self._image_area
+        self.invalidate_geometry(visible_area = True)
         self._libfli.FLISetCameraMode(self._dev, index)
+        if area is not None:
+            left, top, right, bottom = self.get_visible_area()
+            area = (max(area[0], left), max(area[1], top),
+                    min(area[2], right), min(area[3], bottom))
+            if (area[2] - area[0])/self.hbin < 1 or (area[3] - area[1])/self.vbin < 1:
+                area = None
+        self._apply_image_area(area, self.hbin, self.vbin)
 
     def get_image_size(self):
-        "returns (row_width, img_rows, img_size)"
-        left, top, right, bottom   = (c_long(),c_long(),c_long(),c_long())        
-        self._libfli.FLIGetVisibleArea(self._dev, byref(left), byref(top), byref(right), byref(bottom))    
-        row_width = (right.value - left.value)/self.hbin
-        img_rows  = (bottom.value - top.value)/self.vbin
+        "returns (row_width, img_rows, img_size) of the image area in binned pixels"
+        if self._image_size is not None:
+            self.metadata_calls_saved += 1
+            return self._image_size
+        left, top, right, bottom = self.get_image_area()
+        row_width = (right - left)/self.hbin
+        img_rows  = (bottom - top)/self.vbin
         img_size = img_rows * row_width * sizeof(c_uint16)
-        return (row_width, img_rows, img_size)
+        self._image_size = (row_width, img_rows, img_size)
+        return self._image_size
+
+    def get_image_area(self):
+        """returns the (ul_x, ul_y, lr_x, lr_y) in unbinned pixels of the area
+           read out, the whole visible area unless set by 'set_image_area'
+        """
+        if self._image_area is not None:
+            return self._image_area
+        return self.get_visible_area()
 
     def set_image_area(self, ul_x, ul_y, lr_x, lr_y):
-        #FIXME does this API call actually do anything?
-        left, top, right, bottom   = (c_long(ul_x),c_long(ul_y),c_long(lr_x),c_long(lr_y))
-        row_width = (right.value - left.value)/self.hbin
-        img_rows  = (bottom.value - top.value)/self.vbin
-        self._libfli.FLISetImageArea(self._dev, left, top, c_long(left.value + row_width), c_long(top.value + img_rows))
+        """ Read out only the subframe with upper left corner (ul_x, ul_y) and
+            lower right corner (lr_x, lr_y), excluded, in unbinned pixels of
+            the visible area.  The area is kept when the binning changes,
+            the width and height are truncated to whole binned pixels.
+            Raises ValueError if the area is not inside the visible area.
+        """
+        left, top, right, bottom = self.get_visible_area()
+        if not (left <= ul_x < lr_x <= right and top <= ul_y < lr_y <= bottom):
+            msg = "image area (%d, %d, %d, %d) is not inside the visible area (%d, %d, %d, %d)"
+            raise ValueError(msg % (ul_x, ul_y, lr_x, lr_y, left, top, right, bottom))
+        self._apply_image_area((ul_x, ul_y, lr_x, lr_y), self.hbin, self.vbin)
+
+    def reset_image_area(self):
+        "read out the whole visible area again"
+        self._apply_image_area(None, self.hbin, self.vbin)
+
+    def _apply_image_area(self, area, hbin, vbin):
+        """ the library takes the lower right corner as the upper left corner
+            plus the size of the image in binned pixels
+        """
+        left, top, right, bottom = area if area is not None else self.get_visible_area()
+        row_width = (right - left)/hbin
+        img_rows  = (bottom - top)/vbin
+        if row_width < 1 or img_rows < 1:
+            raise ValueError("the image area is smaller than a binned pixel")
+        self.invalidate_geometry()
+        self._image_area = area
+        self._libfli.FLISetImageArea(self._dev, c_long(left), c_long(top),
+                                     c_long(left + row_width), c_long(top + img_rows))
 
     def set_image_binning(self, hbin = 1, vbin = 1):
-        left, top, right, bottom   = (c_long(),c_long(),c_long(),c_long())        
-        self._libfli.FLIGetVisibleArea(self._dev, byref(left), byref(top), byref(right), byref(bottom))    
-        row_width = (right.value - left.value)/hbin
-        img_rows  = (bottom.value - top.value)/vbin
-        self._libfli.FLISetImageArea(self._dev, left, top, left.value + row_width, top.value + img_rows)
+        self._apply_image_area(self._image_area, hbin, vbin)
         self._libfli.FLISetHBin(self._dev, hbin)
         self._libfli.FLISetVBin(self._dev, vbin)
         self.hbin = hbin
@@ -112,34 +278,99 @@ class USBCamera(USBDevice):
     def set_flushes(self, num):
         """set the number of flushes to the CCD before taking exposure
            
-           must have 0 <= num <= 16, else raises ValueError
+           must have 0 <= num <= 16, else raises ValueError; in ready mode
+           the count only takes effect once it is left
         """
         if not(0 <= num <= 16):
             raise ValueError("must have 0 <= num <= 16")
-        self._libfli.FLISetNFlushes(self._dev, c_long(num))
+        if not self.ready_mode:
+            self._libfli.FLISetNFlushes(self._dev, c_long(num))
+        self.nflushes = num
+
+    def set_ready_mode(self, enable = True):
+        """ In ready mode the CCD is flushed in the background while the
+            camera is idle: from now until an exposure is started, and again
+            as soon as the frame has been read out or the exposure has been
+            cancelled.  'FLIExposeFrame' stops the background flushing
+            itself, so the shutter opens on a clean sensor.  The flushes
+            before an exposure are turned off meanwhile, and the count of
+            'set_flushes' (or DEFAULT_NFLUSHES) is restored when ready mode
+            is left.  See 'arm' for applying the next exposure's settings
+            ahead of time.
+        """
+        if enable and not self.ready_mode:
+            self._libfli.FLISetNFlushes(self._dev, c_long(0))
+        elif not enable and self.ready_mode:
+            if self._bgflush:
+                self._libfli.FLIControlBackgroundFlush(self._dev, flibgflush_t(FLI_BGFLUSH_STOP))
+                self._bgflush = False
+            nflushes = self.nflushes if self.nflushes is not None else DEFAULT_NFLUSHES
+            self._libfli.FLISetNFlushes(self._dev, c_long(nflushes))
+        self.ready_mode = enable
+        if enable:
+            self._start_flushing()
+
+    def _start_flushing(self):
+        """ in ready mode, start background flushing unless it runs already;
+            '_bgflush' follows its state, which only 'FLIExposeFrame' and
+            FLI_BGFLUSH_STOP change, so no USB call is made when it runs
+        """
+        if self.ready_mode and not self._bgflush:
+            self._libfli.FLIControlBackgroundFlush(self._dev, flibgflush_t(FLI_BGFLUSH_START))
+            self._bgflush = True
+
+    def arm(self, exptime = None, frametype = None, binning = None):
+        """ Prepare the next exposure: apply its 'exptime', 'frametype' (see
+            'set_exposure') and 'binning' (hbin, vbin), only where they
+            differ from the current settings, and in ready mode start the
+            background flushing if it is not running, so that
+            'start_exposure' is a single libfli call; an armed camera which
+            is already flushing costs no USB call.
+        """
+        if exptime is None:
+            exptime = self.exptime
+        if frametype is None:
+            frametype = self.frametype or "normal"
+        if exptime is not None and (exptime, frametype) != (self.exptime, self.frametype):
+            self.set_exposure(exptime, frametype = frametype)
+        if binning is not None and tuple(binning) != (self.hbin, self.vbin):
+            self.set_image_binning(*binning)
+        self._start_flushing()
 
     def set_temperature(self, T):
         "set the camera's temperature target in degrees Celcius"
         self._libfli.FLISetTemperature(self._dev, c_double(T))
                 
+    def start_cooling(self, target, **kwargs):
+        """ Cool the CCD to 'target' degrees Celcius on a background thread,
+            ramping the setpoint; returns the started 'CoolingController',
+            whose 'future' resolves once the temperature is stable.  See
+            'CoolingController' for the keyword arguments.
+        """
+        return CoolingController(self, target, **kwargs).start()
+
+    @coalesced
     def get_temperature(self):
         "gets the camera's temperature in degrees Celcius"
         T = c_double()         
         self._libfli.FLIGetTemperature(self._dev, byref(T))
         return T.value
         
+    @coalesced
     def read_CCD_temperature(self):
         "gets the CCD's temperature in degrees Celcius"
         T = c_double()         
         self._libfli.FLIReadTemperature(self._dev, FLI_TEMPERATURE_CCD, byref(T))
         return T.value
         
+    @coalesced
     def read_base_temperature(self):
         "gets the cooler's hot side in degrees Celcius"
         T = c_double()         
         self._libfli.FLIReadTemperature(self._dev, FLI_TEMPERATURE_BASE, byref(T))
         return T.value
         
+    @coalesced
     def get_cooler_power(self):
         "gets the cooler's power in watts (undocumented API function)"
         P = c_double()         
@@ -153,7 +384,7 @@ class USBCamera(USBDevice):
                             'dark'       - exposure with shutter closed
                             'rbi_flush'  - flood CCD with internal light, with shutter closed
         """
-        exptime = c_long(exptime)        
+        frametype_name = frametype
         if frametype == "normal":
             frametype = fliframe_t(FLI_FRAME_TYPE_NORMAL)
         elif frametype == "dark":
@@ -164,16 +395,21 @@ class USBCamera(USBDevice):
             frametype = fliframe_t(FLI_FRAME_TYPE_RBI_FLUSH)
         else:
             raise ValueError("'frametype' must be either 'normal','dark' or 'rbi_flush'")
-        self._libfli.FLISetExposureTime(self._dev, exptime)
+        self._libfli.FLISetExposureTime(self._dev, c_long(exptime))
         self._libfli.FLISetFrameType(self._dev, frametype)
+        self.exptime = exptime
+        self.frametype = frametype_name
 
     def set_bitdepth(self, bitdepth):
-        #FIXME untested
+        """set the bit depth, if the library refuses the change a FLIWarning
+           is issued and the current bit depth is kept, since the readout
+           buffers must match what the camera actually sends
+        """
         bitdepth_var = flibitdepth_t()
         if bitdepth == '8bit':
-            bitdepth_var.value = FLI_MODE_8BIT
+            bitdepth_var.value = FLI_MODE_8BIT.value
         elif bitdepth == '16bit':
-            bitdepth_var.value = FLI_MODE_16BIT
+            bitdepth_var.value = FLI_MODE_16BIT.value
         else:
             raise ValueError("'bitdepth' must be either '8bit' or '16bit'")
         try:
@@ -181,62 +417,457 @@ class USBCamera(USBDevice):
         except FLIError:
             msg = "API currently does not allow changing bitdepth for this USB camera."
             warnings.warn(FLIWarning(msg))
+            return
         self.bitdepth = bitdepth
+        self.invalidate_geometry()
+
+    def set_readout_mode(self, mode):
+        """select how 'fetch_image' transfers the image data:
+               'auto'  - grab the whole frame with 'FLIGrabFrame', falling
+                         back to row by row readout if the library or
+                         device does not support bulk grabs
+               'frame' - grab the whole frame with 'FLIGrabFrame' only,
+                         raises FLIError if not supported
+               'row'   - grab the frame row by row with 'FLIGrabRow'
+        """
+        if not mode in READOUT_MODES:
+            raise ValueError("'mode' must be either 'auto', 'frame' or 'row'")
+        self.readout_mode = mode
+        self._grab_frame_supported = None #unknown until the first bulk grab
 
-    def take_photo(self):
+    def take_photo(self, out = None, calibrate = False):
         """ Expose the frame, wait for completion, and fetch the image data.
+            See 'fetch_image' for the 'out' argument, or 'fetch_calibrated'
+            if 'calibrate' is set.
         """
         self.start_exposure()
-        #wait for completion
-        while True:
-            timeleft = self.get_exposure_timeleft()
-            if timeleft == 0:
-                break
-            time.sleep(timeleft/1000.0) #sleep for milliseconds
+        self.wait_for_exposure()
         #grab the image
-        return self.fetch_image()
+        if calibrate:
+            return self.fetch_calibrated(out = out)
+        return self.fetch_image(out = out)
        
+    def take_subframe(self):
+        """ 'take_photo' into a single buffer which is kept by the camera and
+            reused on every call, so a guiding loop over a small area set
+            with 'set_image_area' does not allocate anything per frame.  The
+            returned array is overwritten by the next call; it is replaced
+            only when the image size or bit depth changes.
+        """
+        row_width, img_rows, img_size = self.get_image_size()
+        img = self._subframe
+        if img is None or img.shape != (img_rows, row_width) \
+           or img.dtype != self.get_image_dtype():
+            img = self._subframe = numpy.empty((img_rows, row_width), dtype = self.get_image_dtype())
+        return self.take_photo(out = img)
+
+    def acquire_sequence(self, n, 
+                         queue_size = DEFAULT_QUEUE_SIZE,
+                         drop_frames = False,
+                         late_threshold = DEFAULT_LATE_THRESHOLD,
+                        ):
+        """ Acquire 'n' frames back to back with the current exposure
+            settings on a background thread, returns a 'FrameSequence' which
+            yields the frames as they are read out:
+
+                with cam.acquire_sequence(10) as seq:
+                    for img in seq:
+                        process(img)
+                        cam.release_frame(img)
+                print seq.get_stats()
+
+            See 'FrameSequence' for the queueing and statistics options.
+        """
+        return FrameSequence(self, n,
+                             queue_size = queue_size,
+                             drop_frames = drop_frames,
+                             late_threshold = late_threshold,
+                            )
+
+    def start_video_mode(self):
+        """ Put the camera in video mode, frames are then fetched with
+            'grab_video_frame' until 'stop_video_mode' is called.
+        """
+        self._libfli.FLIStartVideoMode(self._dev)
+
+    def stop_video_mode(self):
+        self._libfli.FLIStopVideoMode(self._dev)
+
+    def grab_video_frame(self, out = None):
+        """ Grab the next frame in video mode, see 'fetch_image' for the 'out'
+            argument, which must be C-contiguous here.
+        """
+        row_width, img_rows, img_size = self.get_image_size()
+        img_array_dtype = self.get_image_dtype()
+        if out is None:
+            img_array = self.frame_pool.checkout((img_rows, row_width), img_array_dtype)
+        else:
+            self._check_out_array(out, (img_rows, row_width), img_array_dtype)
+            if not out.flags.c_contiguous:
+                raise ValueError("'out' must be C-contiguous for video frames")
+            img_array = out
+        self._libfli.FLIGrabVideoFrame(self._dev, img_array.ctypes.data, c_size_t(img_array.nbytes))
+        return img_array
+
+    def video_stream(self, nbuffers = DEFAULT_VIDEO_BUFFERS, max_frames = None):
+        """ Returns a 'VideoStream' context manager which runs the camera in
+            video mode and yields frames into 'nbuffers' recycled buffers:
+
+                with cam.video_stream() as stream:
+                    for img in stream:
+                        process(img)
+                print stream.get_stats()
+        """
+        return VideoStream(self, nbuffers = nbuffers, max_frames = max_frames)
+
     def start_exposure(self):
         """ Begin the exposure and return immediately.
-            Use the method  'get_timeleft' to check the exposure progress 
-            until it returns 0, then use method 'fetch_image' to fetch the image
-            data as a numpy array.
+            Use the method 'wait_for_exposure', or 'get_exposure_timeleft'
+            until it returns 0, to wait for the exposure to complete, then
+            use method 'fetch_image' to fetch the image data as a numpy array.
         """
+        t_trigger = time.time()
         self._libfli.FLIExposeFrame(self._dev)
+        self._bgflush = False #stopped by the library
+        self.exposure_timing = ExposureTiming(time.time(), self.exptime, trigger = t_trigger)
         
+    def cancel_exposure(self):
+        """ Cancel the exposure in progress, if any.
+        """
+        self._libfli.FLICancelExposure(self._dev)
+        self._start_flushing()
+
     def get_exposure_timeleft(self):
         """ Returns the time left on the exposure in milliseconds.
         """
         timeleft = c_long()
         self._libfli.FLIGetExposureStatus(self._dev,byref(timeleft))
         return timeleft.value
-    
-    def fetch_image(self):
-        """ Fetch the image data for the last exposure.
-            Returns a numpy.ndarray object.
+
+    def get_device_status(self):
+        """ Returns the FLI_CAMERA_STATUS_* state and FLI_CAMERA_DATA_READY
+            bits, or FLI_CAMERA_STATUS_UNKNOWN if the camera does not
+            report them.
         """
-        row_width, img_rows, img_size  = self.get_image_size()
-        #use bit depth to determine array data type
-        img_array_dtype = None
-        img_ptr_ctype   = None
+        status = c_long()
+        self._libfli.FLIGetDeviceStatus(self._dev, byref(status))
+        return status.value & 0xffffffff
+
+    def is_exposure_complete(self):
+        """ True once the integration has ended and the data can be read.
+            The camera status is used when it is reported, else the time
+            left, which is rounded to milliseconds.
+        """
+        if self._device_status_supported is not False:
+            try:
+                status = self.get_device_status()
+            except FLIError:
+                status = FLI_CAMERA_STATUS_UNKNOWN
+            if status == FLI_CAMERA_STATUS_UNKNOWN:
+                self._device_status_supported = False
+            else:
+                self._device_status_supported = True
+                if status & FLI_CAMERA_DATA_READY:
+                    return True
+                state = status & FLI_CAMERA_STATUS_MASK
+                if state == FLI_CAMERA_STATUS_READING_CCD:
+                    return True
+                if state != FLI_CAMERA_STATUS_IDLE:
+                    return False #exposing or waiting for a trigger
+                #idle: either not started yet or already read out
+        return self.get_exposure_timeleft() == 0
+
+    def wait_for_exposure(self, guard = None, interval = None):
+        """ Block until the current exposure is complete, returns its
+            'ExposureTiming', also kept as 'exposure_timing'.
+
+            The thread sleeps until 'guard' seconds before the end reported
+            by 'get_exposure_timeleft', then polls 'is_exposure_complete'
+            every 'interval' seconds; they default to the 'poll_guard' and
+            'poll_interval' attributes.  A shorter interval detects the end
+            sooner at the cost of more USB queries and CPU wakeups, the
+            guard only needs to cover the timing jitter of the camera.
+            Returns at once if the exposure has already been waited for.
+        """
+        if guard is None:
+            guard = self.poll_guard
+        if interval is None:
+            interval = self.poll_interval
+        timing = self.exposure_timing
+        if timing is None:
+            timing = self.exposure_timing = ExposureTiming(None, self.exptime)
+        elif timing.detected is not None:
+            return timing #already waited for
+        #time the exposure was last known to be running
+        t_running = timing.start if timing.start is not None else time.time()
+        #coarse phase: sleep through most of the integration
+        while True:
+            timeleft = self.get_exposure_timeleft()/1000.0
+            timing.polls += 1
+            if timeleft <= guard:
+                break
+            t_running = time.time()
+            time.sleep(timeleft - guard)
+        #fine phase
+        while True:
+            complete = self.is_exposure_complete()
+            now = time.time()
+            timing.polls += 1
+            if complete:
+                break
+            t_running = now
+            time.sleep(interval)
+        timing.detected = now
+        timing.end = 0.5*(t_running + now)
+        return timing
+    
+    def get_image_dtype(self):
+        "returns the numpy dtype of the image data for the current bit depth"
         if self.bitdepth == '8bit':
-            img_array_dtype = numpy.uint8
-            img_ptr_ctype = c_uint8
+            return numpy.dtype(numpy.uint8)
         elif self.bitdepth == '16bit':
-            img_array_dtype = numpy.uint16
-            img_ptr_ctype = c_uint16
+            return numpy.dtype(numpy.uint16)
         else:
             raise FLIError("'bitdepth' must be either '8bit' or '16bit'")
-        #allocate numpy array to store image
-        img_array = numpy.zeros((img_rows, row_width), dtype=img_array_dtype)
-        #get pointer to array's data space
-        img_ptr   = img_array.ctypes.data_as(POINTER(img_ptr_ctype))
-        #grab image buff row by row
-        for row in range(img_rows):
-            offset = row*row_width*sizeof(img_ptr_ctype)
-            self._libfli.FLIGrabRow(self._dev, byref(img_ptr.contents,offset), row_width)
+
+    def checkout_frame(self):
+        """ Returns an uninitialized frame buffer for the current geometry and
+            bit depth from the camera's 'frame_pool', suitable as the 'out'
+            argument of 'fetch_image'.  Hand it back with 'release_frame'.
+        """
+        row_width, img_rows, img_size = self.get_image_size()
+        return self.frame_pool.checkout((img_rows, row_width), self.get_image_dtype())
+
+    def release_frame(self, img_array):
+        """ Return a frame obtained from 'checkout_frame' or 'fetch_image' to
+            the camera's 'frame_pool' for reuse.
+        """
+        self.frame_pool.release(img_array)
+
+    def fetch_image(self, out = None, row_callback = None, block_rows = None):
+        """ Fetch the image data for the last exposure.
+            Returns a numpy.ndarray object.
+
+            If 'out' is given, the data is read directly into it and it is
+            returned; it must have the frame's shape and dtype and its rows
+            must be contiguous, else raises ValueError.  Otherwise a buffer
+            is checked out from the camera's 'frame_pool'.
+
+            If 'row_callback' is given, it is called as
+            'row_callback(row_start, block)' for each block of rows as soon
+            as it has been read, see 'iter_rows'.
+        """
+        img_array = self._get_target(out)
+        if row_callback is None:
+            self._readout(img_array)
+        else:
+            for row_start, block in self._iter_blocks(img_array, block_rows):
+                row_callback(row_start, block)
+        self._start_flushing()
         return img_array
 
+    def fetch_calibrated(self, out = None):
+        """ Fetch the image data for the last exposure and calibrate it with
+            the masters of the camera's 'calibrator' for the current binning,
+            sliced to the current image area, using the exposure time of the last
+            'set_exposure'.  Returns a float32 numpy.ndarray.
+
+            The calibration is applied to each block of rows as soon as it
+            has been read, overlapping the rest of the readout.  If 'out' is
+            given the result is written into it, otherwise a buffer is
+            checked out from the camera's 'frame_pool'.
+        """
+        if self.calibrator is None:
+            raise ValueError("no 'calibrator' is attached to the camera")
+        if self.exptime is None:
+            raise ValueError("the exposure time is unknown, use 'set_exposure' first")
+        row_width, img_rows, img_size = self.get_image_size()
+        shape = (img_rows, row_width)
+        masters, row_offset, col_offset = self.calibrator.locate((self.hbin, self.vbin),
+                                                                 self.get_image_area(), shape)
+        if out is None:
+            out = self.frame_pool.checkout(shape, CALIBRATED_DTYPE)
+        else:
+            self._check_out_array(out, shape, CALIBRATED_DTYPE)
+        exptime = self.exptime
+        def calibrate(row_start, block):
+            masters.apply(block, out[row_start:row_start + block.shape[0]], exptime,
+                          row_start = row_offset + row_start, col_start = col_offset)
+        raw = self.fetch_image(row_callback = calibrate)
+        self.release_frame(raw)
+        return out
+
+    def iter_rows(self, out = None, block_rows = None):
+        """ Fetch the image data for the last exposure, yielding
+            (row_start, block) for consecutive blocks of 'block_rows' rows
+            (by default about DEFAULT_BLOCK_BYTES each) as they arrive.
+
+            The transfer runs on a helper thread and carries on with the
+            next block while the consumer works on the current one, so
+            processing overlaps the readout.  The blocks are views into the
+            frame buffer: 'out', which is complete once the iteration ends,
+            or else a buffer checked out from the 'frame_pool' which is
+            released when the generator finishes or is closed, so its blocks
+            are only valid during the iteration.  If the consumer stops
+            early the remaining rows are still read out before the generator
+            is closed.
+        """
+        #checked out on the first 'next' only, the 'finally' clauses of a
+        #generator closed before it do not run so it would never be released
+        img_array = self._get_target(out)
+        blocks = self._iter_blocks(img_array, block_rows, release = out is None)
+        try:
+            for item in blocks:
+                yield item
+        finally:
+            blocks.close()
+
+    def _get_target(self, out):
+        "returns 'out' checked against the frame geometry, or a pool buffer"
+        row_width, img_rows, img_size  = self.get_image_size()
+        #use bit depth to determine array data type
+        img_array_dtype = self.get_image_dtype()
+        if out is None:
+            return self.frame_pool.checkout((img_rows, row_width), img_array_dtype)
+        self._check_out_array(out, (img_rows, row_width), img_array_dtype)
+        return out
+
+    def _iter_blocks(self, img_array, block_rows, release = False):
+        "see 'iter_rows', 'release' hands 'img_array' back to the pool at the end"
+        img_rows = img_array.shape[0]
+        if block_rows is None:
+            block_rows = max(1, DEFAULT_BLOCK_BYTES // img_array.strides[0])
+        elif block_rows < 1:
+            if release:
+                self.release_frame(img_array)
+            raise ValueError("'block_rows' must be >= 1")
+        blocks = queue.Queue()
+        def transfer():
+            try:
+                with self.scheduler.hold(PRIORITY_READOUT):
+                    for row_start in xrange(0, img_rows, block_rows):
+                        row_stop = min(row_start + block_rows, img_rows)
+                        self._readout(img_array[row_start:row_stop])
+                        blocks.put((row_start, row_stop))
+                blocks.put(None)
+            except Exception:
+                blocks.put(sys.exc_info())
+        thread = threading.Thread(target = transfer)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                item = blocks.get()
+                if item is None:
+                    break
+                if len(item) == 3:
+                    exc_type, exc_value, tb = item
+                    raise exc_type, exc_value, tb
+                row_start, row_stop = item
+                yield row_start, img_array[row_start:row_stop]
+        finally:
+            thread.join()
+            if release:
+                self.release_frame(img_array)
+            self._start_flushing()
+
+    def fetch_image_to_fits(self, filename, cards = (), chunk_bytes = DEFAULT_CHUNK_BYTES):
+        """ Fetch the image data for the last exposure straight into a new
+            FITS file 'filename', returns the 'FITSImageFile'.
+
+            The file is preallocated and its data section is mapped and
+            filled 'chunk_bytes' at a time, each chunk being converted to
+            the FITS byte order in place and flushed before the next one is
+            read out, so the memory used does not grow with the sensor size.
+            'cards' are extra (key, value[, comment]) header cards.
+        """
+        row_width, img_rows, img_size = self.get_image_size()
+        cards = [('INSTRUME', self.model),
+                 ('XBINNING', self.hbin),
+                 ('YBINNING', self.vbin),
+                ] + list(cards)
+        fits = FITSImageFile(filename, (img_rows, row_width), self.get_image_dtype(),
+                             cards = cards)
+        with self.scheduler.hold(PRIORITY_READOUT):
+            for window in fits.iter_windows(chunk_bytes = chunk_bytes):
+                #each window is a C-contiguous block of the next rows to be read
+                self._readout(window)
+                fits.encode_window(window)
+                del window  #unmap it before the next one is touched
+        self._start_flushing()
+        return fits
+
+    @staticmethod
+    def _check_out_array(out, shape, dtype):
+        if not isinstance(out, numpy.ndarray):
+            raise ValueError("'out' must be a numpy.ndarray")
+        if out.shape != shape:
+            raise ValueError("'out' has shape %r, expected %r" % (out.shape, shape))
+        if out.dtype != dtype:
+            raise ValueError("'out' has dtype %s, expected %s" % (out.dtype, dtype))
+        if out.strides[1] != out.itemsize:
+            raise ValueError("'out' must have contiguous rows")
+        if not out.flags.writeable:
+            raise ValueError("'out' must be writeable")
+
+    def _readout(self, img_array):
+        """ transfer the image data into the 2D array 'img_array' according
+            to the 'readout_mode' setting, arrays whose rows are not packed
+            back to back are always read row by row
+        """
+        img_rows = img_array.shape[0]
+        row_start = 0
+        timing = self.exposure_timing
+        if timing is not None and timing.readout_start is None:
+            timing.readout_start = time.time()
+        with self.scheduler.hold(PRIORITY_READOUT):
+            if self.readout_mode != 'row' and self._grab_frame_supported is not False \
+               and img_array.flags.c_contiguous:
+                row_start = self._grab_frame(img_array)
+            if row_start < img_rows:
+                self._grab_rows(img_array, row_start, img_rows)
+
+    def _grab_frame(self, img_array):
+        """ grab as much of the frame as possible in a single 'FLIGrabFrame'
+            call, returns the number of complete rows transferred
+        """
+        row_bytes = img_array.strides[0]
+        bytesgrabbed = c_size_t(0)
+        try:
+            self._libfli.FLIGrabFrame(self._dev, img_array.ctypes.data, 
+                                      c_size_t(img_array.nbytes), 
+                                      byref(bytesgrabbed))
+        except (FLIError, AttributeError):
+            #bulk grabs are not supported by the library or device, unless
+            #data was already consumed we can still read the frame by rows
+            if self.readout_mode == 'frame' or bytesgrabbed.value > 0:
+                raise
+            self._grab_frame_supported = False
+            return 0
+        self._grab_frame_supported = True
+        if bytesgrabbed.value % row_bytes != 0:
+            msg = "'FLIGrabFrame' stopped in the middle of a row after %d bytes" % bytesgrabbed.value
+            raise FLIError(msg)
+        rows_grabbed = bytesgrabbed.value // row_bytes
+        if rows_grabbed < img_array.shape[0] and self.readout_mode == 'frame':
+            msg = "'FLIGrabFrame' returned %d of %d bytes" % (bytesgrabbed.value, img_array.nbytes)
+            raise FLIError(msg)
+        return rows_grabbed
+
+    def _grab_rows(self, img_array, row_start, row_stop):
+        """ grab rows 'row_start' up to 'row_stop' of the frame one by one
+        """
+        #hoist the attribute lookups and pointer arithmetic out of the loop,
+        #plain addresses are accepted by the 'c_void_p' argument; '_readout'
+        #holds the scheduler so the library function is called directly
+        grab_row  = getattr(self._libfli, 'unscheduled', self._libfli).FLIGrabRow
+        dev       = self._dev
+        row_width = img_array.shape[1]
+        row_bytes = img_array.strides[0]
+        addr      = img_array.ctypes.data
+        for row in xrange(row_start, row_stop):
+            grab_row(dev, addr + row*row_bytes, row_width)
+
 ###############################################################################
 #  TEST CODE
 ###############################################################################
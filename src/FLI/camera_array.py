@@ -0,0 +1,117 @@
+"""
+ FLI.camera_array.py
+
+ Synchronized acquisition across several FLI USB cameras
+"""
+
+__date__ = '2026-10-17'
+
+import sys, time, threading
+
+###############################################################################
+class FrameSet(object):
+    """ frames taken together by a 'CameraArray', with per camera timestamps
+        (from time.time()) in the same order as the array's cameras:
+            frames          - numpy.ndarray per camera
+            start_times     - when each exposure was started
+            exposed_times   - when each exposure was found complete
+            readout_times   - when each readout finished
+    """
+    def __init__(self, frames, start_times, exposed_times, readout_times):
+        self.frames = frames
+        self.start_times = start_times
+        self.exposed_times = exposed_times
+        self.readout_times = readout_times
+
+    @property
+    def skew(self):
+        "spread in seconds between the earliest and latest exposure start"
+        return max(self.start_times) - min(self.start_times)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+###############################################################################
+class CameraArray(object):
+    """ Drives a list of 'USBCamera' objects together.  Each camera is handled
+        by its own worker thread; the workers are released at once to start
+        their exposures so the start skew between devices is kept small, and
+        the cameras are read out in parallel since ctypes releases the GIL
+        during the libfli calls.
+    """
+    def __init__(self, cameras):
+        self.cameras = list(cameras)
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __iter__(self):
+        return iter(self.cameras)
+
+    def __getitem__(self, index):
+        return self.cameras[index]
+
+    def set_exposure(self, exptime, frametype = "normal"):
+        "setup the same exposure on every camera, see 'USBCamera.set_exposure'"
+        for cam in self.cameras:
+            cam.set_exposure(exptime, frametype = frametype)
+
+    def set_image_binning(self, hbin = 1, vbin = 1):
+        for cam in self.cameras:
+            cam.set_image_binning(hbin, vbin)
+
+    def take_photos(self, out = None):
+        """ Expose all cameras simultaneously, wait for completion and read
+            them out in parallel.  Returns a 'FrameSet'.
+
+            'out' may be a sequence of arrays, one per camera, as accepted by
+            'USBCamera.fetch_image'.
+
+            If any camera fails, the first error is raised after all workers
+            have finished.
+        """
+        ncams = len(self.cameras)
+        if out is None:
+            out = [None]*ncams
+        elif len(out) != ncams:
+            raise ValueError("'out' must have one array per camera")
+        results = [None]*ncams
+        errors  = []
+        ready   = threading.Semaphore(0)
+        go      = threading.Event()
+        def work(index, cam):
+            try:
+                ready.release()
+                go.wait()
+                t_start = time.time()
+                cam.start_exposure()
+                cam.wait_for_exposure()
+                t_exposed = time.time()
+                img = cam.fetch_image(out = out[index])
+                results[index] = (img, t_start, t_exposed, time.time())
+            except Exception:
+                errors.append(sys.exc_info())
+        threads = []
+        for index, cam in enumerate(self.cameras):
+            thread = threading.Thread(target = work, args = (index, cam))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        #release all the workers together once they are waiting
+        for thread in threads:
+            ready.acquire()
+        go.set()
+        for thread in threads:
+            thread.join()
+        if errors:
+            exc_type, exc_value, tb = errors[0]
+            raise exc_type, exc_value, tb
+        frames, start_times, exposed_times, readout_times = zip(*results)
+        return FrameSet(list(frames), list(start_times),
+                        list(exposed_times), list(readout_times))
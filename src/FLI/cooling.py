@@ -0,0 +1,173 @@
+"""
+ FLI.cooling.py
+
+ Non-blocking CCD cooling with setpoint ramp and stability detection
+
+     cooler = cam.start_cooling(-20.0)
+     home_focuser_and_load_calibrations()     #meanwhile
+     cooler.future.result(timeout = 1800)     #blocks only if not ready yet
+"""
+
+__date__ = '2026-10-17'
+
+import time, threading, collections
+
+from concurrent.futures import Future
+
+from lib import FLIError
+###############################################################################
+DEFAULT_RAMP_RATE = 5.0     #degrees C per minute
+DEFAULT_TOLERANCE = 0.5     #degrees C
+DEFAULT_WINDOW    = 60.0    #seconds
+DEFAULT_INTERVAL  = 1.0     #seconds
+DEFAULT_MAX_DRIFT = 0.2     #degrees C per minute
+SETPOINT_STEP     = 0.05    #degrees C, smallest setpoint change sent
+###############################################################################
+class CoolingController(object):
+    """ Brings a 'USBCamera' to the temperature 'target' on a background
+        thread.
+
+        The setpoint is moved from the current CCD temperature towards
+        'target' by at most 'ramp_rate' degrees per minute, to limit the
+        thermal stress on the sensor.  Once the setpoint has reached the
+        target, the camera is declared stable when, over the last 'window'
+        seconds, every CCD temperature sample was within 'tolerance' of the
+        target and the least squares drift is below 'max_drift' degrees per
+        minute.  The CCD temperature and cooler power are sampled every
+        'interval' seconds and kept in 'history' as (time, temperature,
+        power, setpoint) tuples covering the window.
+
+        'future' is a concurrent.futures.Future which resolves to the
+        stable temperature, or fails with FLIError if stability is not
+        reached within 'timeout' seconds (None waits forever).  Cancelling
+        it, or calling 'stop', ends the control loop; the setpoint is left
+        where it is.  The loop keeps running after stability, holding the
+        setpoint, until stopped; 'is_stable' tells if the last window still
+        meets the criterion.
+    """
+    def __init__(self, camera, target,
+                 ramp_rate = DEFAULT_RAMP_RATE,
+                 tolerance = DEFAULT_TOLERANCE,
+                 window = DEFAULT_WINDOW,
+                 max_drift = DEFAULT_MAX_DRIFT,
+                 interval = DEFAULT_INTERVAL,
+                 timeout = None,
+                ):
+        if ramp_rate <= 0:
+            raise ValueError("'ramp_rate' must be positive")
+        self.camera = camera
+        self.target = target
+        self.ramp_rate = ramp_rate
+        self.tolerance = tolerance
+        self.window = window
+        self.max_drift = max_drift
+        self.interval = interval
+        self.timeout = timeout
+        self.setpoint = None
+        self.history = collections.deque()
+        self._stop_event = threading.Event()
+        self.future = Future()
+        self.future.add_done_callback(self._on_done)
+        self._t_setpoint = None
+        self._thread = None
+        self._t_start = None
+        self._t_ramped = None   #when the setpoint reached the target
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target = self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def _on_done(self, future):
+        if future.cancelled():
+            self._stop_event.set()
+
+    def stop(self):
+        "end the control loop, an unresolved 'future' is cancelled"
+        self._stop_event.set()
+        self.future.cancel()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def wait(self, timeout = None):
+        "block until stable, returns the temperature; see 'future'"
+        return self.future.result(timeout = timeout)
+
+    def _ramp(self, now, temperature):
+        "move the setpoint towards the target, returns True once it is there"
+        if self.setpoint is None:
+            self.setpoint = temperature
+            self._t_setpoint = now
+        if self.setpoint == self.target:
+            return True
+        max_step = self.ramp_rate*(now - self._t_setpoint)/60.0
+        delta = self.target - self.setpoint
+        if abs(delta) <= max_step:
+            setpoint = self.target
+        elif max_step < SETPOINT_STEP:
+            return False #let the step build up
+        else:
+            setpoint = self.setpoint + (max_step if delta > 0 else -max_step)
+        self.camera.set_temperature(setpoint)
+        self.setpoint = setpoint
+        self._t_setpoint = now
+        return setpoint == self.target
+
+    def drift(self):
+        "least squares slope of the CCD temperature over the history, degrees C per minute"
+        history = list(self.history) #a snapshot, the loop keeps appending
+        if len(history) < 2:
+            return 0.0
+        times = [h[0] for h in history]
+        temps = [h[1] for h in history]
+        n = float(len(times))
+        t_mean = sum(times)/n
+        T_mean = sum(temps)/n
+        var = sum((t - t_mean)**2 for t in times)
+        if var == 0:
+            return 0.0
+        cov = sum((t - t_mean)*(T - T_mean) for t, T in zip(times, temps))
+        return 60.0*cov/var
+
+    def is_stable(self):
+        "True if the current window of samples meets the stability criterion"
+        history = list(self.history)
+        if self._t_ramped is None or not history:
+            return False
+        t_first = history[0][0]
+        t_last = history[-1][0]
+        #the window must be covered by samples taken after the ramp ended
+        if t_first < self._t_ramped or t_last - t_first < self.window - self.interval:
+            return False
+        for t, temperature, power, setpoint in history:
+            if abs(temperature - self.target) > self.tolerance:
+                return False
+        return abs(self.drift()) <= self.max_drift
+
+    def _run(self):
+        cam = self.camera
+        self._t_start = time.time()
+        try:
+            while not self._stop_event.is_set():
+                now = time.time()
+                temperature = cam.read_CCD_temperature()
+                power = cam.get_cooler_power()
+                if self._ramp(now, temperature) and self._t_ramped is None:
+                    self._t_ramped = now
+                self.history.append((now, temperature, power, self.setpoint))
+                while self.history and self.history[0][0] < now - self.window:
+                    self.history.popleft()
+                if not self.future.done():
+                    if self.is_stable():
+                        self.future.set_result(temperature)
+                    elif self.timeout is not None and now - self._t_start > self.timeout:
+                        msg = "CCD temperature %.2f C (cooler power %.1f) not stable at %.2f C after %.0f s" \
+                              % (temperature, power, self.target, self.timeout)
+                        self.future.set_exception(FLIError(msg))
+                self._stop_event.wait(self.interval)
+        except Exception, exc:
+            if not self.future.done():
+                self.future.set_exception(exc)
+            self._stop_event.set()
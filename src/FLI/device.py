@@ -10,7 +10,7 @@
 __author__ = 'Craig Wm. Versek'
 __date__   = '2012-08-16'
 
-import sys, time
+import os, sys, time, json, threading
 
 import ctypes
 from ctypes import pointer, POINTER, byref, c_char, c_char_p, c_long, c_ubyte,\
@@ -18,19 +18,127 @@ from ctypes import pointer, POINTER, byref, c_char, c_char_p, c_long, c_ubyte,\
 
 from lib import FLILibrary, FLIError, FLIWarning, flidomain_t, flidev_t,\
                 FLIDOMAIN_USB
+from scheduler import CommandScheduler, ScheduledLibrary
 ###############################################################################
 DEBUG = False
 BUFFER_SIZE = 64
+INDEX_ENV_VAR = "FLI_DEVICE_INDEX"
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".fli_device_index.json")
+###############################################################################
+class DeviceDescriptor(object):
+    """ A device found by 'USBDevice.list_devices' which is not opened until
+        it is first used: 'open' returns the device object, created on the
+        first call, and any other attribute is looked up on that object.
+    """
+    def __init__(self, device_class, dev_name, model):
+        self.device_class = device_class
+        self.dev_name = dev_name
+        self.model = model
+        self._device = None
+
+    def __repr__(self):
+        return "<%s %s '%s' %s>" % (self.__class__.__name__, self.device_class.__name__,
+                                    self.model, self.dev_name)
+
+    @property
+    def is_open(self):
+        return self._device is not None
+
+    def open(self):
+        "returns the opened device object"
+        if self._device is None:
+            self._device = self.device_class(dev_name = self.dev_name, model = self.model)
+        return self._device
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.open(), name)
+
+###############################################################################
+class DeviceIndex(object):
+    """ serial number -> (device class, dev_name, model) index persisted as
+        JSON in 'path', by default the file named by the environment variable
+        FLI_DEVICE_INDEX or else '~/.fli_device_index.json'.  The entries are
+        only hints, device names may change whenever devices are plugged in,
+        so a device opened through the index must be revalidated.
+    """
+    def __init__(self, path = None):
+        if path is None:
+            path = os.environ.get(INDEX_ENV_VAR, DEFAULT_INDEX_PATH)
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (IOError, ValueError): #missing or corrupt, start over
+                self._entries = {}
+        return self._entries
+
+    def get(self, device_class, serial_number):
+        "returns the (dev_name, model) last seen for 'serial_number' or None"
+        with self._lock:
+            entry = self._load().get(serial_number)
+        if entry is None or entry['class'] != device_class.__name__:
+            return None
+        return entry['dev_name'], entry['model']
+
+    def update(self, device_class, entries):
+        """record the (serial_number, dev_name, model) 'entries' and drop any
+           other serial number of 'device_class' claiming the same dev_name
+        """
+        with self._lock:
+            index = self._load()
+            names = set(dev_name for sn, dev_name, model in entries)
+            for sn, entry in index.items():
+                if entry['class'] == device_class.__name__ and entry['dev_name'] in names:
+                    del index[sn]
+            for sn, dev_name, model in entries:
+                index[sn] = {'class' : device_class.__name__, 'dev_name' : dev_name,
+                             'model' : model}
+            self._save()
+
+    def remove(self, serial_number):
+        with self._lock:
+            if self._load().pop(serial_number, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f, indent = 1, sort_keys = True)
+            os.rename(tmp, self.path) #atomic, readers never see a partial file
+        except (IOError, OSError):
+            pass #the index is only a cache
+
+_default_index = None
+
+def get_device_index():
+    "returns the process wide default 'DeviceIndex'"
+    global _default_index
+    if _default_index is None:
+        _default_index = DeviceIndex()
+    return _default_index
+
 ###############################################################################
 class USBDevice(object):
     """ base class for all FLI USB devices"""
     #load the DLL
     _libfli = FLILibrary.getDll(debug=DEBUG)
     _domain = flidomain_t(FLIDOMAIN_USB)
+    _list_lock = threading.Lock()
 
     def __init__(self, dev_name, model):
         self.dev_name = dev_name
         self.model  = model
+        #serialize the libfli calls on this device, see 'FLI.scheduler'
+        self.scheduler = CommandScheduler()
+        self._libfli = ScheduledLibrary(self._libfli, self.scheduler)
         #open the device
         self._dev = flidev_t()
         self._libfli.FLIOpen(byref(self._dev),dev_name,self._domain)
@@ -43,6 +151,31 @@ class USBDevice(object):
         self._libfli.FLIGetSerialString(self._dev,serial,c_size_t(BUFFER_SIZE))
         return serial.value
     
+    @classmethod
+    def list_devices(cls):
+        """ lists the FLI USB devices in the current domain without opening
+            them, returns a list of 'DeviceDescriptor' objects
+        """
+        domain = flidomain_t()
+        filename = ctypes.create_string_buffer(BUFFER_SIZE)
+        name = ctypes.create_string_buffer(BUFFER_SIZE)
+        args = (byref(domain), filename, c_size_t(BUFFER_SIZE), name, c_size_t(BUFFER_SIZE))
+        descs = []
+        #the library keeps a single list for the whole process
+        with cls._list_lock:
+            cls._libfli.FLICreateList(cls._domain)
+            try:
+                try:
+                    cls._libfli.FLIListFirst(*args)
+                    while True:
+                        descs.append(DeviceDescriptor(cls, filename.value, name.value))
+                        cls._libfli.FLIListNext(*args)
+                except FLIError: #end of the list
+                    pass
+            finally:
+                cls._libfli.FLIDeleteList()
+        return descs
+
     @classmethod
     def find_devices(cls):
         """locates all FLI USB devices in the current domain and returns a 
@@ -63,7 +196,7 @@ class USBDevice(object):
         return devs
 
     @classmethod
-    def locate_device(cls, serial_number):
+    def locate_device(cls, serial_number, index = None):
         """locates the FLI USB devices in the current domain that matches the
            'serial_number' string
             
@@ -71,17 +204,47 @@ class USBDevice(object):
 
            raises FLIError if more than one device matching the serial_number 
                   is found, i.e., there is a conflict
+
+           The device name last seen for 'serial_number' is looked up in the
+           'DeviceIndex' 'index' (by default 'get_device_index()', False to
+           disable it) and if that device is still listed it is the only one
+           opened.  Otherwise, or if its serial number does not match, every
+           device is opened and checked and the index is updated.  Conflicts
+           are only detected in the latter case.
         """
+        if index is None:
+            index = get_device_index()
+        descs = cls.list_devices()
+        if index:
+            hint = index.get(cls, serial_number)
+            if hint is not None:
+                for desc in descs:
+                    if (desc.dev_name, desc.model) == hint:
+                        try:
+                            if desc.get_serial_number() == serial_number:
+                                return desc.open()
+                        except FLIError:
+                            pass #gone or busy, revalidate below
+                        break
+        #full scan
         dev_match = None
-        devs = cls.find_devices()
-        for dev in devs:
-            dev_sn = dev.get_serial_number()
+        seen = []
+        for desc in descs:
+            try:
+                dev_sn = desc.get_serial_number()
+            except FLIError:
+                continue
+            seen.append((dev_sn, desc.dev_name, desc.model))
             if dev_sn == serial_number:       #match found
                 if dev_match is None:         #first match
-                    dev_match = dev
+                    dev_match = desc.open()
                 else:                         #conflict
                     msg = "Device Conflict: there are more than one devices matching the serial_number '%s'" % serial_number
                     raise FLIError(msg)
+        if index:
+            index.update(cls, seen)
+            if dev_match is None:
+                index.remove(serial_number)
         return dev_match
 ###############################################################################
 #  TEST CODE
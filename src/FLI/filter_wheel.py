@@ -13,14 +13,78 @@ __date__ = '2012-08-16'
 
 import sys, time
 
-from ctypes import byref, c_char, c_char_p, c_long, c_ubyte, c_double
+import ctypes
+from ctypes import byref, c_char, c_char_p, c_long, c_ubyte, c_double, c_size_t
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 
 from lib import FLILibrary, FLIError, FLIWarning, flidomain_t, flidev_t,\
-                fliframe_t, FLIDOMAIN_USB, FLIDEVICE_FILTERWHEEL
+                fliframe_t, FLIDOMAIN_USB, FLIDEVICE_FILTERWHEEL,\
+                FLI_FILTER_STATUS_MOVING_CCW, FLI_FILTER_STATUS_MOVING_CW,\
+                FLI_FILTER_STATUS_HOMING, FLI_FILTER_STATUS_HOME
 
-from device import USBDevice
+from device import USBDevice, BUFFER_SIZE
 ###############################################################################
 DEBUG = False
+DEFAULT_POLL_INTERVAL = 0.05  #seconds
+DIRECTIONS = ('shortest', 'cw', 'ccw')
+FILTER_STATUS_MOVING = FLI_FILTER_STATUS_MOVING_CCW | FLI_FILTER_STATUS_MOVING_CW |\
+                       FLI_FILTER_STATUS_HOMING
+###############################################################################
+def _travel(start, stop, count, direction):
+    "slots turned going from 'start' to 'stop' on a wheel of 'count' slots"
+    cw = (stop - start) % count
+    if direction == 'cw':
+        return cw
+    if direction == 'ccw':
+        return (count - cw) % count
+    return min(cw, count - cw)
+
+def plan_filter_order(positions, current, count, direction = 'shortest'):
+    """ order in which to visit the filter slots 'positions', starting from
+        slot 'current' of a wheel of 'count' slots, with the least total
+        rotation; returns (order, travel) where 'order' lists indices into
+        'positions', requests for the same slot kept together in their
+        original order, and 'travel' is the total number of slots turned
+
+        'direction' describes how the wheel turns: 'shortest' if every move
+        takes the shorter way round, as 'FLISetFilterPos' does, or 'cw' or
+        'ccw' for a wheel driven one way only, counting slot numbers up or
+        down respectively.
+    """
+    if not direction in DIRECTIONS:
+        raise ValueError("'direction' must be one of 'shortest', 'cw' or 'ccw'")
+    groups = {}
+    for i, pos in enumerate(positions):
+        if not 0 <= pos < count:
+            raise ValueError("filter position %d is outside [0, %d)" % (pos, count))
+        groups.setdefault(pos, []).append(i)
+    #the slots sorted by their clockwise offset from the current one
+    slots = sorted(groups, key = lambda pos: (pos - current) % count)
+    if direction == 'cw':
+        candidates = [slots]
+    elif direction == 'ccw':
+        candidates = [slots[:1] + slots[:0:-1] if slots and slots[0] == current else slots[::-1]]
+    else:
+        #an optimal tour covers an arc through 'current': it goes one way
+        #to some slot and comes back the other way, or goes one way only
+        here = slots[:1] if slots and slots[0] == current else []
+        rest = slots[len(here):]
+        candidates = []
+        for i in range(len(rest) + 1):
+            candidates.append(here + rest[:i] + rest[i:][::-1])
+            candidates.append(here + rest[i:][::-1] + rest[:i])
+    best = None
+    for slots in candidates:
+        travel = 0
+        pos = current
+        for slot in slots:
+            travel += _travel(pos, slot, count, direction)
+            pos = slot
+        if best is None or travel < best[1]:
+            best = (slots, travel)
+    order = [i for slot in best[0] for i in groups[slot]]
+    return order, best[1]
 
 ###############################################################################
 class USBFilterWheel(USBDevice):
@@ -30,20 +94,127 @@ class USBFilterWheel(USBDevice):
     
     def __init__(self, dev_name, model):
         USBDevice.__init__(self, dev_name = dev_name, model = model)
+        #cached metadata
+        self._filter_count = None
+        self._filter_names = {}
+        self.metadata_calls_saved = 0 #libfli queries answered from the caches
+        #moves run one at a time on this thread, see 'set_filter_pos'
+        self._mover = ThreadPoolExecutor(max_workers = 1)
+        self._move = None
 
-    def set_filter_pos(self, pos):      
+    def set_filter_pos(self, pos, blocking = True):
+        """ Rotate the wheel to slot 'pos'.  With 'blocking' = False this
+            returns at once a concurrent.futures.Future which resolves to
+            'pos' when the wheel has arrived.  Moves are done one after the
+            other in the order they were requested.
+
+            The rotation holds the device's scheduler like any other call,
+            so other libfli calls on the wheel wait until it has arrived;
+            'is_moving' and 'wait_for_move' therefore follow the move itself
+            rather than the status of the wheel.
+        """
+        count = self.get_filter_count()
+        if not 0 <= pos < count:
+            raise ValueError("filter position %d is outside [0, %d)" % (pos, count))
+        self._move = self._mover.submit(self._set_filter_pos, pos)
+        if blocking:
+            return self._move.result()
+        return self._move
+
+    def _set_filter_pos(self, pos):
+        #'FLISetFilterPos' blocks for the whole rotation
         self._libfli.FLISetFilterPos(self._dev, c_long(pos))
+        return pos
 
     def get_filter_pos(self):
         pos = c_long()      
         self._libfli.FLIGetFilterPos(self._dev, byref(pos))
         return pos.value
 
-    def get_filter_count(self):
+    def get_status(self):
+        "returns the FLI_FILTER_STATUS_* bits reported by the wheel"
+        status = c_long()
+        self._libfli.FLIGetDeviceStatus(self._dev, byref(status))
+        return status.value
+
+    def is_moving(self):
+        """ True while a move requested by 'set_filter_pos' runs, answered
+            from the move itself, as the wheel cannot be queried meanwhile;
+            otherwise True if the wheel reports moving or homing, e.g. when
+            it was started by another process
+        """
+        if self._move is not None and not self._move.done():
+            return True
+        return bool(self.get_status() & FILTER_STATUS_MOVING)
+
+    def is_home(self):
+        return bool(self.get_status() & FLI_FILTER_STATUS_HOME)
+
+    def wait_for_move(self, timeout = None, poll_interval = DEFAULT_POLL_INTERVAL):
+        """ wait for the move requested by 'set_filter_pos', if any, then
+            poll the status of the wheel until it stops; returns its
+            position.  Raises FLIError if it is still moving after 'timeout'
+            seconds, or the error of a failed move.
+        """
+        t_end = None if timeout is None else time.time() + timeout
+        if self._move is not None:
+            try:
+                self._move.result(timeout = timeout)
+            except TimeoutError:
+                raise FLIError("filter wheel still moving after %.1f s" % timeout)
+        while self.get_status() & FILTER_STATUS_MOVING:
+            if t_end is not None and time.time() > t_end:
+                raise FLIError("filter wheel still moving after %.1f s" % timeout)
+            time.sleep(poll_interval)
+        return self.get_filter_pos()
+
+    def get_filter_count(self, refresh = False):
+        "returns the number of slots, queried once and then cached"
+        if self._filter_count is not None and not refresh:
+            self.metadata_calls_saved += 1
+            return self._filter_count
         count = c_long()      
         self._libfli.FLIGetFilterCount(self._dev, byref(count))
+        self._filter_count = count.value
         return count.value
-    
+
+    def get_filter_name(self, pos, refresh = False):
+        "returns the name of the filter in slot 'pos', cached after the first query"
+        name = self._filter_names.get(pos)
+        if name is not None and not refresh:
+            self.metadata_calls_saved += 1
+            return name
+        buff = ctypes.create_string_buffer(BUFFER_SIZE)
+        self._libfli.FLIGetFilterName(self._dev, c_long(pos), buff, c_size_t(BUFFER_SIZE))
+        self._filter_names[pos] = buff.value
+        return buff.value
+
+    def get_filter_names(self, refresh = False):
+        "returns the list of the filter names by slot"
+        return [self.get_filter_name(pos, refresh = refresh)
+                for pos in range(self.get_filter_count(refresh = refresh))]
+
+    def get_filter_index(self, name):
+        "returns the slot of the filter 'name', raises ValueError if there is none"
+        try:
+            return self.get_filter_names().index(name)
+        except ValueError:
+            raise ValueError("no filter named '%s'" % name)
+
+    def plan_filter_order(self, filters, direction = 'shortest'):
+        """ returns (order, travel) for visiting 'filters', slot numbers or
+            filter names, from the current position, see the module function
+            'plan_filter_order'; the position is that of the wheel once any
+            move in progress has finished
+        """
+        positions = [f if isinstance(f, (int, long)) else self.get_filter_index(f)
+                     for f in filters]
+        if self._move is not None and not self._move.done():
+            current = self._move.result()
+        else:
+            current = self.get_filter_pos()
+        return plan_filter_order(positions, current, self.get_filter_count(),
+                                 direction = direction)
    
         
 ###############################################################################
@@ -0,0 +1,150 @@
+"""
+ FLI.fits.py
+
+ Memory-mapped FITS files as readout targets
+"""
+
+__date__ = '2026-10-17'
+
+import numpy
+
+###############################################################################
+BLOCK_SIZE  = 2880       #FITS files are made of blocks of this many bytes
+CARD_SIZE   = 80
+DEFAULT_CHUNK_BYTES = 4*2**20
+BITPIX = {numpy.dtype(numpy.uint8)  : 8,
+          numpy.dtype(numpy.uint16) : 16,
+          numpy.dtype(numpy.int16)  : 16,
+          numpy.dtype(numpy.int32)  : 32,
+          numpy.dtype(numpy.float32): -32,
+         }
+###############################################################################
+def _padded(nbytes):
+    "round 'nbytes' up to a whole number of FITS blocks"
+    return -(-nbytes // BLOCK_SIZE)*BLOCK_SIZE
+
+def format_card(key, value = None, comment = None):
+    "returns the 80 character FITS header card for 'key' = 'value' / 'comment'"
+    key = key.upper()
+    if len(key) > 8:
+        raise ValueError("FITS keyword %r is longer than 8 characters" % key)
+    if value is None:
+        card = key.ljust(8)
+    else:
+        if isinstance(value, bool):
+            value = ('T' if value else 'F').rjust(20)
+        elif isinstance(value, (int, long)):
+            value = str(value).rjust(20)
+        elif isinstance(value, float):
+            value = repr(value).upper().rjust(20)
+        else:
+            value = ("'%s'" % str(value).replace("'","''").ljust(8)).ljust(20)
+        card = "%-8s= %s" % (key, value)
+    if comment:
+        card = "%s / %s" % (card, comment)
+    if len(card) > CARD_SIZE:
+        raise ValueError("FITS card for %r is longer than %d characters" % (key, CARD_SIZE))
+    return card.ljust(CARD_SIZE)
+
+###############################################################################
+class FITSImageFile(object):
+    """ A single image FITS file preallocated on disk, whose data section is
+        filled through 'numpy.memmap' windows of rows:
+
+            fits = FITSImageFile("frame.fits", (rows, cols), numpy.uint16)
+            for window in fits.iter_windows():
+                fill(window)             #native byte order pixel values
+                fits.encode_window(window)
+
+        'encode_window' converts the window in place to the FITS storage
+        (big-endian, and offset by BZERO = 32768 for uint16 data) and flushes
+        it to disk, so only one window of pages is touched by the process at
+        any time no matter the size of the image.
+
+        'cards' is a sequence of (key, value[, comment]) tuples added to the
+        primary header.
+    """
+    def __init__(self, filename, shape, dtype, cards = ()):
+        self.filename = filename
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        if len(self.shape) != 2:
+            raise ValueError("'shape' must be (rows, columns)")
+        if not self.dtype in BITPIX:
+            raise ValueError("unsupported FITS image dtype %s" % self.dtype)
+        self.bzero = 32768 if self.dtype == numpy.uint16 else None
+        header = [format_card('SIMPLE', True, "conforms to FITS standard"),
+                  format_card('BITPIX', BITPIX[self.dtype]),
+                  format_card('NAXIS',  2),
+                  format_card('NAXIS1', self.shape[1]),
+                  format_card('NAXIS2', self.shape[0]),
+                 ]
+        if self.bzero is not None:
+            header.append(format_card('BZERO',  self.bzero, "offset data range to that of unsigned short"))
+            header.append(format_card('BSCALE', 1))
+        for card in cards:
+            header.append(format_card(*card))
+        header.append(format_card('END'))
+        header = "".join(header)
+        self.data_offset = _padded(len(header))
+        data_bytes = self.shape[0]*self.shape[1]*self.dtype.itemsize
+        with open(filename, 'wb') as f:
+            f.write(header.ljust(self.data_offset))
+            #the data section and its padding are left as a sparse hole of
+            #zeros, the pages are only allocated as the windows are written
+            f.truncate(self.data_offset + _padded(data_bytes))
+
+    def map_rows(self, row_start, row_stop):
+        """returns a writeable 'numpy.memmap' of rows 'row_start' up to
+           'row_stop' of the image in native byte order
+        """
+        rows, cols = self.shape
+        if not (0 <= row_start < row_stop <= rows):
+            raise ValueError("invalid row range %d:%d" % (row_start, row_stop))
+        offset = self.data_offset + row_start*cols*self.dtype.itemsize
+        return numpy.memmap(self.filename, dtype = self.dtype, mode = 'r+',
+                            offset = offset, shape = (row_stop - row_start, cols))
+
+    def iter_windows(self, chunk_bytes = DEFAULT_CHUNK_BYTES):
+        "yields consecutive row windows, see 'map_rows', of at most 'chunk_bytes'"
+        rows, cols = self.shape
+        chunk_rows = max(1, chunk_bytes // (cols*self.dtype.itemsize))
+        for row_start in xrange(0, rows, chunk_rows):
+            yield self.map_rows(row_start, min(row_start + chunk_rows, rows))
+
+    def encode_window(self, window):
+        """convert the native pixel values of 'window' in place to the FITS
+           storage format and write it to disk, 'window' must not be used
+           afterwards
+        """
+        if self.bzero is not None:
+            window ^= 0x8000    #subtract BZERO modulo 2**16
+        if self.dtype.itemsize > 1 and self.dtype.byteorder != '>':
+            window.byteswap(True)
+        window.flush()
+
+def read_fits_image(filename):
+    """read back the image written to 'filename' by 'FITSImageFile' as a
+       native byte order numpy array
+    """
+    with open(filename, 'rb') as f:
+        cards = {}
+        while not 'END' in cards:
+            block = f.read(BLOCK_SIZE)
+            if len(block) < BLOCK_SIZE:
+                raise ValueError("%s: truncated FITS header" % filename)
+            for i in xrange(0, BLOCK_SIZE, CARD_SIZE):
+                card = block[i:i+CARD_SIZE]
+                key = card[:8].strip()
+                if key == 'END':
+                    cards['END'] = None
+                    break
+                if card[8:10] == '= ':
+                    cards[key] = card[10:].split('/')[0].strip()
+        bitpix = int(cards['BITPIX'])
+        shape = (int(cards['NAXIS2']), int(cards['NAXIS1']))
+        dtype = {8 : '>u1', 16 : '>i2', 32 : '>i4', -32 : '>f4'}[bitpix]
+        data = numpy.fromfile(f, dtype = dtype, count = shape[0]*shape[1]).reshape(shape)
+    if bitpix == 16 and int(float(cards.get('BZERO', 0))) == 32768:
+        return (data.view('>u2') ^ 0x8000).astype(numpy.uint16)
+    return data.astype(data.dtype.newbyteorder('='))
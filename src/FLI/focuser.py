@@ -18,6 +18,7 @@ from lib import FLILibrary, FLIError, FLIWarning, flidomain_t, flidev_t,\
                 FLI_TEMPERATURE_INTERNAL, FLI_TEMPERATURE_EXTERNAL
 
 from device import USBDevice
+from scheduler import coalesced
 ###############################################################################
 DEBUG = False
 
@@ -69,11 +70,13 @@ class USBFocuser(USBDevice):
         self._libfli.FLIHomeFocuser(self._dev)
         return self.get_stepper_position()
 
+    @coalesced
     def read_internal_temperature(self):
         temp = c_double()
         self._libfli.FLIReadTemperature(self._dev, FLI_TEMPERATURE_INTERNAL, byref(temp))
         return temp.value
 
+    @coalesced
     def read_external_temperature(self):
         temp = c_double()
         self._libfli.FLIReadTemperature(self._dev, FLI_TEMPERATURE_EXTERNAL, byref(temp))
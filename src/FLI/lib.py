@@ -10,8 +10,9 @@
 __author__ = 'Craig Wm. Versek'
 __date__ = '2012-07-25'
 
-import os, sys, warnings
-from ctypes import cdll, c_char, c_char_p, c_long, c_ulong, c_ubyte, c_int,\
+import os, sys, time, warnings, threading
+from timeit import default_timer
+from ctypes import cdll, CDLL, c_char, c_char_p, c_long, c_ulong, c_ubyte, c_int,\
                    c_double, c_void_p, c_size_t, POINTER
 c_double_p = POINTER(c_double)
 c_long_p = POINTER(c_long)
@@ -348,20 +349,200 @@ def chk_err(err):
         raise FLIWarning(msg)
     return err
 
+def _error_checked(func):
+    """wraps a Python implementation of a libfli function, such as those of
+       the simulated backend, with the same error checking as 'chk_err'
+    """
+    def wrapper(*args):
+        return chk_err(func(*args))
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+###############################################################################
+# Call Instrumentation
+###############################################################################
+#functions whose first argument is not a device handle
+_NON_DEVICE_FUNCTIONS = set([
+    "FLIOpen", "FLISetDebugLevel", "FLIGetLibVersion", "FLIList", "FLIFreeList",
+    "FLICreateList", "FLIDeleteList", "FLIListFirst", "FLIListNext",
+])
+
+#grouping of the api functions for the instrumentation summaries, anything
+#not listed is counted as 'control'
+_CALL_CATEGORIES = {
+    "FLIGrabRow"            : 'readout',
+    "FLIGrabFrame"          : 'readout',
+    "FLIGrabVideoFrame"     : 'readout',
+    "FLIFlushRow"           : 'readout',
+    "FLIGetExposureStatus"  : 'status',
+    "FLIGetDeviceStatus"    : 'status',
+    "FLIGetStepsRemaining"  : 'status',
+    "FLIGetStepperPosition" : 'status',
+    "FLIGetFilterPos"       : 'status',
+    "FLIGetTemperature"     : 'status',
+    "FLIReadTemperature"    : 'status',
+    "FLIGetCoolerPower"     : 'status',
+    "FLIGetLibVersion"      : 'metadata',
+    "FLIGetModel"           : 'metadata',
+    "FLIGetSerialString"    : 'metadata',
+    "FLIGetHWRevision"      : 'metadata',
+    "FLIGetFWRevision"      : 'metadata',
+    "FLIGetPixelSize"       : 'metadata',
+    "FLIGetArrayArea"       : 'metadata',
+    "FLIGetVisibleArea"     : 'metadata',
+    "FLIGetCameraMode"      : 'metadata',
+    "FLIGetCameraModeString": 'metadata',
+    "FLIGetReadoutDimensions": 'metadata',
+    "FLIGetFocuserExtent"   : 'metadata',
+    "FLIGetFilterCount"     : 'metadata',
+    "FLIGetFilterName"      : 'metadata',
+    "FLIList"               : 'enumeration',
+    "FLIFreeList"           : 'enumeration',
+    "FLICreateList"         : 'enumeration',
+    "FLIDeleteList"         : 'enumeration',
+    "FLIListFirst"          : 'enumeration',
+    "FLIListNext"           : 'enumeration',
+    "FLIOpen"               : 'enumeration',
+    "FLIClose"              : 'enumeration',
+    "FLIStepMotor"          : 'motion',
+    "FLIStepMotorAsync"     : 'motion',
+    "FLIHomeFocuser"        : 'motion',
+    "FLIHomeDevice"         : 'motion',
+    "FLISetFilterPos"       : 'motion',
+}
+
+#latency histogram bucket i counts calls taking less than 2**i microseconds
+HISTOGRAM_BUCKETS = 25
+
+class CallStats(object):
+    """ Call counts, latencies and error counts per libfli function and per
+        device handle, recorded by the instrumented library wrappers.  Only a
+        few dict updates are made per call, so it is cheap enough to leave on.
+    """
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        "clear all the statistics"
+        with self._lock:
+            self._since = time.time()
+            self._functions = {}  #name -> [count, total, max, errors, histogram]
+            self._devices = {}    #(handle, name) -> [count, total, errors]
+
+    def record(self, name, handle, dt, error):
+        bucket = min(int(dt*1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+        with self._lock:
+            entry = self._functions.get(name)
+            if entry is None:
+                entry = self._functions[name] = [0, 0.0, 0.0, 0, [0]*HISTOGRAM_BUCKETS]
+            entry[0] += 1
+            entry[1] += dt
+            if dt > entry[2]:
+                entry[2] = dt
+            if error:
+                entry[3] += 1
+            entry[4][bucket] += 1
+            if handle is not None:
+                key = (handle, name)
+                dev_entry = self._devices.get(key)
+                if dev_entry is None:
+                    dev_entry = self._devices[key] = [0, 0.0, 0]
+                dev_entry[0] += 1
+                dev_entry[1] += dt
+                if error:
+                    dev_entry[2] += 1
+
+    def snapshot(self):
+        """ returns a dict of the statistics so far:
+               'since'      - time.time() of the last reset
+               'functions'  - per function name: 'count', 'total' and 'max'
+                              seconds, 'errors', and 'histogram', a list of
+                              (upper bound in seconds, count) for the
+                              non-empty buckets
+               'categories' - per category (readout, status, metadata,
+                              motion, enumeration, control): 'count',
+                              'total' seconds and 'errors'
+               'devices'    - per device handle, per function name: 'count',
+                              'total' seconds and 'errors'
+        """
+        with self._lock:
+            functions = dict((name, list(entry[:4]) + [list(entry[4])])
+                             for name, entry in self._functions.items())
+            devices = dict((key, list(entry)) for key, entry in self._devices.items())
+            since = self._since
+        snap = {'since': since, 'functions': {}, 'categories': {}, 'devices': {}}
+        for name, (count, total, maxdt, errors, hist) in functions.items():
+            snap['functions'][name] = {
+                'count'     : count,
+                'total'     : total,
+                'max'       : maxdt,
+                'errors'    : errors,
+                'histogram' : [((1 << i)*1e-6, n) for i, n in enumerate(hist) if n],
+            }
+            cat = snap['categories'].setdefault(_CALL_CATEGORIES.get(name, 'control'),
+                                                {'count': 0, 'total': 0.0, 'errors': 0})
+            cat['count'] += count
+            cat['total'] += total
+            cat['errors'] += errors
+        for (handle, name), (count, total, errors) in devices.items():
+            snap['devices'].setdefault(handle, {})[name] = {
+                'count': count, 'total': total, 'errors': errors}
+        return snap
+
+def _instrumented(name, func, stats):
+    "wraps the libfli function 'func' to record its calls in 'stats'"
+    per_device = not name in _NON_DEVICE_FUNCTIONS
+    def wrapper(*args):
+        if not stats.enabled:
+            return func(*args)
+        handle = None
+        if per_device and args:
+            handle = getattr(args[0], 'value', args[0])
+        t0 = default_timer()
+        try:
+            result = func(*args)
+        except (FLIError, FLIWarning):
+            stats.record(name, handle, default_timer() - t0, True)
+            raise
+        #without error code wrapping the raw code is returned
+        stats.record(name, handle, default_timer() - t0, result != 0)
+        return result
+    wrapper.__name__ = name
+    return wrapper
+
 ###############################################################################
 # Library Loader
 ###############################################################################
 LIBVERSIZ = 1024
 DEBUG_HOST_FILENAME = ".FLIDebug.log"
+BACKEND_ENV_VAR = "FLI_BACKEND"  #set to 'sim' to use the simulated backend
+INSTRUMENT_ENV_VAR = "FLI_INSTRUMENT" #set to '1' to record per call statistics
 
 class FLILibrary:
     __dll = None
+    __stats = None
     @staticmethod
     def getDll(debug = False,
                wrap_error_codes = True,
+               instrument = None,
               ):
+        """ load the library on the first call and return it; 'instrument'
+            (default from the FLI_INSTRUMENT environment variable) wraps every
+            api function to record call statistics, see 'getCallStats'
+        """
         if FLILibrary.__dll is None:
-            if sys.platform.startswith('linux'):
+            if instrument is None:
+                instrument = os.environ.get(INSTRUMENT_ENV_VAR, '0') not in ('', '0')
+            backend = os.environ.get(BACKEND_ENV_VAR, 'libfli')
+            if backend == 'sim':
+                from sim import SimulatedLibFLI
+                FLILibrary.__dll = SimulatedLibFLI()
+            elif backend != 'libfli':
+                msg = "%s must be either 'libfli' or 'sim', not '%s'" % (BACKEND_ENV_VAR, backend)
+                raise RuntimeError(msg)
+            elif sys.platform.startswith('linux'):
                 try: #first try to load library from package directory
                     libpath = os.path.sep.join((os.path.dirname(__file__),"libfli.so"))
                     FLILibrary.__dll = cdll.LoadLibrary(libpath)
@@ -393,14 +574,7 @@ class FLILibrary:
                 else:
                     raise RuntimeError("'libfli' could not be loaded, check warnings")
             #wrap the api functions
-            for api_func_name, argtypes in _API_FUNCTION_PROTOTYPES:
-                try:
-                    api_func = FLILibrary.__dll.__getattr__(api_func_name)
-                    api_func.argtypes = argtypes
-                    if wrap_error_codes:
-                        api_func.restype = chk_err
-                except AttributeError, err:
-                    warnings.warn(Warning(err))
+            FLILibrary._wrapApiFunctions(FLILibrary.__dll, wrap_error_codes, instrument)
 
         #set debug level
         if debug:
@@ -411,6 +585,68 @@ class FLILibrary:
             
         return FLILibrary.__dll
 
+    @staticmethod
+    def _wrapApiFunctions(dll, wrap_error_codes, instrument = False):
+        """apply the prototypes, error checking and optionally the call
+           instrumentation to the api functions of 'dll'
+        """
+        if not (wrap_error_codes or instrument or isinstance(dll, CDLL)):
+            return #nothing to do for a Python implementation
+        stats = None
+        if instrument:
+            if FLILibrary.__stats is None:
+                FLILibrary.__stats = CallStats()
+            stats = FLILibrary.__stats
+        for api_func_name, argtypes in _API_FUNCTION_PROTOTYPES:
+            try:
+                api_func = getattr(dll, api_func_name)
+            except AttributeError, err:
+                warnings.warn(Warning(err))
+                continue
+            if isinstance(dll, CDLL):
+                api_func.argtypes = argtypes
+                if wrap_error_codes:
+                    api_func.restype = chk_err
+            elif wrap_error_codes:
+                #a Python implementation, e.g. the simulated backend
+                api_func = _error_checked(api_func)
+                setattr(dll, api_func_name, api_func)
+            if stats is not None:
+                setattr(dll, api_func_name, _instrumented(api_func_name, api_func, stats))
+
+    @staticmethod
+    def setDll(dll, wrap_error_codes = True, instrument = False):
+        """install an alternative library object, such as a stub or a
+           'sim.SimulatedLibFLI' for testing or benchmarking; must be called
+           before the device modules are imported, since they bind the
+           library at class creation
+        """
+        FLILibrary._wrapApiFunctions(dll, wrap_error_codes, instrument)
+        FLILibrary.__dll = dll
+
+    @staticmethod
+    def getCallStats():
+        """returns a snapshot of the call statistics (see 'CallStats.snapshot')
+           or None if the library was not loaded with instrumentation
+        """
+        if FLILibrary.__stats is None:
+            return None
+        return FLILibrary.__stats.snapshot()
+
+    @staticmethod
+    def resetCallStats():
+        if FLILibrary.__stats is not None:
+            FLILibrary.__stats.reset()
+
+    @staticmethod
+    def setInstrumentation(enabled):
+        """pause or resume recording call statistics, the library must have
+           been loaded with instrumentation
+        """
+        if FLILibrary.__stats is None:
+            raise RuntimeError("the library was not loaded with instrumentation, set %s=1" % INSTRUMENT_ENV_VAR)
+        FLILibrary.__stats.enabled = enabled
+
     @staticmethod
     def getVersion():
         libfli = FLILibrary.getDll()
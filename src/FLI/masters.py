@@ -0,0 +1,231 @@
+"""
+ FLI.masters.py
+
+ Bounded memory building of master calibration frames
+"""
+
+__date__ = '2026-10-17'
+
+import os, time, tempfile
+
+import numpy
+
+###############################################################################
+DEFAULT_MEMORY_BUDGET = 512*2**20  #bytes
+DEFAULT_SIGMA = 3.0
+MIN_CLIP_FRAMES = 5                #frames before clipping starts
+COMBINE_METHODS = ('mean', 'median')
+#running statistics and the temporaries of 'FrameCombiner.add'
+STATE_BYTES_PER_PIXEL = 24
+###############################################################################
+class MasterFrame(object):
+    """ a combined calibration frame:
+            data       - float32 mean or median of the frames
+            variance   - float32 per pixel variance of the kept samples
+            provenance - dict describing how the frame was obtained
+    """
+    def __init__(self, data, variance, provenance):
+        self.data = data
+        self.variance = variance
+        self.provenance = provenance
+
+    def __repr__(self):
+        return "MasterFrame(%s)" % ", ".join("%s=%r" % item for item in sorted(self.provenance.items()))
+
+###############################################################################
+class FrameCombiner(object):
+    """ Combines frames of 'shape' one at a time, with memory independent of
+        their number.
+
+        A running mean and variance (Welford's method) is kept per pixel in
+        float32.  Once MIN_CLIP_FRAMES frames have been seen, samples further
+        than 'sigma' standard deviations from the running mean are rejected
+        and not accumulated ('sigma' = None disables clipping).
+
+        With 'method' = 'median' the frames are also spilled to a scratch
+        cube of 'nframes' frames memory-mapped in 'scratch_dir', and 'result'
+        computes the median over tiles of rows sized to fit 'memory_budget'.
+        The cube file is removed by 'close', which 'result' calls.
+
+        Raises ValueError if the running statistics alone do not fit in
+        'memory_budget'.
+    """
+    def __init__(self, shape, method = 'mean', sigma = DEFAULT_SIGMA,
+                 nframes = None, memory_budget = DEFAULT_MEMORY_BUDGET,
+                 scratch_dir = None, dtype = numpy.uint16):
+        if not method in COMBINE_METHODS:
+            raise ValueError("'method' must be either 'mean' or 'median'")
+        if method == 'median' and not nframes:
+            raise ValueError("'nframes' is required for the median")
+        self.shape = tuple(shape)
+        self.method = method
+        self.sigma = sigma
+        self.nframes = nframes
+        self.memory_budget = memory_budget
+        state_bytes = self.shape[0]*self.shape[1]*STATE_BYTES_PER_PIXEL
+        if state_bytes > memory_budget:
+            raise ValueError("%d bytes of running statistics exceed the memory budget of %d bytes" % (state_bytes, memory_budget))
+        self._mean  = numpy.zeros(self.shape, dtype = numpy.float32)
+        self._m2    = numpy.zeros(self.shape, dtype = numpy.float32)
+        self._count = numpy.zeros(self.shape, dtype = numpy.uint16)
+        self._work  = numpy.empty(self.shape, dtype = numpy.float32)
+        self.frames = 0
+        self.rejected = 0
+        self._cube = None
+        self._cube_path = None
+        if method == 'median':
+            fd, self._cube_path = tempfile.mkstemp(prefix = 'fli-cube-', dir = scratch_dir)
+            os.close(fd)
+            self._cube = numpy.memmap(self._cube_path, dtype = dtype, mode = 'w+',
+                                      shape = (nframes,) + self.shape)
+
+    def add(self, frame):
+        "accumulate 'frame', which must have the combiner's shape"
+        if frame.shape != self.shape:
+            raise ValueError("frame has shape %r, expected %r" % (frame.shape, self.shape))
+        if self._cube is not None:
+            if self.frames >= self.nframes:
+                raise ValueError("the scratch cube is full (%d frames)" % self.nframes)
+            self._cube[self.frames] = frame
+        delta = self._work
+        numpy.subtract(frame, self._mean, out = delta)
+        keep = None
+        if self.sigma is not None and self.frames >= MIN_CLIP_FRAMES:
+            #the running mean and std of n samples are themselves uncertain,
+            #so the threshold is widened to the quantile of the predictive
+            #student-t distribution with n - 1 degrees of freedom
+            n = self.frames
+            t = self.sigma*(1.0 + (self.sigma**2 + 1.0)/(4.0*(n - 1)))
+            limit = t**2*(1.0 + 1.0/n)
+            #|delta| <= t*std*sqrt(1 + 1/n)  <=>  delta**2*(count - 1) <= limit*M2
+            keep = numpy.square(delta)*(self._count - 1) <= limit*self._m2
+            self.rejected += keep.size - numpy.count_nonzero(keep)
+            delta *= keep
+        if keep is None:
+            self._count += 1
+        else:
+            self._count += keep
+        #mean += delta/count, with rejected pixels adding 0
+        step = delta/numpy.maximum(self._count, 1)
+        self._mean += step
+        #M2 += delta*(x - new mean) = delta*(delta - step)
+        delta *= delta - step
+        self._m2 += delta
+        self.frames += 1
+
+    def result(self):
+        "returns (data, variance) as float32 arrays and removes the scratch cube"
+        try:
+            variance = self._m2/numpy.maximum(self._count.astype(numpy.float32) - 1, 1)
+            if self._cube is None:
+                return self._mean.copy(), variance
+            return self._median(), variance
+        finally:
+            self.close()
+
+    def _median(self):
+        if self.frames == 0:
+            raise ValueError("no frames were added")
+        rows, cols = self.shape
+        cube = self._cube[:self.frames]
+        #a tile is copied out of the cube as float32 and sorted in place
+        row_bytes = self.frames*cols*(cube.dtype.itemsize + 4)
+        spare = self.memory_budget - rows*cols*STATE_BYTES_PER_PIXEL
+        tile_rows = max(1, min(rows, spare // row_bytes))
+        out = numpy.empty(self.shape, dtype = numpy.float32)
+        tile = None
+        for r0 in xrange(0, rows, tile_rows):
+            r1 = min(r0 + tile_rows, rows)
+            if tile is None or tile.shape[1] != r1 - r0:
+                tile = numpy.empty((self.frames, r1 - r0, cols), dtype = numpy.float32)
+            tile[...] = cube[:, r0:r1]
+            tile.sort(axis = 0)
+            mid = self.frames // 2
+            if self.frames % 2:
+                out[r0:r1] = tile[mid]
+            else:
+                numpy.add(tile[mid - 1], tile[mid], out = out[r0:r1])
+                out[r0:r1] *= 0.5
+        return out
+
+    def close(self):
+        if self._cube is not None:
+            del self._cube
+            self._cube = None
+            os.unlink(self._cube_path)
+
+###############################################################################
+class MasterFrameBuilder(object):
+    """ Acquires calibration frames with a 'USBCamera' and combines them with
+        a 'FrameCombiner', see there for 'method', 'sigma', 'memory_budget'
+        and 'scratch_dir':
+
+            builder = MasterFrameBuilder(cam, method = 'median')
+            bias = builder.build_bias(50)
+            dark = builder.build_dark(50, 60000, subtract = bias)
+            cal.set_masters(bias = bias.data, dark = dark.data/60.0,
+                            origin = cam.get_visible_area()[:2])
+
+        The frames are read while the previous one is being combined (see
+        'USBCamera.acquire_sequence').
+    """
+    def __init__(self, camera, method = 'mean', sigma = DEFAULT_SIGMA,
+                 memory_budget = DEFAULT_MEMORY_BUDGET, scratch_dir = None):
+        self.camera = camera
+        self.method = method
+        self.sigma = sigma
+        self.memory_budget = memory_budget
+        self.scratch_dir = scratch_dir
+
+    def build(self, n, exptime, frametype = 'dark', subtract = None):
+        """ take 'n' frames of 'exptime' milliseconds and 'frametype' (see
+            'USBCamera.set_exposure') and returns their 'MasterFrame'; the
+            data of the 'MasterFrame' or array 'subtract' is removed from
+            the result, e.g. the bias from darks and flats
+        """
+        cam = self.camera
+        cam.set_exposure(exptime, frametype = frametype)
+        row_width, img_rows, img_size = cam.get_image_size()
+        combiner = FrameCombiner((img_rows, row_width), method = self.method,
+                                 sigma = self.sigma, nframes = n,
+                                 memory_budget = self.memory_budget,
+                                 scratch_dir = self.scratch_dir,
+                                 dtype = cam.get_image_dtype())
+        t_start = time.time()
+        temperatures = [cam.read_CCD_temperature()]
+        try:
+            with cam.acquire_sequence(n) as seq:
+                for img in seq:
+                    combiner.add(img)
+                    cam.release_frame(img)
+        except:
+            combiner.close()
+            raise
+        temperatures.append(cam.read_CCD_temperature())
+        data, variance = combiner.result()
+        if subtract is not None:
+            data -= getattr(subtract, 'data', subtract)
+        provenance = {'frametype'   : frametype,
+                      'exptime'     : exptime,
+                      'count'       : combiner.frames,
+                      'rejected'    : combiner.rejected,
+                      'method'      : self.method,
+                      'sigma'       : self.sigma,
+                      'binning'     : (cam.hbin, cam.vbin),
+                      'shape'       : data.shape,
+                      'temperature' : (min(temperatures), max(temperatures)),
+                      'start_time'  : t_start,
+                      'end_time'    : time.time(),
+                      'serial'      : cam.get_serial_number(),
+                     }
+        return MasterFrame(data, variance, provenance)
+
+    def build_bias(self, n):
+        "zero length dark frames"
+        return self.build(n, 0, frametype = 'dark')
+
+    def build_dark(self, n, exptime, subtract = None):
+        return self.build(n, exptime, frametype = 'dark', subtract = subtract)
+
+    def build_flat(self, n, exptime, subtract = None):
+        return self.build(n, exptime, frametype = 'normal', subtract = subtract)
@@ -0,0 +1,240 @@
+"""
+ FLI.scheduler.py
+
+ Per device serialization of the libfli calls with priority classes
+
+ Every 'USBDevice' owns a 'CommandScheduler' and calls libfli through a
+ 'ScheduledLibrary' which holds the scheduler for the duration of each call,
+ at the priority class of the function.  Multi-call operations such as a
+ frame readout hold the scheduler across all their calls with 'hold', so
+ other threads can only get in between whole operations.  When the device
+ is released, the waiting thread of the most urgent class goes next:
+
+     PRIORITY_READOUT    - image transfers
+     PRIORITY_CONTROL    - exposure control, motion, settings, status polls
+     PRIORITY_TELEMETRY  - temperatures, cooler power and static metadata
+"""
+
+__date__ = '2026-10-17'
+
+import sys, time, threading, functools
+
+from lib import _CALL_CATEGORIES
+
+###############################################################################
+PRIORITY_READOUT   = 0
+PRIORITY_CONTROL   = 1
+PRIORITY_TELEMETRY = 2
+PRIORITY_NAMES = ('readout', 'control', 'telemetry')
+
+#functions of the 'status' category which are only telemetry
+_TELEMETRY_FUNCTIONS = set(["FLIGetTemperature", "FLIReadTemperature", "FLIGetCoolerPower"])
+
+def get_priority(name):
+    "returns the priority class of the libfli function 'name'"
+    category = _CALL_CATEGORIES.get(name, 'control')
+    if category == 'readout':
+        return PRIORITY_READOUT
+    if category == 'metadata' or name in _TELEMETRY_FUNCTIONS:
+        return PRIORITY_TELEMETRY
+    return PRIORITY_CONTROL
+
+###############################################################################
+class _Pending(object):
+    "result of a coalesced call, shared by all the threads asking for it"
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+class CommandScheduler(object):
+    """ A reentrant lock with priority classes: of the threads waiting for
+        the device, one of the lowest numbered class is granted it next.  The
+        time each thread waited is accumulated per class, see 'get_stats'.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._owner = None
+        self._owner_priority = None
+        self._depth = 0
+        self._waiting = [0]*len(PRIORITY_NAMES)
+        self._pending = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._cond:
+            #per class: [grants, total wait, max wait]
+            self._stats = [[0, 0.0, 0.0] for name in PRIORITY_NAMES]
+            self._coalesced = 0
+
+    def _blocked(self, priority):
+        if self._owner is not None:
+            return True
+        for p in range(priority):
+            if self._waiting[p]:
+                return True
+        return False
+
+    def acquire(self, priority = PRIORITY_CONTROL):
+        me = threading.current_thread()
+        with self._cond:
+            if self._owner is me:
+                self._depth += 1
+                return
+            t0 = time.time()
+            if self._blocked(priority):
+                self._waiting[priority] += 1
+                try:
+                    while self._blocked(priority):
+                        self._cond.wait()
+                finally:
+                    self._waiting[priority] -= 1
+            self._owner = me
+            self._owner_priority = priority
+            self._depth = 1
+            wait = time.time() - t0
+            stats = self._stats[priority]
+            stats[0] += 1
+            stats[1] += wait
+            if wait > stats[2]:
+                stats[2] = wait
+
+    def release(self):
+        with self._cond:
+            if self._owner is not threading.current_thread():
+                raise RuntimeError("release of a scheduler not held by this thread")
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._owner_priority = None
+                self._cond.notify_all()
+
+    @property
+    def busy_priority(self):
+        """the priority class the device is currently held at, None if it is
+           free; a reentrant hold keeps the class of the outermost one
+        """
+        return self._owner_priority
+
+    def hold(self, priority = PRIORITY_CONTROL):
+        """ context manager holding the device for a sequence of calls:
+
+                with dev.scheduler.hold(PRIORITY_READOUT):
+                    ...
+        """
+        return _Hold(self, priority)
+
+    def call(self, priority, func, *args, **kwargs):
+        "call 'func' while holding the device at 'priority'"
+        self.acquire(priority)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.release()
+
+    def call_coalesced(self, key, priority, func, *args):
+        """ like 'call', but while a call with the same 'key' is already
+            waiting or running on another thread, wait for its result
+            instead of queueing another one
+        """
+        with self._cond:
+            if self._owner is threading.current_thread():
+                #holding the device already, the pending call could be
+                #waiting for it
+                pending = owner = None
+            else:
+                pending = self._pending.get(key)
+                owner = pending is None
+                if owner:
+                    pending = self._pending[key] = _Pending()
+                else:
+                    self._coalesced += 1
+        if pending is None:
+            return self.call(priority, func, *args)
+        if not owner:
+            pending.done.wait()
+            if pending.exc_info is not None:
+                exc_type, exc_value, tb = pending.exc_info
+                raise exc_type, exc_value, tb
+            return pending.result
+        try:
+            pending.result = self.call(priority, func, *args)
+            return pending.result
+        except Exception:
+            pending.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._cond:
+                del self._pending[key]
+            pending.done.set()
+
+    def get_stats(self):
+        """ returns a dict with, per priority class name, the number of
+            'grants' of the device and the 'total_wait', 'mean_wait' and
+            'max_wait' queueing delays in seconds, and the number of
+            'coalesced' calls answered by another thread's call
+        """
+        with self._cond:
+            stats = {'coalesced' : self._coalesced}
+            for name, (grants, total, longest) in zip(PRIORITY_NAMES, self._stats):
+                stats[name] = {'grants'     : grants,
+                               'total_wait' : total,
+                               'mean_wait'  : total/grants if grants else 0.0,
+                               'max_wait'   : longest,
+                              }
+            return stats
+
+class _Hold(object):
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def __enter__(self):
+        self.scheduler.acquire(self.priority)
+        return self.scheduler
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.scheduler.release()
+        return False
+
+def coalesced(method):
+    """ decorator for telemetry query methods of a device: concurrent calls
+        with the same arguments share a single execution, which waits behind
+        any readout or control work, see 'CommandScheduler.call_coalesced'
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        return self.scheduler.call_coalesced((method.__name__,) + args,
+                                             PRIORITY_TELEMETRY, method, self, *args)
+    return wrapper
+
+###############################################################################
+class ScheduledLibrary(object):
+    """ proxy for a libfli library object whose functions hold 'scheduler'
+        at their priority class while they run
+    """
+    def __init__(self, dll, scheduler):
+        self._dll = dll
+        self._scheduler = scheduler
+
+    @property
+    def unscheduled(self):
+        "the wrapped library, for hot loops run while the scheduler is held"
+        return self._dll
+
+    def __getattr__(self, name):
+        func = getattr(self._dll, name)
+        if not callable(func):
+            return func
+        scheduler = self._scheduler
+        priority = get_priority(name)
+        def scheduled(*args):
+            scheduler.acquire(priority)
+            try:
+                return func(*args)
+            finally:
+                scheduler.release()
+        scheduled.__name__ = name
+        #cache on the instance so the lookup is only done once per function
+        setattr(self, name, scheduled)
+        return scheduled
@@ -0,0 +1,374 @@
+"""
+ FLI.sequencer.py
+
+ Observation sequences run as dependency graphs of device steps
+
+ A sequence is a list of 'Target' objects, each a filter change, a focus
+ offset and a number of exposures.  'ObservationSequencer' turns it into a
+ 'StepGraph' in which every step only waits for what it really depends on,
+ so that e.g. the wheel and focuser move to the next target while the last
+ frame of the previous one is read out and saved:
+
+     seq = ObservationSequencer(cam, wheel = fw, focuser = foc)
+     timeline = seq.run([Target('M42-R', 30000, count = 5, filter = 'R'),
+                         Target('M42-G', 30000, count = 5, filter = 'G',
+                                focus_offset = 40)],
+                        save = lambda img, target, i: ...)
+     print timeline.format()
+"""
+
+__date__ = '2026-10-17'
+
+import sys, time
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from odict import OrderedDict
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+###############################################################################
+HOST_RESOURCE = 'host'
+###############################################################################
+class StepRecord(object):
+    """ timing of one step of a 'StepGraph' run, times from time.time():
+            ready  - when all the steps it depends on had finished
+            start  - when it started, after its resource became free
+            end    - when it finished
+            error  - the exception it raised, or None
+        'start' and 'end' are None for a step which never ran.
+    """
+    def __init__(self, name, resource, target):
+        self.name = name
+        self.resource = resource
+        self.target = target
+        self.ready = None
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    @property
+    def wait(self):
+        "time spent ready but waiting for the resource"
+        if self.ready is None or self.start is None:
+            return None
+        return self.start - self.ready
+
+class Timeline(object):
+    """ the 'StepRecord' of every step of a run in the order they were
+        added, with the 'start' and 'end' times of the whole run
+    """
+    def __init__(self, records, start, end):
+        self.records = records
+        self.start = start
+        self.end = end
+
+    @property
+    def elapsed(self):
+        return self.end - self.start
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, name):
+        for record in self.records:
+            if record.name == name:
+                return record
+        raise KeyError(name)
+
+    def busy_time(self, resource):
+        "total time 'resource' was running steps"
+        return sum(r.duration for r in self.records
+                   if r.resource == resource and r.duration is not None)
+
+    def summary(self, resource):
+        """ returns an OrderedDict target -> dict of the 'start' and 'end'
+            of its steps, relative to the start of the run, the time
+            'resource' was 'busy' with its steps and the time it sat 'idle'
+            before them, i.e. since the end of its previous step or the
+            start of the run; the idle time is the dead time to shrink
+        """
+        summary = OrderedDict()
+        for r in self.records:
+            if r.target is None or r.start is None:
+                continue
+            entry = summary.setdefault(r.target, {'start' : r.start - self.start,
+                                                  'end'   : r.end - self.start,
+                                                  'busy'  : 0.0,
+                                                  'idle'  : 0.0})
+            entry['start'] = min(entry['start'], r.start - self.start)
+            entry['end'] = max(entry['end'], r.end - self.start)
+        t_free = self.start
+        steps = sorted((r for r in self.records if r.resource == resource and r.start is not None),
+                       key = lambda r: r.start)
+        for r in steps:
+            if r.target in summary:
+                summary[r.target]['busy'] += r.duration
+                summary[r.target]['idle'] += max(0.0, r.start - t_free)
+            t_free = max(t_free, r.end)
+        return summary
+
+    def format(self):
+        "returns a table of the steps, times in seconds from the start of the run"
+        lines = ["%-28s %-10s %8s %8s %8s %8s" % ('step', 'resource', 'ready', 'start', 'end', 'wait')]
+        for r in self.records:
+            if r.start is None:
+                lines.append("%-28s %-10s %8s" % (r.name, r.resource, 'skipped'))
+                continue
+            lines.append("%-28s %-10s %8.3f %8.3f %8.3f %8.3f%s"
+                         % (r.name, r.resource, r.ready - self.start,
+                            r.start - self.start, r.end - self.start, r.wait,
+                            '' if r.error is None else '  FAILED: %s' % r.error))
+        lines.append("elapsed %.3f s" % self.elapsed)
+        return "\n".join(lines)
+
+###############################################################################
+class _Step(object):
+    def __init__(self, name, func, after, resource, target):
+        self.name = name
+        self.func = func
+        self.after = after
+        self.resource = resource
+        self.target = target
+
+class StepGraph(object):
+    """ Steps with dependencies, run concurrently on a thread pool.
+
+        A step is a callable taking no arguments; it starts once every step
+        named in its 'after' list has finished and no other step on the
+        same 'resource' is running, since a device does one thing at a time.
+        Steps without a resource share the HOST_RESOURCE lane of the
+        timeline but may run concurrently.  Its return value is kept in
+        'results' under its name.  When a step raises, no further steps are
+        started, the running ones are waited for and the first error is
+        raised again; 'timeline' holds the timings of the run either way.
+    """
+    def __init__(self):
+        self._steps = OrderedDict()
+        self.results = {}
+        self.timeline = None
+        self._exc_info = {}
+
+    def add(self, name, func, after = (), resource = None, target = None):
+        "add a step, returns 'name'; 'target' groups steps in the timeline summary"
+        if name in self._steps:
+            raise ValueError("duplicate step name '%s'" % name)
+        after = [a for a in after if a is not None]
+        for dep in after:
+            if not dep in self._steps:
+                raise ValueError("step '%s' depends on unknown step '%s'" % (name, dep))
+        self._steps[name] = _Step(name, func, after, resource, target)
+        return name
+
+    def __len__(self):
+        return len(self._steps)
+
+    def run(self, max_workers = None):
+        "run all the steps, returns the 'Timeline'"
+        steps = self._steps
+        records = OrderedDict((s.name, StepRecord(s.name, s.resource or HOST_RESOURCE, s.target))
+                              for s in steps.values())
+        waiting = dict((s.name, len(s.after)) for s in steps.values())
+        dependents = dict((name, []) for name in steps)
+        for s in steps.values():
+            for dep in s.after:
+                dependents[dep].append(s.name)
+        if max_workers is None:
+            max_workers = len(set(s.resource for s in steps.values())) + 1
+        order = dict((name, i) for i, name in enumerate(steps))
+        t_start = time.time()
+        ready = [name for name, n in waiting.items() if n == 0]
+        for name in ready:
+            records[name].ready = t_start
+        ready.sort(key = order.get)
+        busy = set()    #resources running a step
+        running = {}    #future -> step
+        exc_info = None
+        executor = ThreadPoolExecutor(max_workers = max_workers)
+        try:
+            while ready or running:
+                if exc_info is None:
+                    for name in list(ready):
+                        step = steps[name]
+                        if step.resource is not None:
+                            if step.resource in busy:
+                                continue
+                            busy.add(step.resource)
+                        ready.remove(name)
+                        running[executor.submit(self._run_step, step, records[name])] = step
+                if not running:
+                    break
+                done, pending = wait(list(running), return_when = FIRST_COMPLETED)
+                now = time.time()
+                for future in done:
+                    step = running.pop(future)
+                    busy.discard(step.resource)
+                    if future.exception() is not None:
+                        if exc_info is None:
+                            exc_info = self._exc_info[step.name]
+                        continue
+                    self.results[step.name] = future.result()
+                    for name in dependents[step.name]:
+                        waiting[name] -= 1
+                        if waiting[name] == 0:
+                            records[name].ready = now
+                            ready.append(name)
+                #started in the order the steps were added
+                ready.sort(key = order.get)
+        finally:
+            executor.shutdown(wait = True)
+            self.timeline = Timeline(list(records.values()), t_start, time.time())
+        if exc_info is not None:
+            exc_type, exc_value, tb = exc_info
+            raise exc_type, exc_value, tb
+        return self.timeline
+
+    def _run_step(self, step, record):
+        record.start = time.time()
+        try:
+            return step.func()
+        except Exception, exc:
+            record.error = exc
+            self._exc_info[step.name] = sys.exc_info()
+            raise
+        finally:
+            record.end = time.time()
+
+###############################################################################
+class Target(object):
+    """ one entry of an observation sequence: 'count' frames of 'exptime'
+        milliseconds and 'frametype' (see 'USBCamera.set_exposure'),
+        through 'filter', a slot number or filter name, with the focuser
+        'focus_offset' steps from the sequencer's base focus; a None filter
+        leaves the wheel where it is
+    """
+    def __init__(self, name, exptime, count = 1, filter = None,
+                 focus_offset = 0, frametype = 'normal'):
+        self.name = name
+        self.exptime = exptime
+        self.count = count
+        self.filter = filter
+        self.focus_offset = focus_offset
+        self.frametype = frametype
+
+    def __repr__(self):
+        return "Target(%r, %r, count=%r, filter=%r, focus_offset=%r)" \
+               % (self.name, self.exptime, self.count, self.filter, self.focus_offset)
+
+class ObservationSequencer(object):
+    """ Runs a list of 'Target' with a 'USBCamera' and optionally a
+        'USBFilterWheel' and a 'USBFocuser'.
+
+        Each frame is split into an 'expose' step, which ends when the
+        integration does, a 'readout' step and a 'save' step on the host.
+        The wheel and focuser steps of a target only wait for the end of the
+        integration of the previous target's last frame, so they run during
+        its readout and save, and the first exposure of the target waits for
+        both moves and for the camera.  Saving a frame overlaps the next
+        exposure.  With 'pipelined' = False every step waits for the one
+        before it instead, which gives the serial reference timeline.
+
+        'base_focus' is the focuser position of a zero 'focus_offset', by
+        default the position when 'run' is called.
+    """
+    def __init__(self, camera, wheel = None, focuser = None,
+                 base_focus = None, pipelined = True):
+        self.camera = camera
+        self.wheel = wheel
+        self.focuser = focuser
+        self.base_focus = base_focus
+        self.pipelined = pipelined
+        self.graph = None
+
+    def build(self, targets, save = None):
+        """ returns the 'StepGraph' for 'targets'; 'save(img, target, index)'
+            is called with each frame, which is then handed back to the
+            camera's frame pool; without 'save' the frames are left in the
+            graph's results under the names of the readout steps
+        """
+        cam = self.camera
+        graph = StepGraph()
+        results = graph.results
+        state = {'exposure' : None}
+        base_focus = self.base_focus
+        if self.focuser is not None and base_focus is None:
+            base_focus = self.focuser.get_stepper_position()
+        last = [None]   #the step added last, for the serial graph
+        def add(name, func, after, resource, target):
+            if not self.pipelined:
+                after = list(after) + last
+            last[0] = graph.add(name, func, after = after, resource = resource,
+                                target = target.name)
+            return last[0]
+        integrated = None   #expose step of the previous frame
+        read = None         #readout step of the previous frame
+        for t in targets:
+            moves = []
+            if t.filter is not None and self.wheel is not None:
+                moves.append(add("%s.filter" % t.name, self._filter_step(t.filter),
+                                 [integrated], 'wheel', t))
+            if self.focuser is not None:
+                moves.append(add("%s.focus" % t.name,
+                                 self._focus_step(base_focus + t.focus_offset),
+                                 [integrated], 'focuser', t))
+            for i in range(t.count):
+                prefix = "%s.%d" % (t.name, i)
+                integrated = add(prefix + ".expose", self._expose_step(t, state),
+                                 moves + [read], 'camera', t)
+                moves = []
+                read = add(prefix + ".readout", cam.fetch_image, [integrated], 'camera', t)
+                if save is not None:
+                    add(prefix + ".save", self._save_step(save, results, read, t, i),
+                        [read], None, t)
+        self.graph = graph
+        return graph
+
+    def run(self, targets, save = None, max_workers = None):
+        "build and run the sequence, returns its 'Timeline'"
+        return self.build(targets, save = save).run(max_workers = max_workers)
+
+    def _filter_step(self, filter):
+        wheel = self.wheel
+        def step():
+            pos = filter
+            if not isinstance(pos, (int, long)):
+                pos = wheel.get_filter_index(pos)
+            return wheel.set_filter_pos(pos)
+        return step
+
+    def _focus_step(self, position):
+        foc = self.focuser
+        def step():
+            steps = position - foc.get_stepper_position()
+            if steps:
+                return foc.step_motor(steps)
+            return position
+        return step
+
+    def _expose_step(self, target, state):
+        cam = self.camera
+        def step():
+            exposure = (target.exptime, target.frametype)
+            if state['exposure'] != exposure:
+                cam.set_exposure(target.exptime, frametype = target.frametype)
+                state['exposure'] = exposure
+            cam.start_exposure()
+            return cam.wait_for_exposure()
+        return step
+
+    def _save_step(self, save, results, read, target, index):
+        cam = self.camera
+        def step():
+            img = results.pop(read)
+            try:
+                return save(img, target, index)
+            finally:
+                cam.release_frame(img)
+        return step
@@ -0,0 +1,1057 @@
+"""
+ FLI.sim.py
+
+ Simulated libfli backend for hardware-free testing and benchmarking
+
+ 'SimulatedLibFLI' implements the libfli API surface declared in
+ 'lib._API_FUNCTION_PROTOTYPES' in Python, for a configurable set of
+ simulated cameras, focusers and filter wheels.  Calls take the arguments the
+ device classes pass to the real library and return libfli style error codes
+ (0 or a negative errno value).  Each call costs 'call_latency' seconds, data
+ transfers are limited to 'usb_bytes_per_second', and exposures, cooling and
+ motor motion follow the wall clock, so timings are reproducible.
+
+ Cameras are ideal by default.  'timeleft_resolution' and 'timeleft_rounding'
+ make 'FLIGetExposureStatus' report the time left as coarsely as some
+ firmware does, and 'status_lag' is the time the camera takes after the
+ integration to make the data readable (closing the shutter, transferring
+ the charge), during which 'FLIGetDeviceStatus' still reports an exposure
+ and the readout calls block.
+
+ Select it by setting the environment variable FLI_BACKEND=sim before the
+ package is imported, or install an instance with 'FLILibrary.setDll'.
+"""
+
+__date__ = '2026-10-17'
+
+import time, math, errno, threading
+
+from ctypes import cast, memmove, c_void_p, c_long, c_double, c_size_t,\
+                   c_char_p, POINTER
+
+import numpy
+
+from lib import FLILibrary, FLIDEVICE_CAMERA, FLIDEVICE_FILTERWHEEL, FLIDEVICE_FOCUSER,\
+                FLIDOMAIN_USB, FLI_BGFLUSH_START, FLI_MODE_8BIT,\
+                FLI_TEMPERATURE_CCD, FLI_TEMPERATURE_BASE,\
+                FLI_TEMPERATURE_INTERNAL, FLI_TEMPERATURE_EXTERNAL,\
+                FLI_CAMERA_STATUS_IDLE, FLI_CAMERA_STATUS_EXPOSING,\
+                FLI_CAMERA_STATUS_READING_CCD, FLI_CAMERA_DATA_READY,\
+                FLI_FOCUSER_STATUS_MOVING_IN, FLI_FOCUSER_STATUS_MOVING_OUT,\
+                FLI_FOCUSER_STATUS_HOME,\
+                FLI_FILTER_STATUS_MOVING_CW, FLI_FILTER_STATUS_MOVING_CCW,\
+                FLI_FILTER_STATUS_HOME
+###############################################################################
+LIBVERSION = "Software Development Library for Linux 1.104 (simulated)"
+
+#tunable defaults, all times in seconds
+DEFAULT_CALL_LATENCY         = 0.0002 #per API call, USB control transfer
+DEFAULT_USB_BYTES_PER_SECOND = 40e6   #bulk transfer bandwidth
+DEFAULT_SENSOR_SIZE          = (4096, 4096)
+DEFAULT_FLUSH_TIME           = 0.02   #per flush of the CCD
+DEFAULT_NFLUSHES             = 1
+DEFAULT_AMBIENT_TEMPERATURE  = 20.0   #degrees Celsius
+DEFAULT_COOLING_RATE         = 0.5    #degrees Celsius per second
+DEFAULT_MAX_COOLING_DELTA    = 45.0   #degrees Celsius below ambient
+DEFAULT_FOCUSER_EXTENT       = 10000
+DEFAULT_FOCUSER_SPEED        = 2000.0 #steps per second
+DEFAULT_FILTER_COUNT         = 5
+DEFAULT_FILTER_SLOT_TIME     = 0.4    #rotation time per slot
+DEFAULT_TIMELEFT_RESOLUTION  = 1      #milliseconds, of the exposure time left
+TIMELEFT_ROUNDINGS           = {'ceil' : math.ceil, 'round' : round, 'floor' : math.floor}
+DEFAULT_BIAS_LEVEL           = 1000
+DEFAULT_READ_NOISE           = 10.0   #ADU
+DEFAULT_STAR_FLUX            = 5e5    #ADU, of the star of the focus simulation
+DEFAULT_SEEING_SIGMA         = 1.5    #pixels, star width in focus
+DEFAULT_DEFOCUS_SCALE        = 0.005  #pixels of star width per focuser step
+
+###############################################################################
+def _addr(arg):
+    "returns the memory address referred to by a ctypes pointer-like argument"
+    return cast(arg, c_void_p).value
+
+def _value(arg):
+    "returns the plain value of a ctypes simple type or Python number"
+    return getattr(arg, 'value', arg)
+
+def _set(arg, ctype, value):
+    "store 'value' through the pointer-like argument 'arg' to a 'ctype'"
+    cast(arg, POINTER(ctype))[0] = value
+
+def _set_string(arg, size, value):
+    "copy 'value' as a NUL terminated string into a buffer of 'size' bytes"
+    size = _value(size)
+    value = value[:size - 1] + "\0"
+    memmove(_addr(arg), value, len(value))
+
+###############################################################################
+class _SimDevice(object):
+    device_type = None
+    def __init__(self, name, model, serial):
+        self.name = name
+        self.model = model
+        self.serial = serial
+        self.lock = threading.Lock()
+
+class _SimCamera(_SimDevice):
+    device_type = FLIDEVICE_CAMERA
+    def __init__(self, name, model, serial, width, height,
+                 ambient_temperature = DEFAULT_AMBIENT_TEMPERATURE,
+                ):
+        _SimDevice.__init__(self, name, model, serial)
+        self.array_area = (0, 0, width, height)
+        self.visible_area = (0, 0, width, height)
+        self.image_area = self.visible_area
+        self.hbin = 1
+        self.vbin = 1
+        self.exptime = 0            #milliseconds
+        self.frametype = 0
+        self.nflushes = DEFAULT_NFLUSHES
+        self.pixel_dtype = numpy.uint16
+        self.bgflush = False
+        self.mode = 0
+        self.exposure_start = None  #when the shutter opened
+        self.exposure_end = None
+        self.rows_grabbed = 0
+        self.star_sigma = None      #see 'SimulatedLibFLI.best_focus'
+        self.video_start = None
+        self.video_frames = 0
+        self.ambient = ambient_temperature
+        self.setpoint = ambient_temperature
+        self.temperature = ambient_temperature
+        self.temperature_time = time.time()
+
+    def get_readout_shape(self):
+        "returns (img_rows, row_width) of the image area in binned pixels"
+        left, top, right, bottom = self.image_area
+        return (bottom - top, right - left)
+
+class _SimFocuser(_SimDevice):
+    device_type = FLIDEVICE_FOCUSER
+    def __init__(self, name, model, serial, extent, speed):
+        _SimDevice.__init__(self, name, model, serial)
+        self.extent = extent
+        self.speed = speed
+        self.position = 0
+        self.move_start = None
+        self.move_from = 0
+        self.move_to = 0
+
+    def update(self):
+        "advance any motion in progress, returns the steps remaining"
+        if self.move_start is None:
+            return 0
+        travelled = int((time.time() - self.move_start)*self.speed)
+        distance = abs(self.move_to - self.move_from)
+        if travelled >= distance:
+            self.position = self.move_to
+            self.move_start = None
+            return 0
+        direction = 1 if self.move_to > self.move_from else -1
+        self.position = self.move_from + direction*travelled
+        return distance - travelled
+
+class _SimFilterWheel(_SimDevice):
+    device_type = FLIDEVICE_FILTERWHEEL
+    def __init__(self, name, model, serial, count, slot_time):
+        _SimDevice.__init__(self, name, model, serial)
+        self.count = count
+        self.slot_time = slot_time
+        self.position = 0
+        self.move_end = None
+        self.move_direction = 0
+
+###############################################################################
+class SimulatedLibFLI(object):
+    """ Python stand-in for the libfli shared object, see the module notes.
+        The per device state lives in the '_Sim*' objects, keyed by handle.
+    """
+    def __init__(self, cameras = 1, focusers = 1, filter_wheels = 1,
+                 sensor_size = DEFAULT_SENSOR_SIZE,
+                 call_latency = DEFAULT_CALL_LATENCY,
+                 usb_bytes_per_second = DEFAULT_USB_BYTES_PER_SECOND,
+                 flush_time = DEFAULT_FLUSH_TIME,
+                 cooling_rate = DEFAULT_COOLING_RATE,
+                 max_cooling_delta = DEFAULT_MAX_COOLING_DELTA,
+                 focuser_extent = DEFAULT_FOCUSER_EXTENT,
+                 focuser_speed = DEFAULT_FOCUSER_SPEED,
+                 filter_count = DEFAULT_FILTER_COUNT,
+                 filter_slot_time = DEFAULT_FILTER_SLOT_TIME,
+                 grab_frame = True,
+                 bitdepth_settable = False,
+                 best_focus = None,
+                 defocus_scale = DEFAULT_DEFOCUS_SCALE,
+                 timeleft_resolution = DEFAULT_TIMELEFT_RESOLUTION,
+                 timeleft_rounding = 'ceil',
+                 status_lag = 0.0,
+                ):
+        if not timeleft_rounding in TIMELEFT_ROUNDINGS:
+            raise ValueError("'timeleft_rounding' must be one of %s" % ", ".join(sorted(TIMELEFT_ROUNDINGS)))
+        self.call_latency = call_latency
+        self.usb_bytes_per_second = usb_bytes_per_second
+        self.flush_time = flush_time
+        self.cooling_rate = cooling_rate
+        self.max_cooling_delta = max_cooling_delta
+        self.grab_frame = grab_frame
+        self.bitdepth_settable = bitdepth_settable
+        #when 'best_focus' is set, frames show a star in the middle of the
+        #image area whose width grows with the distance of the first
+        #focuser from that position at the start of the exposure
+        self.best_focus = best_focus
+        self.defocus_scale = defocus_scale
+        #how faithfully the cameras report the end of an exposure
+        self.timeleft_resolution = timeleft_resolution
+        self.timeleft_rounding = timeleft_rounding
+        self.status_lag = status_lag
+        width, height = sensor_size
+        self.devices = []
+        for i in range(cameras):
+            self.devices.append(_SimCamera("/dev/fliusb-sim-cam%d" % i,
+                                           "MicroLine ML-SIM",
+                                           "SIMCAM%04d" % i,
+                                           width, height))
+        for i in range(focusers):
+            self.devices.append(_SimFocuser("/dev/fliusb-sim-foc%d" % i,
+                                            "Atlas Focuser SIM",
+                                            "SIMFOC%04d" % i,
+                                            focuser_extent, focuser_speed))
+        for i in range(filter_wheels):
+            self.devices.append(_SimFilterWheel("/dev/fliusb-sim-fw%d" % i,
+                                                "CFW-SIM",
+                                                "SIMFW%04d" % i,
+                                                filter_count, filter_slot_time))
+        self._handles = {}
+        self._next_handle = 1
+        self._lists = {}
+        self._iter_list = None
+        self._iter_pos = 0
+        self._sensors = {}
+        self._scenes = {}
+        self._star_scene = (None, None)
+        self._lock = threading.Lock()
+
+    def open_devices(self, device_class):
+        """open all the devices of 'device_class' (e.g. 'USBCamera') on this
+           library instead of the loaded one, each returned device keeps using
+           it through the scheduled library wrapper it is given on creation
+        """
+        from device import USBDevice #the device modules load the library
+        prev = USBDevice._libfli, device_class._libfli
+        USBDevice._libfli = device_class._libfli = self
+        try:
+            return device_class.find_devices()
+        finally:
+            USBDevice._libfli, device_class._libfli = prev
+
+    #--------------------------------------------------------------------------
+    # helpers
+    def _latency(self, nbytes = 0):
+        dt = self.call_latency
+        if nbytes and self.usb_bytes_per_second:
+            dt += float(nbytes)/self.usb_bytes_per_second
+        if dt > 0:
+            time.sleep(dt)
+
+    def _get(self, dev, device_type = None):
+        "returns the simulated device for handle 'dev' or None"
+        device = self._handles.get(_value(dev))
+        if device is None:
+            return None
+        if device_type is not None and device.device_type != device_type:
+            return None
+        return device
+
+    def _matches(self, device, domain):
+        domain = _value(domain)
+        if domain & 0xff != FLIDOMAIN_USB:
+            return False
+        device_type = domain & 0x0f00
+        return device_type == 0 or device_type == device.device_type
+
+    def _sensor(self, cam):
+        """returns a cached synthetic image of the whole array of 'cam': bias
+           level plus fixed pattern noise
+        """
+        left, top, right, bottom = cam.array_area
+        dtype = numpy.dtype(cam.pixel_dtype)
+        key = ((bottom - top, right - left), dtype.str)
+        sensor = self._sensors.get(key)
+        if sensor is None:
+            rng = numpy.random.RandomState(12345)
+            data = rng.normal(DEFAULT_BIAS_LEVEL, DEFAULT_READ_NOISE, size = key[0])
+            info = numpy.iinfo(dtype)
+            if info.bits == 8:
+                data /= 256
+            sensor = numpy.clip(data, info.min, info.max).astype(dtype)
+            self._sensors[key] = sensor
+        return sensor
+
+    def _scene(self, cam, star = True):
+        """returns the cached frame read out by 'cam': the pixels of its image
+           area on the '_sensor', the first of each binned pixel, plus a star
+           of width 'cam.star_sigma' if it is set and 'star' is
+        """
+        if star and cam.star_sigma is not None:
+            return self._star(cam, cam.star_sigma)
+        key = (cam.array_area, cam.image_area, cam.hbin, cam.vbin,
+               numpy.dtype(cam.pixel_dtype).str)
+        scene = self._scenes.get(key)
+        if scene is None:
+            img_rows, row_width = cam.get_readout_shape()
+            rows = cam.image_area[1] - cam.array_area[1] + cam.vbin*numpy.arange(img_rows)
+            cols = cam.image_area[0] - cam.array_area[0] + cam.hbin*numpy.arange(row_width)
+            sensor = self._sensor(cam)
+            scene = sensor.take(rows, axis = 0, mode = 'clip').take(cols, axis = 1, mode = 'clip')
+            self._scenes[key] = scene
+        return scene
+
+    def _star(self, cam, sigma):
+        """the frame of '_scene' plus a gaussian star in its middle, only the
+           last one is cached
+        """
+        key = (cam.array_area, cam.image_area, cam.hbin, cam.vbin,
+               numpy.dtype(cam.pixel_dtype).str, round(sigma, 3))
+        if self._star_scene[0] == key:
+            return self._star_scene[1]
+        base = self._scene(cam, star = False)
+        rows, cols = base.shape
+        y = numpy.arange(rows)[:, None] - (rows - 1)/2.0
+        x = numpy.arange(cols)[None, :] - (cols - 1)/2.0
+        star = DEFAULT_STAR_FLUX/(2*math.pi*sigma**2)*numpy.exp(-(x**2 + y**2)/(2*sigma**2))
+        info = numpy.iinfo(base.dtype)
+        if info.bits == 8:
+            star /= 256
+        scene = numpy.clip(base + star, info.min, info.max).astype(base.dtype)
+        self._star_scene = (key, scene)
+        return scene
+
+    def _star_sigma(self):
+        "star width for an exposure starting now, None without focus simulation"
+        if self.best_focus is None:
+            return None
+        focusers = [d for d in self.devices if d.device_type == FLIDEVICE_FOCUSER]
+        position = 0
+        if focusers:
+            focusers[0].update()
+            position = focusers[0].position
+        return DEFAULT_SEEING_SIGMA + self.defocus_scale*abs(position - self.best_focus)
+
+    def _update_temperature(self, cam):
+        now = time.time()
+        dt = now - cam.temperature_time
+        cam.temperature_time = now
+        lowest = cam.ambient - self.max_cooling_delta
+        target = max(cam.setpoint, lowest)
+        step = self.cooling_rate*dt
+        if abs(target - cam.temperature) <= step:
+            cam.temperature = target
+        elif target < cam.temperature:
+            cam.temperature -= step
+        else:
+            cam.temperature += step
+
+    def _camera_status(self, cam):
+        now = time.time()
+        if cam.exposure_end is None:
+            return FLI_CAMERA_STATUS_IDLE
+        if now < cam.exposure_end + self.status_lag:
+            return FLI_CAMERA_STATUS_EXPOSING
+        img_rows, row_width = cam.get_readout_shape()
+        if cam.rows_grabbed < img_rows:
+            return FLI_CAMERA_STATUS_READING_CCD | FLI_CAMERA_DATA_READY
+        return FLI_CAMERA_STATUS_IDLE
+
+    #--------------------------------------------------------------------------
+    # library and device management
+    def FLISetDebugLevel(self, host, level):
+        return 0
+
+    def FLIGetLibVersion(self, ver, len):
+        _set_string(ver, len, LIBVERSION)
+        return 0
+
+    def FLIOpen(self, dev, name, domain):
+        self._latency()
+        name = _value(name)
+        for device in self.devices:
+            if device.name == name and self._matches(device, domain):
+                with self._lock:
+                    handle = self._next_handle
+                    self._next_handle += 1
+                    self._handles[handle] = device
+                _set(dev, c_long, handle)
+                return 0
+        return -errno.ENODEV
+
+    def FLIClose(self, dev):
+        with self._lock:
+            if self._handles.pop(_value(dev), None) is None:
+                return -errno.EINVAL
+        return 0
+
+    def FLIList(self, domain, names):
+        self._latency()
+        entries = ["%s;%s" % (d.name, d.model) for d in self.devices
+                   if self._matches(d, domain)]
+        if not entries:
+            _set(names, POINTER(c_char_p), POINTER(c_char_p)())
+            return 0
+        arr = (c_char_p*(len(entries) + 1))(*(entries + [None]))
+        self._lists[_addr(arr)] = arr
+        _set(names, POINTER(c_char_p), cast(arr, POINTER(c_char_p)))
+        return 0
+
+    def FLIFreeList(self, names):
+        self._lists.pop(_addr(names), None)
+        return 0
+
+    def FLICreateList(self, domain):
+        self._latency()
+        self._iter_list = [d for d in self.devices if self._matches(d, domain)]
+        self._iter_pos = 0
+        return 0
+
+    def FLIDeleteList(self):
+        self._iter_list = None
+        return 0
+
+    def _list_entry(self, domain, filename, fnlen, name, namelen):
+        if self._iter_list is None or self._iter_pos >= len(self._iter_list):
+            return -errno.ENODEV
+        device = self._iter_list[self._iter_pos]
+        self._iter_pos += 1
+        _set(domain, c_long, FLIDOMAIN_USB | device.device_type)
+        _set_string(filename, fnlen, device.name)
+        _set_string(name, namelen, device.model)
+        return 0
+
+    def FLIListFirst(self, domain, filename, fnlen, name, namelen):
+        self._iter_pos = 0
+        return self._list_entry(domain, filename, fnlen, name, namelen)
+
+    def FLIListNext(self, domain, filename, fnlen, name, namelen):
+        return self._list_entry(domain, filename, fnlen, name, namelen)
+
+    def FLILockDevice(self, dev):
+        device = self._get(dev)
+        if device is None:
+            return -errno.ENODEV
+        device.lock.acquire()
+        return 0
+
+    def FLIUnlockDevice(self, dev):
+        device = self._get(dev)
+        if device is None:
+            return -errno.ENODEV
+        device.lock.release()
+        return 0
+
+    def FLIGetModel(self, dev, model, len):
+        self._latency()
+        device = self._get(dev)
+        if device is None:
+            return -errno.ENODEV
+        _set_string(model, len, device.model)
+        return 0
+
+    def FLIGetSerialString(self, dev, serial, len):
+        self._latency()
+        device = self._get(dev)
+        if device is None:
+            return -errno.ENODEV
+        _set_string(serial, len, device.serial)
+        return 0
+
+    def FLIGetHWRevision(self, dev, hwrev):
+        self._latency()
+        if self._get(dev) is None:
+            return -errno.ENODEV
+        _set(hwrev, c_long, 1)
+        return 0
+
+    def FLIGetFWRevision(self, dev, fwrev):
+        self._latency()
+        if self._get(dev) is None:
+            return -errno.ENODEV
+        _set(fwrev, c_long, 0x0104)
+        return 0
+
+    def FLIGetDeviceStatus(self, dev, status):
+        self._latency()
+        device = self._get(dev)
+        if device is None:
+            return -errno.ENODEV
+        if device.device_type == FLIDEVICE_CAMERA:
+            value = self._camera_status(device)
+        elif device.device_type == FLIDEVICE_FOCUSER:
+            remaining = device.update()
+            if remaining > 0:
+                if device.move_to > device.move_from:
+                    value = FLI_FOCUSER_STATUS_MOVING_OUT
+                else:
+                    value = FLI_FOCUSER_STATUS_MOVING_IN
+            else:
+                value = FLI_FOCUSER_STATUS_HOME if device.position == 0 else 0
+        else:
+            if device.move_end is not None and time.time() < device.move_end:
+                if device.move_direction > 0:
+                    value = FLI_FILTER_STATUS_MOVING_CW
+                else:
+                    value = FLI_FILTER_STATUS_MOVING_CCW
+            else:
+                value = FLI_FILTER_STATUS_HOME if device.position == 0 else 0
+        _set(status, c_long, value)
+        return 0
+
+    def FLIReadUserEEPROM(self, dev, loc, address, length, rbuf):
+        return -errno.ENOSYS
+
+    def FLIWriteUserEEPROM(self, dev, loc, address, length, wbuf):
+        return -errno.ENOSYS
+
+    def FLIUsbBulkIO(self, dev, ep, buf, len):
+        return -errno.ENOSYS
+
+    def FLIReadIOPort(self, dev, ioportset):
+        self._latency()
+        _set(ioportset, c_long, 0)
+        return 0
+
+    def FLIWriteIOPort(self, dev, ioportset):
+        self._latency()
+        return 0
+
+    def FLIConfigureIOPort(self, dev, ioportset):
+        self._latency()
+        return 0
+
+    def FLISetFanSpeed(self, dev, fan_speed):
+        self._latency()
+        return 0
+
+    def FLISetDAC(self, dev, dacset):
+        self._latency()
+        return 0
+
+    #--------------------------------------------------------------------------
+    # camera geometry and configuration
+    def FLIGetArrayArea(self, dev, ul_x, ul_y, lr_x, lr_y):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        for arg, val in zip((ul_x, ul_y, lr_x, lr_y), cam.array_area):
+            _set(arg, c_long, val)
+        return 0
+
+    def FLIGetVisibleArea(self, dev, ul_x, ul_y, lr_x, lr_y):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        for arg, val in zip((ul_x, ul_y, lr_x, lr_y), cam.visible_area):
+            _set(arg, c_long, val)
+        return 0
+
+    def FLIGetPixelSize(self, dev, pixel_x, pixel_y):
+        self._latency()
+        if self._get(dev, FLIDEVICE_CAMERA) is None:
+            return -errno.ENODEV
+        _set(pixel_x, c_double, 9e-6)
+        _set(pixel_y, c_double, 9e-6)
+        return 0
+
+    def FLISetImageArea(self, dev, ul_x, ul_y, lr_x, lr_y):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        area = tuple(_value(v) for v in (ul_x, ul_y, lr_x, lr_y))
+        left, top, right, bottom = cam.visible_area
+        if area[0] < left or area[1] < top or area[2] <= area[0] or area[3] <= area[1]:
+            return -errno.EINVAL
+        cam.image_area = area
+        return 0
+
+    def FLISetHBin(self, dev, hbin):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        if not 1 <= _value(hbin) <= 16:
+            return -errno.EINVAL
+        cam.hbin = _value(hbin)
+        return 0
+
+    def FLISetVBin(self, dev, vbin):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        if not 1 <= _value(vbin) <= 16:
+            return -errno.EINVAL
+        cam.vbin = _value(vbin)
+        return 0
+
+    def FLISetNFlushes(self, dev, nflushes):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        cam.nflushes = _value(nflushes)
+        return 0
+
+    def FLISetBitDepth(self, dev, bitdepth):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        if not self.bitdepth_settable:
+            return -errno.EINVAL #like the real library for USB cameras
+        if _value(bitdepth) == FLI_MODE_8BIT.value:
+            cam.pixel_dtype = numpy.uint8
+        else:
+            cam.pixel_dtype = numpy.uint16
+        return 0
+
+    def FLIGetCameraMode(self, dev, mode_index):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        _set(mode_index, c_long, cam.mode)
+        return 0
+
+    def FLISetCameraMode(self, dev, mode_index):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        if _value(mode_index) not in (0, 1):
+            return -errno.EINVAL
+        cam.mode = _value(mode_index)
+        return 0
+
+    def FLIGetCameraModeString(self, dev, mode_index, mode_string, siz):
+        self._latency()
+        if _value(mode_index) not in (0, 1):
+            return -errno.EINVAL
+        modes = ("2 MHz Readout", "500 KHz Readout")
+        _set_string(mode_string, siz, modes[_value(mode_index)])
+        return 0
+
+    def FLISetVerticalTableEntry(self, dev, index, height, bin, mode):
+        return -errno.ENOSYS
+
+    def FLIGetVerticalTableEntry(self, dev, index, height, bin, mode):
+        return -errno.ENOSYS
+
+    def FLIEnableVerticalTable(self, dev, width, offset, flags):
+        return -errno.ENOSYS
+
+    def FLISetTDI(self, dev, tdi_rate, flags):
+        return -errno.ENOSYS
+
+    def FLIGetReadoutDimensions(self, dev, width, hoffset, hbin, height, voffset, vbin):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        left, top, right, bottom = cam.image_area
+        for arg, val in zip((width, hoffset, hbin, height, voffset, vbin),
+                            (right - left, left, cam.hbin, bottom - top, top, cam.vbin)):
+            _set(arg, c_long, val)
+        return 0
+
+    #--------------------------------------------------------------------------
+    # exposures
+    def FLISetExposureTime(self, dev, exptime):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        if _value(exptime) < 0:
+            return -errno.EINVAL
+        cam.exptime = _value(exptime)
+        return 0
+
+    def FLISetFrameType(self, dev, frametype):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        cam.frametype = _value(frametype)
+        return 0
+
+    def FLIControlBackgroundFlush(self, dev, bgflush):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        cam.bgflush = (_value(bgflush) == FLI_BGFLUSH_START)
+        return 0
+
+    def FLIControlShutter(self, dev, shutter):
+        self._latency()
+        return 0
+
+    def FLIFlushRow(self, dev, rows, repeat):
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        img_rows, row_width = cam.get_readout_shape()
+        self._latency()
+        time.sleep(self.flush_time*_value(rows)*_value(repeat)/float(img_rows))
+        return 0
+
+    #the API functions are wrapped on the instance for error checking and
+    #instrumentation, so those sharing an implementation call the private
+    #one, not each other
+    def FLIExposeFrame(self, dev):
+        return self._expose_frame(dev)
+
+    def _expose_frame(self, dev):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        #the CCD is flushed 'nflushes' times before the shutter opens, also
+        #after background flushing, which this stops
+        flush = self.flush_time*cam.nflushes
+        cam.bgflush = False
+        if flush > 0:
+            time.sleep(flush)
+        cam.exposure_start = time.time()
+        cam.exposure_end = cam.exposure_start + cam.exptime/1000.0
+        cam.rows_grabbed = 0
+        cam.star_sigma = self._star_sigma()
+        return 0
+
+    def FLITriggerExposure(self, dev):
+        return self._expose_frame(dev)
+
+    def FLICancelExposure(self, dev):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        cam.exposure_start = None
+        cam.exposure_end = None
+        return 0
+
+    def FLIEndExposure(self, dev):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        if cam.exposure_end is not None:
+            cam.exposure_end = min(cam.exposure_end, time.time())
+        return 0
+
+    def FLIGetExposureStatus(self, dev, timeleft):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        remaining = 0
+        if cam.exposure_end is not None:
+            step = self.timeleft_resolution
+            rounding = TIMELEFT_ROUNDINGS[self.timeleft_rounding]
+            remaining = 1000*(cam.exposure_end - time.time())
+            remaining = max(0, int(rounding(remaining/step)*step))
+        _set(timeleft, c_long, remaining)
+        return 0
+
+    def _check_readout(self, cam):
+        if cam.exposure_end is None:
+            return -errno.EINVAL
+        wait = cam.exposure_end + self.status_lag - time.time()
+        if wait > 0:
+            #like the real library, block until the data is available,
+            #which is when the status turns to DATA_READY
+            time.sleep(wait)
+        return 0
+
+    def FLIGrabRow(self, dev, buff, width):
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        err = self._check_readout(cam)
+        if err:
+            return err
+        img_rows, row_width = cam.get_readout_shape()
+        width = _value(width)
+        if cam.rows_grabbed >= img_rows or width > row_width:
+            return -errno.EINVAL
+        scene = self._scene(cam)
+        row = scene[cam.rows_grabbed]
+        memmove(_addr(buff), row.ctypes.data, width*row.itemsize)
+        cam.rows_grabbed += 1
+        self._latency(width*row.itemsize)
+        return 0
+
+    def FLIGrabFrame(self, dev, buff, buffsize, bytesgrabbed):
+        if not self.grab_frame:
+            return -errno.ENOSYS
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        err = self._check_readout(cam)
+        if err:
+            return err
+        img_rows, row_width = cam.get_readout_shape()
+        scene = self._scene(cam)
+        rows = min(img_rows - cam.rows_grabbed, _value(buffsize)//scene.strides[0])
+        nbytes = rows*scene.strides[0]
+        start = scene[cam.rows_grabbed:cam.rows_grabbed + rows]
+        memmove(_addr(buff), start.ctypes.data, nbytes)
+        cam.rows_grabbed += rows
+        _set(bytesgrabbed, c_size_t, nbytes)
+        self._latency(nbytes)
+        return 0
+
+    def FLIStartVideoMode(self, dev):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        cam.video_start = time.time()
+        cam.video_frames = 0
+        return 0
+
+    def FLIStopVideoMode(self, dev):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        cam.video_start = None
+        return 0
+
+    def FLIGrabVideoFrame(self, dev, buff, size):
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        if cam.video_start is None:
+            return -errno.EINVAL
+        img_rows, row_width = cam.get_readout_shape()
+        scene = self._scene(cam)
+        nbytes = min(_value(size), scene.nbytes)
+        period = cam.exptime/1000.0
+        if self.usb_bytes_per_second:
+            period = max(period, scene.nbytes/self.usb_bytes_per_second)
+        #frames are produced on a fixed schedule, late grabs miss frames
+        now = time.time()
+        frame = max(cam.video_frames + 1, int((now - cam.video_start)/period) if period > 0 else 0)
+        ready = cam.video_start + frame*period
+        if ready > now:
+            time.sleep(ready - now)
+        cam.video_frames = frame
+        memmove(_addr(buff), scene.ctypes.data, nbytes)
+        return 0
+
+    #--------------------------------------------------------------------------
+    # temperature
+    def FLISetTemperature(self, dev, temperature):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        self._update_temperature(cam)
+        cam.setpoint = _value(temperature)
+        return 0
+
+    def FLIGetTemperature(self, dev, temperature):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        self._update_temperature(cam)
+        _set(temperature, c_double, cam.temperature)
+        return 0
+
+    def FLIReadTemperature(self, dev, channel, temperature):
+        self._latency()
+        device = self._get(dev)
+        if device is None:
+            return -errno.ENODEV
+        channel = _value(channel)
+        if device.device_type == FLIDEVICE_CAMERA:
+            self._update_temperature(device)
+            if channel == FLI_TEMPERATURE_CCD:
+                value = device.temperature
+            elif channel == FLI_TEMPERATURE_BASE:
+                value = device.ambient + 0.2*(device.ambient - device.temperature)
+            else:
+                return -errno.EINVAL
+        elif device.device_type == FLIDEVICE_FOCUSER:
+            if channel == FLI_TEMPERATURE_INTERNAL:
+                value = DEFAULT_AMBIENT_TEMPERATURE + 2.0
+            elif channel == FLI_TEMPERATURE_EXTERNAL:
+                value = DEFAULT_AMBIENT_TEMPERATURE
+            else:
+                return -errno.EINVAL
+        else:
+            return -errno.EINVAL
+        _set(temperature, c_double, value)
+        return 0
+
+    def FLIGetCoolerPower(self, dev, power):
+        self._latency()
+        cam = self._get(dev, FLIDEVICE_CAMERA)
+        if cam is None:
+            return -errno.ENODEV
+        self._update_temperature(cam)
+        if cam.temperature > max(cam.setpoint, cam.ambient - self.max_cooling_delta) + 0.05:
+            value = 100.0 #still pulling down
+        else:
+            value = 100.0*(cam.ambient - cam.temperature)/self.max_cooling_delta
+        _set(power, c_double, max(0.0, value))
+        return 0
+
+    #--------------------------------------------------------------------------
+    # focuser
+    def FLIGetFocuserExtent(self, dev, extent):
+        self._latency()
+        foc = self._get(dev, FLIDEVICE_FOCUSER)
+        if foc is None:
+            return -errno.ENODEV
+        _set(extent, c_long, foc.extent)
+        return 0
+
+    def _start_move(self, foc, steps):
+        foc.update()
+        target = foc.position + _value(steps)
+        if target < 0 or target > foc.extent:
+            return -errno.EINVAL
+        foc.move_from = foc.position
+        foc.move_to = target
+        foc.move_start = time.time()
+        return 0
+
+    def FLIStepMotorAsync(self, dev, steps):
+        return self._step_motor_async(dev, steps)
+
+    def _step_motor_async(self, dev, steps):
+        self._latency()
+        foc = self._get(dev, FLIDEVICE_FOCUSER)
+        if foc is None:
+            return -errno.ENODEV
+        return self._start_move(foc, steps)
+
+    def FLIStepMotor(self, dev, steps):
+        return self._step_motor(dev, steps)
+
+    def _step_motor(self, dev, steps):
+        err = self._step_motor_async(dev, steps)
+        if err:
+            return err
+        foc = self._get(dev, FLIDEVICE_FOCUSER)
+        time.sleep(abs(_value(steps))/foc.speed)
+        foc.update()
+        return 0
+
+    def FLIGetStepsRemaining(self, dev, steps):
+        self._latency()
+        foc = self._get(dev, FLIDEVICE_FOCUSER)
+        if foc is None:
+            return -errno.ENODEV
+        _set(steps, c_long, foc.update())
+        return 0
+
+    def FLIGetStepperPosition(self, dev, position):
+        self._latency()
+        foc = self._get(dev, FLIDEVICE_FOCUSER)
+        if foc is None:
+            return -errno.ENODEV
+        foc.update()
+        _set(position, c_long, foc.position)
+        return 0
+
+    def FLIHomeFocuser(self, dev):
+        return self._home_focuser(dev)
+
+    def _home_focuser(self, dev):
+        foc = self._get(dev, FLIDEVICE_FOCUSER)
+        if foc is None:
+            return -errno.ENODEV
+        foc.update()
+        return self._step_motor(dev, -foc.position)
+
+    def FLIHomeDevice(self, dev):
+        device = self._get(dev)
+        if device is None:
+            return -errno.ENODEV
+        if device.device_type == FLIDEVICE_FOCUSER:
+            return self._home_focuser(dev)
+        if device.device_type == FLIDEVICE_FILTERWHEEL:
+            return self._set_filter_pos(dev, 0)
+        self._latency()
+        return 0
+
+    #--------------------------------------------------------------------------
+    # filter wheel
+    def FLIGetFilterCount(self, dev, filter):
+        self._latency()
+        fw = self._get(dev, FLIDEVICE_FILTERWHEEL)
+        if fw is None:
+            return -errno.ENODEV
+        _set(filter, c_long, fw.count)
+        return 0
+
+    def FLIGetFilterPos(self, dev, filter):
+        self._latency()
+        fw = self._get(dev, FLIDEVICE_FILTERWHEEL)
+        if fw is None:
+            return -errno.ENODEV
+        _set(filter, c_long, fw.position)
+        return 0
+
+    def FLISetFilterPos(self, dev, filter):
+        return self._set_filter_pos(dev, filter)
+
+    def _set_filter_pos(self, dev, filter):
+        self._latency()
+        fw = self._get(dev, FLIDEVICE_FILTERWHEEL)
+        if fw is None:
+            return -errno.ENODEV
+        target = _value(filter)
+        if not 0 <= target < fw.count:
+            return -errno.EINVAL
+        #rotate the short way round
+        forward = (target - fw.position) % fw.count
+        backward = (fw.position - target) % fw.count
+        slots = min(forward, backward)
+        fw.move_direction = 1 if forward <= backward else -1
+        duration = slots*fw.slot_time
+        fw.move_end = time.time() + duration
+        time.sleep(duration)
+        fw.position = target
+        return 0
+
+    def FLIGetFilterName(self, dev, filter, name, len):
+        self._latency()
+        fw = self._get(dev, FLIDEVICE_FILTERWHEEL)
+        if fw is None:
+            return -errno.ENODEV
+        if not 0 <= _value(filter) < fw.count:
+            return -errno.EINVAL
+        _set_string(name, len, "Filter %d" % _value(filter))
+        return 0
+
+    def FLISetActiveWheel(self, dev, wheel):
+        self._latency()
+        return 0
+
+###############################################################################
+def zero_latency(**kwargs):
+    """ Returns a 'SimulatedLibFLI' whose calls, transfers and flushes take no
+        time unless given in 'kwargs', with its API functions wrapped to raise
+        'FLIError' like those of the loaded library.  Meant for tests and
+        benchmarks, which open its devices with 'open_devices'.
+    """
+    kwargs.setdefault('call_latency', 0.0)
+    kwargs.setdefault('usb_bytes_per_second', None)
+    kwargs.setdefault('flush_time', 0.0)
+    dll = SimulatedLibFLI(**kwargs)
+    FLILibrary._wrapApiFunctions(dll, True)
+    return dll
@@ -0,0 +1,212 @@
+"""
+ FLI.telemetry.py
+
+ Background sampling of device telemetry into a ring buffer
+
+     sampler = TelemetrySampler(cam, interval = 1.0)
+     sampler.start()
+     print sampler.latest('ccd_temperature')
+     times, values = sampler.history(since = time.time() - 600)
+     sampler.stop()
+"""
+
+__date__ = '2026-10-17'
+
+import time, threading
+
+import numpy
+
+from lib import FLIError
+from scheduler import PRIORITY_READOUT, PRIORITY_TELEMETRY
+###############################################################################
+DEFAULT_INTERVAL = 1.0     #seconds
+DEFAULT_CAPACITY = 86400   #samples, a day at the default interval
+PAUSE_RETRY      = 0.05    #seconds, how soon a sample skipped for a readout is retried
+#channel name -> device method
+CHANNELS = (
+    ('temperature',          'get_temperature'),
+    ('ccd_temperature',      'read_CCD_temperature'),
+    ('base_temperature',     'read_base_temperature'),
+    ('cooler_power',         'get_cooler_power'),
+    ('internal_temperature', 'read_internal_temperature'),
+    ('external_temperature', 'read_external_temperature'),
+)
+###############################################################################
+class TelemetryRing(object):
+    """ fixed size history of timestamped samples of several channels, kept
+        in preallocated numpy arrays; once full the oldest samples are
+        overwritten
+    """
+    def __init__(self, channels, capacity = DEFAULT_CAPACITY):
+        self.channels = tuple(channels)
+        self.capacity = capacity
+        self._times  = numpy.empty(capacity, dtype = numpy.float64)
+        self._values = numpy.empty((capacity, len(self.channels)), dtype = numpy.float64)
+        self._next = 0    #slot of the next sample
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, t, values):
+        "add the sample 'values', one per channel, taken at time 't'"
+        with self._lock:
+            self._times[self._next] = t
+            self._values[self._next] = values
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def latest(self):
+        "returns (t, values) of the newest sample, or None if empty"
+        with self._lock:
+            if not self._count:
+                return None
+            i = self._next - 1
+            return self._times[i], self._values[i].copy()
+
+    def _columns(self, channels):
+        if channels is None:
+            return slice(None)
+        return [self.channels.index(c) for c in channels]
+
+    def history(self, since = None, until = None, channels = None):
+        """ returns copies (times, values) of the samples taken in
+            [since, until), oldest first; 'values' has one column per
+            channel of 'channels', by default all of them
+        """
+        with self._lock:
+            start = self._next - self._count
+            order = numpy.arange(start, self._next) % self.capacity
+            times = self._times[order]
+            #samples are appended in time order, so the window is a slice
+            lo = 0 if since is None else numpy.searchsorted(times, since, 'left')
+            hi = len(times) if until is None else numpy.searchsorted(times, until, 'left')
+            order = order[lo:hi]
+            return self._times[order], self._values[order][:, self._columns(channels)]
+
+    def summary(self, since = None, until = None):
+        """ returns a dict channel -> dict of the 'mean', 'min', 'max' and
+            'std' over the samples in [since, until), ignoring failed reads
+        """
+        times, values = self.history(since = since, until = until)
+        summary = {}
+        for i, channel in enumerate(self.channels):
+            col = values[:, i]
+            col = col[~numpy.isnan(col)]
+            if len(col):
+                summary[channel] = {'mean' : col.mean(), 'min' : col.min(),
+                                    'max' : col.max(), 'std' : col.std(),
+                                    'samples' : len(col)}
+            else:
+                summary[channel] = None
+        return summary
+
+###############################################################################
+class TelemetrySampler(object):
+    """ Reads all the telemetry channels of a device every 'interval' seconds
+        on a background thread, in a single hold of the device's scheduler,
+        and stores them in a 'TelemetryRing'.  Readers get the cached values
+        from 'latest' and 'history' without any USB traffic.
+
+        'channels' defaults to all those of CHANNELS the device supports.  A
+        channel that fails to read is stored as NaN.  While the device is
+        held for a readout the sample is postponed, in steps of PAUSE_RETRY
+        seconds, until the readout has finished.
+    """
+    def __init__(self, device, interval = DEFAULT_INTERVAL,
+                 capacity = DEFAULT_CAPACITY, channels = None):
+        if channels is None:
+            channels = [name for name, method in CHANNELS if hasattr(device, method)]
+        methods = dict(CHANNELS)
+        for name in channels:
+            if not name in methods:
+                raise ValueError("unknown telemetry channel '%s'" % name)
+        self.device = device
+        self.interval = interval
+        self.ring = TelemetryRing(channels, capacity = capacity)
+        self._methods = [getattr(device, methods[name]) for name in channels]
+        self.samples = 0
+        self.errors = 0
+        self.paused = 0    #samples postponed by a readout
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def channels(self):
+        return self.ring.channels
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target = self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    def sample_once(self):
+        "read all the channels now and store them, returns the values"
+        values = numpy.empty(len(self._methods))
+        with self.device.scheduler.hold(PRIORITY_TELEMETRY):
+            t = time.time()
+            for i, method in enumerate(self._methods):
+                try:
+                    values[i] = method()
+                except FLIError:
+                    values[i] = numpy.nan
+                    self.errors += 1
+        self.ring.append(t, values)
+        self.samples += 1
+        return values
+
+    def _run(self):
+        scheduler = self.device.scheduler
+        t_next = time.time()
+        while not self._stop_event.is_set():
+            if scheduler.busy_priority == PRIORITY_READOUT:
+                self.paused += 1
+                self._stop_event.wait(PAUSE_RETRY)
+                continue
+            self.sample_once()
+            #keep to the schedule, skipping the slots already missed
+            now = time.time()
+            t_next += self.interval
+            if t_next < now:
+                t_next += ((now - t_next)//self.interval + 1)*self.interval
+            self._stop_event.wait(t_next - now)
+
+    def latest(self, channel = None):
+        """ returns the newest value of 'channel', or a dict of all the
+            channels with their sample time as 'time'; None if nothing has
+            been sampled yet
+        """
+        sample = self.ring.latest()
+        if sample is None:
+            return None
+        t, values = sample
+        if channel is not None:
+            return values[self.ring.channels.index(channel)]
+        latest = dict(zip(self.ring.channels, values))
+        latest['time'] = t
+        return latest
+
+    def history(self, since = None, until = None, channels = None):
+        "see 'TelemetryRing.history'"
+        return self.ring.history(since = since, until = until, channels = channels)
+
+    def summary(self, since = None, until = None):
+        "see 'TelemetryRing.summary'"
+        return self.ring.summary(since = since, until = until)
@@ -0,0 +1,148 @@
+"""
+ FLI.video.py
+
+ Video mode streaming for FLI USB cameras
+"""
+
+__date__ = '2026-10-17'
+
+import math, time
+
+###############################################################################
+DEFAULT_VIDEO_BUFFERS = 4
+DROP_FACTOR = 1.5       #intervals this many times the typical one imply drops
+PERIOD_SMOOTHING = 0.1  #weight of the newest interval in the typical interval
+###############################################################################
+class VideoStream(object):
+    """ Context manager and iterator over frames from the camera's video mode.
+
+            with cam.video_stream() as stream:
+                for img in stream:
+                    process(img)
+            print stream.get_stats()
+
+        Frames are grabbed into a ring of 'nbuffers' buffers from the camera's
+        'frame_pool', so a yielded frame is only valid until 'nbuffers - 1'
+        further frames have been grabbed; copy it to keep it.  Iteration ends
+        after 'max_frames' frames, if given.  Video mode is always stopped
+        when the block is left, whether normally or by an exception.
+
+        Dropped frames are estimated from gaps in the frame arrival times
+        longer than DROP_FACTOR times the typical inter-frame interval.
+    """
+    def __init__(self, camera, nbuffers = DEFAULT_VIDEO_BUFFERS, max_frames = None):
+        if nbuffers < 1:
+            raise ValueError("must have nbuffers >= 1")
+        self.camera = camera
+        self.nbuffers = nbuffers
+        self.max_frames = max_frames
+        self.active = False
+        self._buffers = []
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.frames = 0
+        self.dropped = 0
+        self._t_start = None
+        self._t_last = None
+        self._period = None
+        #running mean and sum of squared deviations of the intervals
+        self._nintervals = 0
+        self._interval_mean = 0.0
+        self._interval_m2 = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def start(self):
+        "allocate the frame buffers and put the camera in video mode"
+        if self.active:
+            return
+        self._reset_stats()
+        self._buffers = [self.camera.checkout_frame() for i in range(self.nbuffers)]
+        try:
+            self.camera.start_video_mode()
+        except:
+            self._release_buffers()
+            raise
+        self.active = True
+        self._t_start = time.time()
+
+    def stop(self):
+        "take the camera out of video mode and release the frame buffers"
+        if not self.active:
+            return
+        self.active = False
+        try:
+            self.camera.stop_video_mode()
+        finally:
+            self._release_buffers()
+
+    def _release_buffers(self):
+        for buf in self._buffers:
+            self.camera.release_frame(buf)
+        self._buffers = []
+
+    def grab(self):
+        "grab the next video frame into the buffer ring and return it"
+        buf = self._buffers[self.frames % self.nbuffers]
+        self.camera.grab_video_frame(out = buf)
+        self._record(time.time())
+        return buf
+
+    def __iter__(self):
+        started_here = not self.active
+        if started_here:
+            self.start()
+        try:
+            while self.max_frames is None or self.frames < self.max_frames:
+                yield self.grab()
+        finally:
+            if started_here:
+                self.stop()
+
+    def _record(self, t):
+        self.frames += 1
+        if self._t_last is not None:
+            dt = t - self._t_last
+            if self._period is not None and dt > DROP_FACTOR*self._period:
+                self.dropped += int(round(dt/self._period)) - 1
+            else:
+                if self._period is None:
+                    self._period = dt
+                else:
+                    self._period += PERIOD_SMOOTHING*(dt - self._period)
+            self._nintervals += 1
+            delta = dt - self._interval_mean
+            self._interval_mean += delta/self._nintervals
+            self._interval_m2 += delta*(dt - self._interval_mean)
+        self._t_last = t
+
+    def get_stats(self):
+        """ returns a dict summarizing the stream so far:
+               'frames'  - frames grabbed
+               'dropped' - estimated frames missed between grabs
+               'elapsed' - seconds since video mode was started
+               'fps'     - achieved frame rate
+               'jitter'  - standard deviation of the inter-frame interval in
+                           seconds
+        """
+        elapsed = 0.0
+        if self._t_start is not None and self._t_last is not None:
+            elapsed = self._t_last - self._t_start
+        fps = 0.0
+        if self._nintervals > 0 and self._interval_mean > 0:
+            fps = 1.0/self._interval_mean
+        jitter = 0.0
+        if self._nintervals > 1:
+            jitter = math.sqrt(self._interval_m2/(self._nintervals - 1))
+        return {'frames'  : self.frames,
+                'dropped' : self.dropped,
+                'elapsed' : elapsed,
+                'fps'     : fps,
+                'jitter'  : jitter,
+               }
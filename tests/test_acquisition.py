@@ -0,0 +1,66 @@
+"""
+ tests/test_acquisition.py
+
+ Tests of pipelined multi-frame acquisition with 'USBCamera.acquire_sequence'
+"""
+import os, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.lib import FLIError
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (64, 48)
+###############################################################################
+def _open_camera(**kwargs):
+    dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0, **kwargs)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(0)
+    return cam
+
+class SequenceTest(unittest.TestCase):
+    def setUp(self):
+        self.cam = _open_camera()
+
+    def test_frames(self):
+        expected = numpy.array(self.cam.take_photo())
+        with self.cam.acquire_sequence(5) as seq:
+            for img in seq:
+                numpy.testing.assert_array_equal(img, expected)
+                self.cam.release_frame(img)
+        stats = seq.get_stats()
+        self.assertEqual((stats['frames'], stats['dropped']), (5, 0))
+        self.assertEqual([info['index'] for info in seq.frame_info], range(5))
+
+    def test_drop_frames(self):
+        self.cam.set_exposure(5)
+        with self.cam.acquire_sequence(10, queue_size = 1, drop_frames = True) as seq:
+            frames = 0
+            for img in seq:
+                time.sleep(0.03)
+                self.cam.release_frame(img)
+                frames += 1
+        stats = seq.get_stats()
+        self.assertGreater(stats['dropped'], 0)
+        self.assertEqual(frames + stats['dropped'], 10)
+        self.assertEqual(stats['frames'], frames)
+
+    def test_stop_early(self):
+        seq = self.cam.acquire_sequence(100, queue_size = 1)
+        with seq:
+            img = next(iter(seq))
+            self.cam.release_frame(img)
+        self.assertLess(seq.get_stats()['frames'], 100)
+        self.assertRaises(StopIteration, next, seq)
+
+    def test_failure_raised_to_consumer(self):
+        cam = _open_camera(grab_frame = False)
+        cam.set_readout_mode('frame')
+        with cam.acquire_sequence(3) as seq:
+            self.assertRaises(FLIError, list, seq)
+
+if __name__ == '__main__':
+    unittest.main()
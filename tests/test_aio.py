@@ -0,0 +1,73 @@
+"""
+ tests/test_aio.py
+
+ Tests of the asyncio device wrappers, skipped without the 'aio' extra
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+try:
+    from FLI.aio import asyncio, AsyncUSBCamera, AsyncUSBFocuser, AsyncUSBFilterWheel
+except ImportError:
+    asyncio = None
+from FLI.camera import USBCamera
+from FLI.focuser import USBFocuser
+from FLI.filter_wheel import USBFilterWheel
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (64, 48)
+###############################################################################
+@unittest.skipIf(asyncio is None, "asyncio or trollius is not installed")
+class AsyncDeviceTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.dll = zero_latency(cameras = 2, sensor_size = SENSOR_SIZE,
+                                focuser_speed = 1e5, filter_slot_time = 0.01)
+        self.wrappers = []
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        self.loop.close()
+
+    def wrap(self, wrapper_class, device_class):
+        wrapped = [wrapper_class(dev, loop = self.loop)
+                   for dev in self.dll.open_devices(device_class)]
+        self.wrappers.extend(wrapped)
+        return wrapped
+
+    def complete(self, fut):
+        return self.loop.run_until_complete(fut)
+
+    def test_take_photo(self):
+        cams = self.wrap(AsyncUSBCamera, USBCamera)
+        self.complete(asyncio.gather(*[cam.set_exposure(20) for cam in cams], loop = self.loop))
+        imgs = self.complete(asyncio.gather(*[cam.take_photo() for cam in cams], loop = self.loop))
+        self.assertEqual(imgs[0].shape, (SENSOR_SIZE[1], SENSOR_SIZE[0]))
+        numpy.testing.assert_array_equal(imgs[0], imgs[1])
+
+    def test_cancel_take_photo(self):
+        cam = self.wrap(AsyncUSBCamera, USBCamera)[0]
+        self.complete(cam.set_exposure(10000))
+        fut = cam.take_photo()
+        self.loop.call_later(0.05, fut.cancel)
+        self.assertRaises(asyncio.CancelledError, self.complete, fut)
+        self.complete(cam.run(lambda: None)) #the cancel has been sent
+        self.assertEqual(self.complete(cam.get_exposure_timeleft()), 0)
+
+    def test_step_motor(self):
+        foc = self.wrap(AsyncUSBFocuser, USBFocuser)[0]
+        foc.poll_interval = 0.005
+        start = self.complete(foc.get_stepper_position())
+        self.assertEqual(self.complete(foc.step_motor(300)), start + 300)
+
+    def test_set_filter_pos(self):
+        wheel = self.wrap(AsyncUSBFilterWheel, USBFilterWheel)[0]
+        self.assertEqual(self.complete(wheel.set_filter_pos(3)), 3)
+        self.assertEqual(self.complete(wheel.get_filter_pos()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+ tests/test_archive.py
+
+ Tests of the background compression and archival of frames
+"""
+import os, gc, shutil, tempfile, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.archive import FrameArchiver, load_frame, shuffle_bytes
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+class ShuffleTest(unittest.TestCase):
+    def test_planes(self):
+        arr = numpy.array([0x0102, 0x0304, 0x0506], dtype = '<u2')
+        numpy.testing.assert_array_equal(shuffle_bytes(arr), [[2, 4, 6], [1, 3, 5]])
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.archiver = FrameArchiver(max_workers = 1, max_inflight_bytes = 2**20)
+
+    def tearDown(self):
+        self.archiver.close()
+        shutil.rmtree(self.dir)
+
+    def test_checkout_round_trip(self):
+        img = self.archiver.checkout((120, 160), numpy.uint16)
+        img[...] = numpy.arange(img.size).reshape(img.shape)
+        expected = numpy.array(img)
+        path = os.path.join(self.dir, 'frame.shz')
+        self.archiver.submit(img, path).result()
+        numpy.testing.assert_array_equal(load_frame(path), expected)
+
+    def test_plain_array_round_trip(self):
+        img = numpy.random.RandomState(2).randint(0, 2**16, (120, 160)).astype(numpy.uint16)
+        path = os.path.join(self.dir, 'frame.shz')
+        self.archiver.submit(img, path).result()
+        numpy.testing.assert_array_equal(load_frame(path), img)
+
+    def test_camera_frames(self):
+        dll = zero_latency(sensor_size = (160, 120), filter_wheels = 0, focusers = 0)
+        cam = dll.open_devices(USBCamera)[0]
+        cam.set_exposure(0)
+        frames = []
+        for i in range(3):
+            img = self.archiver.checkout_frame(cam)
+            cam.take_photo(out = img)
+            frames.append(numpy.array(img))
+            self.archiver.submit(img, os.path.join(self.dir, 'frame%d.shz' % i))
+        self.archiver.close()
+        for i, expected in enumerate(frames):
+            numpy.testing.assert_array_equal(load_frame(os.path.join(self.dir, 'frame%d.shz' % i)),
+                                             expected)
+        stats = self.archiver.get_stats()
+        self.assertEqual((stats['frames'], stats['inflight']), (3, 0))
+        self.assertGreater(stats['ratio'], 1.5)
+
+    def test_dropped_checkout_frees_its_room(self):
+        img = self.archiver.checkout((512, 1024), numpy.uint16)
+        shm = img.filename
+        del img
+        gc.collect()
+        self.assertFalse(os.path.exists(shm))
+        self.assertEqual(self.archiver.get_stats()['inflight'], 0)
+
+    def test_release(self):
+        img = self.archiver.checkout((16, 16), numpy.uint16)
+        self.archiver.release(img)
+        self.assertEqual(self.archiver.get_stats()['inflight'], 0)
+        self.assertRaises(ValueError, self.archiver.release, numpy.zeros(4))
+
+    def test_too_large(self):
+        self.assertRaises(ValueError, self.archiver.checkout, (1024, 1024), numpy.uint16)
+
+    def test_worker_error_raised(self):
+        path = os.path.join(self.dir, 'missing', 'frame.shz')
+        self.archiver.submit(numpy.zeros((4, 4), numpy.uint16), path)
+        self.assertRaises(IOError, self.archiver.close)
+
+    def test_not_an_archive(self):
+        path = os.path.join(self.dir, 'frame.fits')
+        with open(path, 'wb') as f:
+            f.write('SIMPLE  =')
+        self.assertRaises(ValueError, load_frame, path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+ tests/test_autofocus.py
+
+ Tests of the V-curve fit and of the focus sweep, against a simulated star
+ whose width grows with the distance from the best focus
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.camera import USBCamera
+from FLI.focuser import USBFocuser
+from FLI.autofocus import Autofocus, fit_vcurve, fit_vcurve_error
+from FLI.sim import zero_latency
+###############################################################################
+BEST_FOCUS = 5000
+STEP = 100
+###############################################################################
+class FitVCurveTest(unittest.TestCase):
+    def setUp(self):
+        self.positions = numpy.arange(4000, 6001, STEP)
+        self.scores = 2.0 + 1e-5*(self.positions - 5030.0)**2
+
+    def test_vertex(self):
+        vertex, coefficients = fit_vcurve(self.positions, self.scores)
+        self.assertAlmostEqual(vertex, 5030.0, places = 6)
+        numpy.testing.assert_allclose(numpy.polyval(coefficients, self.positions),
+                                      self.scores, atol = 1e-9)
+        #the same samples as a metric to maximize
+        vertex, coefficients = fit_vcurve(self.positions, -self.scores, minimize = False)
+        self.assertAlmostEqual(vertex, 5030.0, places = 6)
+
+    def test_error(self):
+        vertex, coefficients, error = fit_vcurve_error(self.positions, self.scores)
+        self.assertLess(error, 1e-6)
+        noise = numpy.random.RandomState(3).normal(0, 0.05, len(self.scores))
+        vertex, coefficients, error = fit_vcurve_error(self.positions, self.scores + noise)
+        self.assertGreater(error, 0)
+        self.assertLess(abs(vertex - 5030.0), 5*error)
+        #no scatter to tell with only 3 samples
+        self.assertTrue(fit_vcurve_error(self.positions[9:12], self.scores[9:12])[2] is None)
+
+    def test_window_and_nan(self):
+        scores = self.scores.copy()
+        scores[0] = numpy.nan
+        scores[-1] = 1e6    #outside the window around the best sample
+        vertex, coefficients = fit_vcurve(self.positions, scores, points = 7)
+        self.assertAlmostEqual(vertex, 5030.0, places = 6)
+
+    def test_no_extremum(self):
+        self.assertEqual(fit_vcurve(self.positions, -self.scores), (None, None))
+        self.assertEqual(fit_vcurve(self.positions[:10], self.scores[:10]), (None, None))
+        self.assertEqual(fit_vcurve(self.positions[:2], self.scores[:2]), (None, None))
+
+class AutofocusTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = (128, 128), filter_wheels = 0,
+                           best_focus = BEST_FOCUS, focuser_speed = 1e6)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.foc = dll.open_devices(USBFocuser)[0]
+        self.foc.step_motor(4000 - self.foc.get_stepper_position())
+
+    def test_sweep(self):
+        for overlap in (False, True):
+            af = Autofocus(self.cam, self.foc, 0, 4000, STEP, 21,
+                           early_stop = False, overlap = overlap)
+            result = af.run()
+            self.assertEqual(result.positions, af.sweep)
+            self.assertFalse(result.stopped_early)
+            self.assertLessEqual(abs(result.best_position - BEST_FOCUS), STEP)
+            self.assertEqual(self.foc.get_stepper_position(), result.best_position)
+            #every frame handed back to the pool after scoring
+            stats = self.cam.frame_pool.get_stats()
+            self.assertEqual(stats['free'], stats['allocated'])
+
+    def test_early_stop(self):
+        af = Autofocus(self.cam, self.foc, 0, 4000, STEP, 21, vertex_tolerance = 1.0)
+        result = af.run()
+        self.assertTrue(result.stopped_early)
+        self.assertLess(len(result.positions), 21)
+        self.assertEqual(result.positions, af.sweep[:len(result.positions)])
+        self.assertLessEqual(abs(result.best_position - BEST_FOCUS), STEP)
+        self.assertLessEqual(result.error, STEP)
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, Autofocus, self.cam, self.foc, 0, 4000, STEP, 21,
+                          metric = 'fwhm')
+        self.assertRaises(ValueError, Autofocus, self.cam, self.foc, 0, 4000, 0, 21)
+        self.assertRaises(ValueError, Autofocus, self.cam, self.foc, 0, 4000, STEP, 2)
+        self.assertRaises(ValueError, Autofocus, self.cam, self.foc, 0, 9000, STEP, 21)
+
+if __name__ == '__main__':
+    unittest.main()
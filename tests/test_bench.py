@@ -0,0 +1,43 @@
+"""
+ tests/test_bench.py
+
+ Tests of the benchmark suite helpers and of the recorded simulator baseline
+"""
+import os, json, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI import bench
+###############################################################################
+class TimeitTest(unittest.TestCase):
+    def test_warm_up_and_median(self):
+        calls = []
+        def func():
+            #only the first call pays a one-time cost
+            if not calls:
+                time.sleep(0.2)
+            calls.append(1)
+        self.assertLess(bench.timeit(func, repeat = 3), 0.1)
+        self.assertEqual(len(calls), 4)
+
+class CompareTest(unittest.TestCase):
+    def test_regressions(self):
+        baseline = {'a': 1.0, 'b': 1.0, 'c.MBps': 100.0, 'd.MBps': 100.0, 'gone': 1.0}
+        results  = {'a': 1.1, 'b': 1.3, 'c.MBps': 90.0, 'd.MBps': 70.0}
+        self.assertEqual(bench.compare(results, baseline, tolerance = 0.2),
+                         [('b', 1.3, 1.0), ('d.MBps', 70.0, 100.0)])
+
+class BaselineTest(unittest.TestCase):
+    def test_recorded_sim_baseline(self):
+        with open(bench.SIM_BASELINE) as f:
+            report = json.load(f)
+        self.assertEqual(report['backend'], 'sim')
+        results = {}
+        bench.bench_host_readout(results, repeat = 1, sizes = (1024,))
+        self.assertTrue(results)
+        for name, value in results.items():
+            self.assertTrue(name in report['results'], name)
+            self.assertGreater(value, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+ tests/test_buffers.py
+
+ Tests of 'FramePool' and of zero-allocation readout into pool buffers
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.buffers import FramePool
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SHAPE = (120, 160)
+###############################################################################
+class FramePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = FramePool(max_free = 2)
+
+    def test_reuse(self):
+        buf = self.pool.checkout(SHAPE, numpy.uint16)
+        self.pool.release(buf)
+        self.assertTrue(self.pool.checkout(SHAPE, numpy.uint16) is buf)
+        stats = self.pool.get_stats()
+        self.assertEqual((stats['allocated'], stats['reused']), (1, 1))
+
+    def test_keyed_by_geometry(self):
+        buf = self.pool.checkout(SHAPE, numpy.uint16)
+        self.pool.release(buf)
+        self.assertFalse(self.pool.checkout(SHAPE, numpy.uint8) is buf)
+        self.assertFalse(self.pool.checkout((160, 120), numpy.uint16) is buf)
+        self.assertTrue(self.pool.checkout(SHAPE, numpy.dtype('<u2')) is buf)
+
+    def test_max_free(self):
+        bufs = [self.pool.checkout(SHAPE, numpy.uint16) for i in range(3)]
+        for buf in bufs:
+            self.pool.release(buf)
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['free'], 2)
+        self.assertEqual(stats['free_bytes'], 2*bufs[0].nbytes)
+        self.pool.clear()
+        self.assertEqual(self.pool.get_stats()['free'], 0)
+
+    def test_bad_release(self):
+        buf = self.pool.checkout(SHAPE, numpy.uint16)
+        self.assertRaises(ValueError, self.pool.release, buf[10:20])
+        self.assertRaises(ValueError, self.pool.release, buf.T)
+        self.pool.release(buf)
+        self.assertRaises(ValueError, self.pool.release, buf)
+
+class CameraPoolTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = (SHAPE[1], SHAPE[0]), filter_wheels = 0, focusers = 0)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.cam.set_exposure(0)
+
+    def test_fetch_reuses_released_frames(self):
+        for i in range(5):
+            self.cam.start_exposure()
+            self.cam.release_frame(self.cam.fetch_image())
+        stats = self.cam.frame_pool.get_stats()
+        self.assertEqual((stats['allocated'], stats['reused']), (1, 4))
+
+    def test_fetch_into_out(self):
+        out = self.cam.checkout_frame()
+        self.cam.start_exposure()
+        self.assertTrue(self.cam.fetch_image(out = out) is out)
+        self.assertEqual(self.cam.frame_pool.get_stats()['allocated'], 1)
+
+    def test_out_checked(self):
+        self.cam.start_exposure()
+        for out in (numpy.empty(SHAPE, numpy.uint8),
+                    numpy.empty((SHAPE[0] - 1, SHAPE[1]), numpy.uint16),
+                    numpy.empty(SHAPE[::-1], numpy.uint16).T,
+                    numpy.empty(SHAPE, numpy.uint16).tolist()):
+            self.assertRaises(ValueError, self.cam.fetch_image, out = out)
+
+if __name__ == '__main__':
+    unittest.main()
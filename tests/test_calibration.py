@@ -0,0 +1,115 @@
+"""
+ tests/test_calibration.py
+
+ Tests of the bias, dark and flat calibration of frames
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.camera import USBCamera
+from FLI.calibration import Calibrator, CalibrationMasters
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (160, 120) #width, height
+EXPTIME = 10             #milliseconds
+###############################################################################
+def _open_camera():
+    dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(EXPTIME)
+    return cam
+
+def _take(cam):
+    "expose and read a frame, returns a copy of it"
+    cam.start_exposure()
+    img = cam.fetch_image()
+    try:
+        return numpy.array(img)
+    finally:
+        cam.release_frame(img)
+
+class CalibrationMastersTest(unittest.TestCase):
+    def test_apply(self):
+        raw = numpy.array([[110, 120], [130, 140]], numpy.uint16)
+        masters = CalibrationMasters((2, 2), bias = [[10, 10], [10, 10]],
+                                     dark = [[0, 10], [20, 0]], flat = [[1, 1], [3, 3]])
+        out = masters.apply(raw, numpy.empty((2, 2), numpy.float32), 1000)
+        #the flat is normalized to a mean of 1
+        numpy.testing.assert_allclose(out, [[200, 200], [200/3.0, 260/3.0]], rtol = 1e-6)
+
+    def test_dead_flat_pixels_zeroed(self):
+        masters = CalibrationMasters((1, 2), flat = [[0, 2]])
+        out = masters.apply(numpy.array([[5, 5]]), numpy.empty((1, 2), numpy.float32), 0)
+        numpy.testing.assert_array_equal(out, [[0, 2.5]])
+
+    def test_offset_cached_per_exptime(self):
+        masters = CalibrationMasters((1, 1), bias = [[1]], dark = [[2]])
+        offset = masters.get_offset(500)
+        self.assertTrue(masters.get_offset(500) is offset)
+        self.assertEqual(masters.get_offset(1000)[0, 0], 3)
+
+    def test_bad_masters(self):
+        self.assertRaises(ValueError, CalibrationMasters, (2, 2), bias = numpy.zeros((2, 3)))
+        self.assertRaises(ValueError, Calibrator().set_masters)
+        self.assertRaises(ValueError, Calibrator().get_masters, (1, 1))
+
+class CalibrationTest(unittest.TestCase):
+    def setUp(self):
+        self.cam = _open_camera()
+        rng = numpy.random.RandomState(1)
+        shape = (SENSOR_SIZE[1], SENSOR_SIZE[0])
+        self.bias = rng.uniform(900, 1100, shape)
+        self.dark = rng.uniform(0, 10, shape)
+        self.flat = rng.uniform(0.8, 1.2, shape)
+        self.cal = Calibrator()
+        self.cal.set_masters(bias = self.bias, dark = self.dark, flat = self.flat,
+                             origin = self.cam.get_visible_area()[:2])
+        self.cam.calibrator = self.cal
+        self.full = _take(self.cam)
+        self.expected = self.cal.calibrate(self.full, EXPTIME)
+
+    def fetch_calibrated(self):
+        row_width, img_rows, img_size = self.cam.get_image_size()
+        self.cam.start_exposure()
+        return self.cam.fetch_calibrated(out = numpy.empty((img_rows, row_width), numpy.float32))
+
+    def test_full_frame(self):
+        flat = self.flat/self.flat.mean()
+        expected = (self.full - self.bias - self.dark*EXPTIME/1000.0)/flat
+        numpy.testing.assert_allclose(self.fetch_calibrated(), expected, atol = 1e-2)
+
+    def test_subframe_uses_its_window_of_the_masters(self):
+        self.cam.set_image_area(30, 20, 90, 70)
+        numpy.testing.assert_allclose(self.fetch_calibrated(), self.expected[20:70, 30:90],
+                                      rtol = 1e-5)
+
+    def test_same_shape_other_offset(self):
+        self.cam.set_image_area(60, 50, 120, 100)
+        numpy.testing.assert_allclose(self.fetch_calibrated(), self.expected[50:100, 60:120],
+                                      rtol = 1e-5)
+
+    def test_binning_without_masters(self):
+        self.cam.set_image_binning(2, 2)
+        self.assertRaises(ValueError, self.fetch_calibrated)
+
+    def test_area_outside_the_masters(self):
+        self.cal.set_masters((2, 2), bias = self.bias[:40:2, :40:2])
+        self.cam.set_image_binning(2, 2)
+        self.cam.set_image_area(30, 20, 90, 70)
+        self.assertRaises(ValueError, self.fetch_calibrated)
+
+    def test_misaligned_binned_area(self):
+        self.cal.set_masters((2, 2), bias = self.bias[::2, ::2])
+        self.cam.set_image_binning(2, 2)
+        self.cam.set_image_area(31, 20, 91, 70)
+        self.assertRaises(ValueError, self.fetch_calibrated)
+        self.cam.set_image_area(30, 20, 90, 70)
+        numpy.testing.assert_allclose(self.fetch_calibrated(),
+                                      self.full[20:70:2, 30:90:2] - self.bias[::2, ::2][10:35, 15:45],
+                                      atol = 1e-3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+ tests/test_camera_array.py
+
+ Tests of synchronized acquisition with 'CameraArray'
+"""
+import os, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.lib import FLIError
+from FLI.camera import USBCamera
+from FLI.camera_array import CameraArray
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (64, 48)
+EXPTIME = 100 #milliseconds
+###############################################################################
+class CameraArrayTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(cameras = 3, sensor_size = SENSOR_SIZE, grab_frame = False,
+                           filter_wheels = 0, focusers = 0)
+        self.array = CameraArray(dll.open_devices(USBCamera))
+        self.array.set_exposure(EXPTIME)
+
+    def test_simultaneous(self):
+        t0 = time.time()
+        frames = self.array.take_photos()
+        self.assertLess(time.time() - t0, 1.5*EXPTIME/1000.0)
+        self.assertEqual(len(frames), 3)
+        self.assertLess(frames.skew, 0.02)
+        for img, start, exposed in zip(frames, frames.start_times, frames.exposed_times):
+            self.assertEqual(img.shape, (SENSOR_SIZE[1], SENSOR_SIZE[0]))
+            self.assertGreaterEqual(exposed - start, EXPTIME/1000.0)
+
+    def test_out(self):
+        out = [cam.checkout_frame() for cam in self.array]
+        frames = self.array.take_photos(out = out)
+        for img, buf in zip(frames, out):
+            self.assertTrue(img is buf)
+        self.assertRaises(ValueError, self.array.take_photos, out = out[:2])
+
+    def test_error_raised_after_all_finish(self):
+        self.array[1].set_readout_mode('frame')
+        self.assertRaises(FLIError, self.array.take_photos)
+        for cam in (self.array[0], self.array[2]):
+            self.assertTrue(cam.is_exposure_complete())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+ tests/test_cooling.py
+
+ Tests of the non-blocking cooling controller, with a fast simulated cooler
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from concurrent.futures import CancelledError, TimeoutError
+
+from FLI.lib import FLIError
+from FLI.camera import USBCamera
+from FLI.cooling import CoolingController
+from FLI.sim import zero_latency
+###############################################################################
+AMBIENT = 20.0       #degrees C, of the simulated cameras
+COOLING_RATE = 50.0  #degrees C per second
+FAST = dict(window = 0.2, interval = 0.01, tolerance = 0.5)
+###############################################################################
+class CoolingControllerTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = (64, 48), filter_wheels = 0, focusers = 0,
+                           cooling_rate = COOLING_RATE, max_cooling_delta = 30.0)
+        self.cam = dll.open_devices(USBCamera)[0]
+
+    def test_stable(self):
+        cooler = self.cam.start_cooling(10.0, ramp_rate = 6000.0, timeout = 5.0, **FAST)
+        try:
+            temperature = cooler.wait(timeout = 5.0)
+            self.assertLessEqual(abs(temperature - 10.0), 0.5)
+            self.assertTrue(cooler.is_stable())
+            self.assertLessEqual(abs(cooler.drift()), cooler.max_drift)
+        finally:
+            cooler.stop()
+
+    def test_ramp_rate(self):
+        #10 degrees per second, the setpoint needs 2 seconds to get there
+        cooler = CoolingController(self.cam, 0.0, ramp_rate = 600.0, **FAST).start()
+        try:
+            self.assertRaises(TimeoutError, cooler.wait, timeout = 0.3)
+            self.assertTrue(15.0 < cooler.setpoint < AMBIENT)
+        finally:
+            cooler.stop()
+        setpoints = [h[3] for h in cooler.history]
+        self.assertEqual(setpoints, sorted(setpoints, reverse = True))
+
+    def test_timeout(self):
+        #below the lowest temperature the cooler can reach
+        cooler = self.cam.start_cooling(-50.0, ramp_rate = 6000.0, timeout = 0.3, **FAST)
+        try:
+            self.assertRaises(FLIError, cooler.wait, timeout = 5.0)
+        finally:
+            cooler.stop()
+
+    def test_stop_cancels(self):
+        cooler = self.cam.start_cooling(-5.0, **FAST)
+        cooler.stop()
+        self.assertTrue(cooler.future.cancelled())
+        self.assertRaises(CancelledError, cooler.wait)
+
+    def test_bad_ramp_rate(self):
+        self.assertRaises(ValueError, CoolingController, self.cam, 0.0, ramp_rate = 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+ tests/test_enumeration.py
+
+ Tests of listing devices without opening them and of the serial number
+ index, against the library loaded with FLI_BACKEND=sim
+"""
+import os, shutil, tempfile, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI.device import USBDevice, DeviceIndex
+from FLI.camera import USBCamera
+from FLI.focuser import USBFocuser
+from FLI.sim import SimulatedLibFLI
+###############################################################################
+CAMERA_SERIAL = "SIMCAM0000"
+###############################################################################
+@unittest.skipUnless(isinstance(USBDevice._libfli, SimulatedLibFLI),
+                     "needs the simulated backend, set FLI_BACKEND=sim")
+class EnumerationTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.index = DeviceIndex(os.path.join(self.dir, 'index.json'))
+        #count the devices opened
+        self.dll = USBDevice._libfli
+        self.opened = []
+        self.open_device = open_device = self.dll.FLIOpen
+        def counted(dev, name, domain):
+            self.opened.append(name)
+            return open_device(dev, name, domain)
+        self.dll.FLIOpen = counted
+
+    def tearDown(self):
+        self.dll.FLIOpen = self.open_device
+        shutil.rmtree(self.dir)
+
+    def test_list_without_opening(self):
+        descs = USBCamera.list_devices()
+        self.assertEqual(len(descs), 1)
+        self.assertFalse(descs[0].is_open)
+        self.assertEqual(self.opened, [])
+        self.assertEqual(descs[0].get_serial_number(), CAMERA_SERIAL)
+        self.assertTrue(descs[0].is_open)
+        self.assertTrue(descs[0].open() is descs[0].open())
+        self.assertEqual(len(self.opened), 1)
+
+    def test_locate_through_the_index(self):
+        cam = USBCamera.locate_device(CAMERA_SERIAL, index = self.index)
+        self.assertEqual(cam.get_serial_number(), CAMERA_SERIAL)
+        self.assertEqual(self.index.get(USBCamera, CAMERA_SERIAL), (cam.dev_name, cam.model))
+        del self.opened[:]
+        cam = USBCamera.locate_device(CAMERA_SERIAL, index = DeviceIndex(self.index.path))
+        self.assertEqual(self.opened, [cam.dev_name])
+
+    def test_stale_hint(self):
+        self.index.update(USBCamera, [(CAMERA_SERIAL, "/dev/fliusb-gone", "ML")])
+        cam = USBCamera.locate_device(CAMERA_SERIAL, index = self.index)
+        self.assertEqual(cam.get_serial_number(), CAMERA_SERIAL)
+        self.assertEqual(self.index.get(USBCamera, CAMERA_SERIAL)[0], cam.dev_name)
+
+    def test_not_found(self):
+        self.assertTrue(USBCamera.locate_device("NOSUCH", index = self.index) is None)
+        self.assertTrue(USBFocuser.locate_device(CAMERA_SERIAL, index = False) is None)
+
+class DeviceIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_update(self):
+        index = DeviceIndex(self.path)
+        index.update(USBCamera, [("A", "/dev/a", "ML"), ("B", "/dev/b", "ML")])
+        index.update(USBCamera, [("C", "/dev/a", "ML")])
+        index = DeviceIndex(self.path)
+        self.assertTrue(index.get(USBCamera, "A") is None)
+        self.assertEqual(index.get(USBCamera, "C"), ("/dev/a", "ML"))
+        self.assertTrue(index.get(USBFocuser, "B") is None)
+        index.remove("B")
+        self.assertTrue(DeviceIndex(self.path).get(USBCamera, "B") is None)
+
+    def test_corrupt_file(self):
+        with open(self.path, 'w') as f:
+            f.write("{not json")
+        self.assertTrue(DeviceIndex(self.path).get(USBCamera, "A") is None)
+
+if __name__ == '__main__':
+    unittest.main()
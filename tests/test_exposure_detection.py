@@ -0,0 +1,76 @@
+"""
+ tests/test_exposure_detection.py
+
+ Tests of detecting the end of an exposure, with ideal simulated cameras and
+ with ones which report the time left coarsely and the data late
+"""
+import os, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI.camera import USBCamera, ExposureTiming
+from FLI.sim import zero_latency
+###############################################################################
+EXPTIME = 45        #milliseconds, not a multiple of the coarse resolution
+RESOLUTION = 10     #milliseconds, of the coarse time left
+STATUS_LAG = 0.02   #seconds from the end of the integration to readable data
+LATENCY = 0.02      #seconds, allowed for noticing the end
+###############################################################################
+def _open_camera(**kwargs):
+    dll = zero_latency(sensor_size = (64, 48), filter_wheels = 0, focusers = 0, **kwargs)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(EXPTIME)
+    return cam
+
+class ExposureDetectionTest(unittest.TestCase):
+    def expose(self, cam):
+        cam.start_exposure()
+        timing = cam.wait_for_exposure()
+        self.assertTrue(isinstance(timing, ExposureTiming))
+        self.assertTrue(timing is cam.exposure_timing)
+        return timing
+
+    def test_ideal_camera(self):
+        cam = _open_camera()
+        timing = self.expose(cam)
+        self.assertGreaterEqual(timing.detected, timing.start + EXPTIME/1000.0)
+        self.assertLess(timing.detected, timing.start + EXPTIME/1000.0 + LATENCY)
+        self.assertLess(timing.detection_latency, LATENCY)
+        self.assertGreaterEqual(timing.trigger_latency, 0)
+        #a coarse sleep then a few fine polls
+        self.assertLess(timing.polls, 0.05/cam.poll_interval)
+        polls = timing.polls
+        self.assertTrue(cam.wait_for_exposure() is timing)
+        self.assertEqual(timing.polls, polls)
+        self.assertTrue(timing.readout_latency is None)
+        cam.release_frame(cam.fetch_image())
+        self.assertGreaterEqual(timing.readout_latency, timing.detection_latency)
+
+    def test_coarse_and_lagging_camera(self):
+        for rounding in ('ceil', 'floor'):
+            cam = _open_camera(timeleft_resolution = RESOLUTION, timeleft_rounding = rounding,
+                               status_lag = STATUS_LAG)
+            timing = self.expose(cam)
+            readable = timing.start + EXPTIME/1000.0 + STATUS_LAG
+            self.assertGreaterEqual(timing.detected, readable)
+            self.assertLess(timing.detected, readable + LATENCY)
+            self.assertLess(timing.detection_latency, LATENCY)
+
+    def test_readout_waits_for_the_data(self):
+        cam = _open_camera(status_lag = 0.1)
+        cam.set_exposure(0)
+        cam.start_exposure()
+        t_start = cam.exposure_timing.start
+        cam.release_frame(cam.fetch_image())
+        self.assertGreaterEqual(time.time() - t_start, 0.1)
+
+    def test_without_start_exposure(self):
+        cam = _open_camera()
+        cam.exposure_timing = None
+        timing = cam.wait_for_exposure()
+        self.assertTrue(timing.start is None)
+        self.assertTrue(timing.trigger_latency is None)
+        self.assertTrue(timing.detected is not None)
+
+if __name__ == '__main__':
+    unittest.main()
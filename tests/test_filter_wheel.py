@@ -0,0 +1,99 @@
+"""
+ tests/test_filter_wheel.py
+
+ Tests of the non-blocking filter wheel moves and of the filter visiting
+ order planner
+"""
+import os, itertools, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.lib import FLIError
+from FLI.filter_wheel import USBFilterWheel, plan_filter_order, DIRECTIONS
+from FLI.sim import zero_latency
+###############################################################################
+FILTER_COUNT = 5
+SLOT_TIME = 0.05 #seconds of rotation per slot
+###############################################################################
+def _slots_turned(start, stop, count, direction):
+    cw = (stop - start) % count
+    ccw = (start - stop) % count
+    return {'cw': cw, 'ccw': ccw, 'shortest': min(cw, ccw)}[direction]
+
+class PlanFilterOrderTest(unittest.TestCase):
+    def brute_force(self, positions, current, count, direction):
+        best = None
+        for order in itertools.permutations(sorted(set(positions))):
+            travel, pos = 0, current
+            for slot in order:
+                travel += _slots_turned(pos, slot, count, direction)
+                pos = slot
+            best = travel if best is None else min(best, travel)
+        return best
+
+    def test_optimal(self):
+        rng = numpy.random.RandomState(3)
+        for count in (3, 5, 7, 8):
+            for trial in range(20):
+                positions = list(rng.randint(0, count, rng.randint(1, count + 2)))
+                current = rng.randint(0, count)
+                for direction in DIRECTIONS:
+                    order, travel = plan_filter_order(positions, current, count, direction)
+                    self.assertEqual(sorted(order), range(len(positions)))
+                    pos, total = current, 0
+                    for i in order:
+                        total += _slots_turned(pos, positions[i], count, direction)
+                        pos = positions[i]
+                    self.assertEqual(total, travel)
+                    self.assertEqual(travel, self.brute_force(positions, current, count, direction))
+
+    def test_bad_position(self):
+        self.assertRaises(ValueError, plan_filter_order, [5], 0, 5)
+        self.assertRaises(ValueError, plan_filter_order, [1], 0, 5, 'up')
+
+class FilterWheelTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(cameras = 0, focusers = 0, filter_count = FILTER_COUNT,
+                           filter_slot_time = SLOT_TIME)
+        self.wheel = dll.open_devices(USBFilterWheel)[0]
+
+    def test_non_blocking_move(self):
+        move = self.wheel.set_filter_pos(2, blocking = False)
+        self.assertTrue(self.wheel.is_moving())
+        self.assertEqual(self.wheel.wait_for_move(timeout = 5.0), 2)
+        self.assertEqual(move.result(), 2)
+        self.assertFalse(self.wheel.is_moving())
+        self.assertEqual(self.wheel.get_filter_pos(), 2)
+
+    def test_moves_in_order(self):
+        moves = [self.wheel.set_filter_pos(pos, blocking = False) for pos in (1, 4, 3)]
+        self.assertEqual(self.wheel.wait_for_move(timeout = 5.0), 3)
+        self.assertEqual([move.result() for move in moves], [1, 4, 3])
+
+    def test_wait_timeout(self):
+        self.wheel.set_filter_pos(2, blocking = False)
+        self.assertRaises(FLIError, self.wheel.wait_for_move, timeout = SLOT_TIME/5)
+        self.assertEqual(self.wheel.wait_for_move(), 2)
+
+    def test_bad_position(self):
+        self.assertRaises(ValueError, self.wheel.set_filter_pos, FILTER_COUNT)
+        self.assertRaises(ValueError, self.wheel.get_filter_index, "Halpha")
+
+    def test_filter_names(self):
+        names = ["Filter %d" % pos for pos in range(FILTER_COUNT)]
+        self.assertEqual(self.wheel.get_filter_names(), names)
+        saved = self.wheel.metadata_calls_saved
+        self.assertEqual(self.wheel.get_filter_index("Filter 3"), 3)
+        self.assertGreater(self.wheel.metadata_calls_saved, saved)
+
+    def test_plan_from_the_current_position(self):
+        #from slot 0 one slot back to 4, then two more to 1
+        self.assertEqual(self.wheel.plan_filter_order(["Filter 4", 1, 4]), ([0, 2, 1], 3))
+        #from where the move in progress ends
+        self.wheel.set_filter_pos(1, blocking = False)
+        self.assertEqual(self.wheel.plan_filter_order(["Filter 4", 1, 4]), ([1, 0, 2], 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+ tests/test_fits.py
+
+ Tests of the memory-mapped FITS files and of readout straight into them
+"""
+import os, shutil, tempfile, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.fits import FITSImageFile, read_fits_image, format_card, BLOCK_SIZE
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SHAPE = (48, 64)
+###############################################################################
+class FormatCardTest(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(format_card('simple', True), ("SIMPLE  = %20s" % 'T').ljust(80))
+        self.assertEqual(format_card('NAXIS1', 64, "width"),
+                         ("NAXIS1  = %20d / width" % 64).ljust(80))
+        self.assertEqual(format_card('OBJECT', "M 31"), "OBJECT  = 'M 31    '".ljust(80))
+        self.assertEqual(format_card('END'), "END".ljust(80))
+        for card in (format_card('EXPTIME', 1.5), format_card('NOTE', "it's")):
+            self.assertEqual(len(card), 80)
+
+    def test_too_long(self):
+        self.assertRaises(ValueError, format_card, 'TOOLONGKEY', 1)
+        self.assertRaises(ValueError, format_card, 'NOTE', "x"*80)
+
+class FITSImageFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'frame.fits')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, img, chunk_bytes):
+        fits = FITSImageFile(self.path, img.shape, img.dtype, cards = [('OBJECT', 'test')])
+        row = 0
+        for window in fits.iter_windows(chunk_bytes = chunk_bytes):
+            self.assertLessEqual(window.nbytes, max(chunk_bytes, img.strides[0]))
+            window[...] = img[row:row + window.shape[0]]
+            row += window.shape[0]
+            fits.encode_window(window)
+        self.assertEqual(row, img.shape[0])
+        self.assertEqual(os.path.getsize(self.path) % BLOCK_SIZE, 0)
+        return fits
+
+    def test_round_trip(self):
+        rng = numpy.random.RandomState(4)
+        for dtype in (numpy.uint8, numpy.uint16, numpy.int32):
+            img = rng.randint(0, 2**8 if dtype == numpy.uint8 else 2**16, SHAPE).astype(dtype)
+            self.write(img, chunk_bytes = 1000)
+            numpy.testing.assert_array_equal(read_fits_image(self.path), img)
+        img = rng.normal(size = SHAPE).astype(numpy.float32)
+        self.write(img, chunk_bytes = 10**6)
+        numpy.testing.assert_array_equal(read_fits_image(self.path), img)
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, FITSImageFile, self.path, (4, 4, 4), numpy.uint16)
+        self.assertRaises(ValueError, FITSImageFile, self.path, SHAPE, numpy.float64)
+        fits = FITSImageFile(self.path, SHAPE, numpy.uint16)
+        self.assertRaises(ValueError, fits.map_rows, 10, 10)
+        self.assertRaises(ValueError, fits.map_rows, 0, SHAPE[0] + 1)
+
+class CameraFITSTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        dll = zero_latency(sensor_size = SHAPE[::-1], filter_wheels = 0, focusers = 0)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.cam.set_exposure(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_fetch_image_to_fits(self):
+        expected = numpy.array(self.cam.take_photo())
+        path = os.path.join(self.dir, 'frame.fits')
+        self.cam.start_exposure()
+        self.cam.fetch_image_to_fits(path, cards = [('EXPTIME', 0.0)], chunk_bytes = 1024)
+        numpy.testing.assert_array_equal(read_fits_image(path), expected)
+        with open(path, 'rb') as f:
+            header = f.read(BLOCK_SIZE)
+        self.assertTrue(format_card('INSTRUME', self.cam.model) in header)
+        self.assertTrue(format_card('EXPTIME', 0.0) in header)
+
+if __name__ == '__main__':
+    unittest.main()
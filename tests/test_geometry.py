@@ -0,0 +1,61 @@
+"""
+ tests/test_geometry.py
+
+ Tests of the camera geometry and info caches
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (64, 48)
+QUERIES = ('FLIGetVisibleArea', 'FLIGetArrayArea', 'FLIGetPixelSize')
+###############################################################################
+def _count_calls(dll, names):
+    "wrap the functions 'names' of 'dll' to count their calls in the returned dict"
+    counts = dict.fromkeys(names, 0)
+    def counted(name, func):
+        def wrapper(*args):
+            counts[name] += 1
+            return func(*args)
+        return wrapper
+    for name in names:
+        setattr(dll, name, counted(name, getattr(dll, name)))
+    return counts
+
+class GeometryCacheTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0)
+        self.counts = _count_calls(dll, QUERIES)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.cam.set_exposure(0)
+
+    def test_readouts_do_not_query(self):
+        self.cam.get_info()
+        for i in range(3):
+            self.cam.release_frame(self.cam.take_photo())
+        self.assertEqual(self.counts, dict.fromkeys(QUERIES, 1))
+        self.assertGreater(self.cam.metadata_calls_saved, 0)
+
+    def test_binning_changes_size(self):
+        self.assertEqual(self.cam.get_image_size()[:2], SENSOR_SIZE)
+        self.cam.set_image_binning(2, 4)
+        self.assertEqual(self.cam.get_image_size()[:2], (SENSOR_SIZE[0]/2, SENSOR_SIZE[1]/4))
+        self.assertEqual(self.cam.take_photo().shape, (SENSOR_SIZE[1]/4, SENSOR_SIZE[0]/2))
+        self.assertEqual(self.counts['FLIGetVisibleArea'], 1)
+
+    def test_camera_mode_invalidates(self):
+        info = self.cam.get_info()
+        self.cam.set_camera_mode(1)
+        self.assertEqual(self.cam.get_info(), info)
+        self.assertEqual(self.counts['FLIGetArrayArea'], 2)
+
+    def test_refresh(self):
+        self.cam.get_info()
+        self.cam.get_info(refresh = True)
+        self.assertEqual(self.counts['FLIGetPixelSize'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+ tests/test_image_area.py
+
+ Tests of subframe (ROI) readout
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (160, 120) #width, height; not square to catch swapped axes
+EXPTIME = 10             #milliseconds
+###############################################################################
+def _open_camera():
+    dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(EXPTIME)
+    return cam
+
+def _take(cam):
+    "expose and read a frame, returns a copy of it"
+    cam.start_exposure()
+    img = cam.fetch_image()
+    try:
+        return numpy.array(img)
+    finally:
+        cam.release_frame(img)
+
+class ImageAreaTest(unittest.TestCase):
+    def setUp(self):
+        self.cam = _open_camera()
+        self.full = _take(self.cam)
+
+    def test_full_frame(self):
+        self.assertEqual(self.full.shape, (SENSOR_SIZE[1], SENSOR_SIZE[0]))
+
+    def test_subframe_offsets(self):
+        self.cam.set_image_area(30, 20, 90, 70)
+        img = _take(self.cam)
+        numpy.testing.assert_array_equal(img, self.full[20:70, 30:90])
+
+    def test_binned_subframe_offsets(self):
+        self.cam.set_image_area(30, 20, 90, 70)
+        self.cam.set_image_binning(2, 2)
+        img = _take(self.cam)
+        numpy.testing.assert_array_equal(img, self.full[20:70:2, 30:90:2])
+
+    def test_area_kept_across_camera_mode(self):
+        self.cam.set_image_area(30, 20, 90, 70)
+        self.cam.set_camera_mode(1)
+        self.assertEqual(self.cam.get_image_area(), (30, 20, 90, 70))
+        numpy.testing.assert_array_equal(_take(self.cam), self.full[20:70, 30:90])
+
+    def test_reset(self):
+        self.cam.set_image_area(30, 20, 90, 70)
+        self.cam.reset_image_area()
+        self.assertEqual(self.cam.get_image_area(), self.cam.get_visible_area())
+        numpy.testing.assert_array_equal(_take(self.cam), self.full)
+
+    def test_outside_visible_area(self):
+        self.assertRaises(ValueError, self.cam.set_image_area, 30, 20, 200, 70)
+        self.assertRaises(ValueError, self.cam.set_image_area, 30, 20, 30, 70)
+        self.cam.set_image_area(30, 20, 32, 70)
+        self.assertRaises(ValueError, self.cam.set_image_binning, 4, 1)
+
+    def test_take_subframe_reuses_its_buffer(self):
+        self.cam.set_image_area(30, 20, 62, 52)
+        img = self.cam.take_subframe()
+        self.assertTrue(self.cam.take_subframe() is img)
+        numpy.testing.assert_array_equal(img, self.full[20:52, 30:62])
+        self.cam.set_image_area(30, 20, 46, 36)
+        img = self.cam.take_subframe()
+        self.assertEqual(img.shape, (16, 16))
+        self.assertEqual(self.cam.frame_pool.get_stats()['allocated'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+ tests/test_instrumentation.py
+
+ Tests of the libfli call statistics
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI.lib import CallStats
+from FLI.focuser import USBFocuser
+from FLI.filter_wheel import USBFilterWheel
+from FLI.sim import zero_latency
+###############################################################################
+class CallStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = CallStats()
+
+    def test_snapshot(self):
+        self.stats.record('FLIGrabRow', 1, 0.001, False)
+        self.stats.record('FLIGrabRow', 2, 0.003, True)
+        self.stats.record('FLIList', None, 0.0001, False)
+        snap = self.stats.snapshot()
+        grab = snap['functions']['FLIGrabRow']
+        self.assertEqual((grab['count'], grab['errors']), (2, 1))
+        self.assertAlmostEqual(grab['total'], 0.004)
+        self.assertAlmostEqual(grab['max'], 0.003)
+        self.assertEqual(sum(n for bound, n in grab['histogram']), 2)
+        for bound, n in grab['histogram']:
+            self.assertTrue(bound > 0.001)
+        self.assertEqual(snap['categories']['readout']['count'], 2)
+        self.assertEqual(snap['categories']['enumeration']['count'], 1)
+        self.assertEqual(snap['devices'][2]['FLIGrabRow']['errors'], 1)
+        self.assertEqual(sorted(snap['devices']), [1, 2])
+
+    def test_reset(self):
+        self.stats.record('FLIGrabRow', 1, 0.001, False)
+        self.stats.reset()
+        self.assertEqual(self.stats.snapshot()['functions'], {})
+
+class SimCallCountTest(unittest.TestCase):
+    "each device method makes a single simulated API call"
+    def setUp(self):
+        self.dll = zero_latency(cameras = 0, focuser_speed = 1e6, filter_slot_time = 0.001)
+        self.calls = []
+        for name in ('FLIStepMotor', 'FLIStepMotorAsync', 'FLIHomeFocuser',
+                     'FLISetFilterPos', 'FLIHomeDevice'):
+            setattr(self.dll, name, self.counted(name, getattr(self.dll, name)))
+
+    def counted(self, name, func):
+        def wrapper(*args):
+            self.calls.append(name)
+            return func(*args)
+        return wrapper
+
+    def test_focuser(self):
+        foc = self.dll.open_devices(USBFocuser)[0]
+        foc.step_motor(100)
+        foc.home_focuser()
+        self.assertEqual(self.calls, ['FLIStepMotor', 'FLIHomeFocuser'])
+
+    def test_filter_wheel(self):
+        wheel = self.dll.open_devices(USBFilterWheel)[0]
+        wheel.set_filter_pos(2)
+        self.assertEqual(self.calls, ['FLISetFilterPos'])
+
+if __name__ == '__main__':
+    unittest.main()
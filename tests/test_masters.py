@@ -0,0 +1,86 @@
+"""
+ tests/test_masters.py
+
+ Tests of the bounded memory master calibration frame builder
+"""
+import os, shutil, tempfile, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.camera import USBCamera
+from FLI.masters import FrameCombiner, MasterFrameBuilder, STATE_BYTES_PER_PIXEL
+from FLI.sim import zero_latency
+###############################################################################
+SHAPE = (24, 32)
+###############################################################################
+def _frames(n, seed = 5):
+    rng = numpy.random.RandomState(seed)
+    return rng.normal(1000, 10, (n,) + SHAPE).astype(numpy.uint16)
+
+class FrameCombinerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_mean(self):
+        frames = _frames(8)
+        combiner = FrameCombiner(SHAPE, sigma = None)
+        for frame in frames:
+            combiner.add(frame)
+        data, variance = combiner.result()
+        numpy.testing.assert_allclose(data, frames.mean(axis = 0), rtol = 1e-5)
+        numpy.testing.assert_allclose(variance, frames.var(axis = 0, ddof = 1), rtol = 1e-3)
+
+    def test_outlier_rejected(self):
+        frames = _frames(12)
+        frames[-1, 5, 7] = 60000 #cosmic ray
+        combiner = FrameCombiner(SHAPE)
+        for frame in frames:
+            combiner.add(frame)
+        data, variance = combiner.result()
+        self.assertGreaterEqual(combiner.rejected, 1)
+        self.assertLess(abs(data[5, 7] - frames[:-1, 5, 7].mean()), 1.0)
+
+    def test_median_in_tiles(self):
+        frames = _frames(6)
+        #room for the running statistics and a few rows of the cube
+        budget = SHAPE[0]*SHAPE[1]*STATE_BYTES_PER_PIXEL + 3*6*SHAPE[1]*6
+        combiner = FrameCombiner(SHAPE, method = 'median', nframes = 6,
+                                 memory_budget = budget, scratch_dir = self.dir)
+        for frame in frames:
+            combiner.add(frame)
+        self.assertRaises(ValueError, combiner.add, frames[0])
+        data, variance = combiner.result()
+        numpy.testing.assert_array_equal(data, numpy.median(frames, axis = 0))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, FrameCombiner, SHAPE, method = 'mode')
+        self.assertRaises(ValueError, FrameCombiner, SHAPE, method = 'median')
+        self.assertRaises(ValueError, FrameCombiner, SHAPE, memory_budget = 1000)
+        self.assertRaises(ValueError, FrameCombiner(SHAPE).add, numpy.zeros(SHAPE[::-1]))
+
+class MasterFrameBuilderTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = SHAPE[::-1], filter_wheels = 0, focusers = 0)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.cam.set_exposure(0)
+        self.frame = numpy.array(self.cam.take_photo(), numpy.float32)
+
+    def test_build(self):
+        for method in ('mean', 'median'):
+            builder = MasterFrameBuilder(self.cam, method = method)
+            bias = builder.build_bias(5)
+            numpy.testing.assert_allclose(bias.data, self.frame, rtol = 1e-5)
+            self.assertEqual(bias.provenance['count'], 5)
+            self.assertEqual(bias.provenance['method'], method)
+            self.assertEqual(bias.provenance['shape'], SHAPE)
+            dark = builder.build_dark(3, 5, subtract = bias)
+            numpy.testing.assert_allclose(dark.data, 0, atol = 1e-2)
+
+if __name__ == '__main__':
+    unittest.main()
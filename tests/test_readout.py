@@ -0,0 +1,61 @@
+"""
+ tests/test_readout.py
+
+ Tests of the whole-frame and row by row readout paths of 'USBCamera'
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.lib import FLIError
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (160, 120)
+###############################################################################
+def _open_camera(**kwargs):
+    dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0, **kwargs)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(0)
+    return cam
+
+def _take(cam, out = None):
+    cam.start_exposure()
+    return numpy.array(cam.fetch_image(out = out))
+
+class ReadoutModeTest(unittest.TestCase):
+    def test_modes_agree(self):
+        cam = _open_camera()
+        frames = []
+        for mode in ('row', 'frame', 'auto'):
+            cam.set_readout_mode(mode)
+            frames.append(_take(cam))
+        for img in frames[1:]:
+            numpy.testing.assert_array_equal(img, frames[0])
+
+    def test_frame_mode_unsupported(self):
+        cam = _open_camera(grab_frame = False)
+        cam.set_readout_mode('frame')
+        cam.start_exposure()
+        self.assertRaises(FLIError, cam.fetch_image)
+
+    def test_auto_falls_back_to_rows(self):
+        expected = _take(_open_camera())
+        cam = _open_camera(grab_frame = False)
+        numpy.testing.assert_array_equal(_take(cam), expected)
+
+    def test_strided_rows(self):
+        cam = _open_camera()
+        expected = _take(cam)
+        buf = numpy.zeros((SENSOR_SIZE[1], SENSOR_SIZE[0] + 8), numpy.uint16)
+        _take(cam, out = buf[:, 4:-4])
+        numpy.testing.assert_array_equal(buf[:, 4:-4], expected)
+        self.assertFalse(buf[:, :4].any() or buf[:, -4:].any())
+
+    def test_bad_mode(self):
+        self.assertRaises(ValueError, _open_camera().set_readout_mode, 'column')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+ tests/test_ready_mode.py
+
+ Tests of the ready mode, background flushing while the camera is idle, and
+ of arming the next exposure
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI.lib import FLI_BGFLUSH_START, FLI_BGFLUSH_STOP
+from FLI.camera import USBCamera, DEFAULT_NFLUSHES
+from FLI.sim import zero_latency
+###############################################################################
+FLUSH_CALLS = ('FLIControlBackgroundFlush', 'FLISetNFlushes')
+START = ('FLIControlBackgroundFlush', FLI_BGFLUSH_START)
+STOP = ('FLIControlBackgroundFlush', FLI_BGFLUSH_STOP)
+###############################################################################
+def _record_calls(dll, names):
+    "wrap the functions 'names' of 'dll' to log (name, last argument) in the returned list"
+    calls = []
+    def recorded(name, func):
+        def wrapper(*args):
+            calls.append((name, args[-1].value))
+            return func(*args)
+        return wrapper
+    for name in names:
+        setattr(dll, name, recorded(name, getattr(dll, name)))
+    return calls
+
+class ReadyModeTest(unittest.TestCase):
+    def setUp(self):
+        self.dll = zero_latency(sensor_size = (64, 48), filter_wheels = 0, focusers = 0)
+        self.calls = _record_calls(self.dll, FLUSH_CALLS)
+        self.cam = self.dll.open_devices(USBCamera)[0]
+        self.cam.set_exposure(0)
+        #the simulated camera, for the state of its background flushing
+        self.sim_cam = self.dll.devices[0]
+
+    def test_enter_and_leave(self):
+        self.cam.set_ready_mode()
+        self.assertEqual(self.calls, [('FLISetNFlushes', 0), START])
+        self.assertTrue(self.sim_cam.bgflush)
+        self.cam.set_ready_mode()
+        self.assertEqual(len(self.calls), 2)
+        self.cam.set_ready_mode(False)
+        self.assertEqual(self.calls[2:], [STOP, ('FLISetNFlushes', DEFAULT_NFLUSHES)])
+        self.assertFalse(self.sim_cam.bgflush)
+
+    def test_arm_starts_flushing_once(self):
+        self.cam.set_ready_mode()
+        del self.calls[:]
+        for i in range(3):
+            self.cam.arm()
+        self.cam.arm(exptime = 10, binning = (2, 2))
+        self.assertEqual(self.calls, [])
+        self.assertEqual((self.cam.exptime, self.cam.hbin, self.cam.vbin), (10, 2, 2))
+
+    def test_arm_outside_ready_mode(self):
+        self.cam.arm()
+        self.assertEqual(self.calls, [])
+        self.assertFalse(self.sim_cam.bgflush)
+
+    def test_flushes_deferred(self):
+        self.cam.set_ready_mode()
+        self.cam.set_flushes(5)
+        self.assertEqual(self.calls, [('FLISetNFlushes', 0), START])
+        self.assertEqual(self.sim_cam.nflushes, 0)
+        self.cam.set_ready_mode(False)
+        self.assertEqual(self.calls[-1], ('FLISetNFlushes', 5))
+        self.assertEqual(self.sim_cam.nflushes, 5)
+        self.assertRaises(ValueError, self.cam.set_flushes, 17)
+
+    def test_flushing_resumes_after_readout(self):
+        self.cam.set_ready_mode()
+        for i in range(3):
+            self.cam.arm()
+            self.cam.start_exposure()
+            self.assertFalse(self.sim_cam.bgflush)   #stopped by FLIExposeFrame
+            self.cam.wait_for_exposure()
+            self.cam.release_frame(self.cam.fetch_image())
+            self.assertTrue(self.sim_cam.bgflush)
+        self.assertEqual(self.calls.count(START), 4)
+        self.assertEqual(self.calls.count(STOP), 0)
+
+    def test_flushing_resumes_after_cancel(self):
+        self.cam.set_ready_mode()
+        self.cam.set_exposure(1000)
+        self.cam.start_exposure()
+        self.cam.cancel_exposure()
+        self.assertTrue(self.sim_cam.bgflush)
+        self.assertEqual(self.calls.count(START), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+ tests/test_row_stream.py
+
+ Tests of streaming row blocks to consumers during readout
+"""
+import os, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.lib import FLIError
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (64, 48)
+###############################################################################
+def _open_camera(**kwargs):
+    dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0, **kwargs)
+    cam = dll.open_devices(USBCamera)[0]
+    cam.set_exposure(0)
+    return cam
+
+class RowStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.cam = _open_camera()
+        img = self.cam.take_photo()
+        self.expected = numpy.array(img)
+        self.cam.release_frame(img)
+
+    def test_row_callback(self):
+        blocks = []
+        def callback(row_start, block):
+            blocks.append((row_start, numpy.array(block)))
+        self.cam.start_exposure()
+        img = self.cam.fetch_image(row_callback = callback, block_rows = 10)
+        numpy.testing.assert_array_equal(img, self.expected)
+        self.assertEqual([row_start for row_start, block in blocks], range(0, SENSOR_SIZE[1], 10))
+        numpy.testing.assert_array_equal(numpy.vstack([block for row_start, block in blocks]),
+                                         self.expected)
+
+    def test_iter_rows_into_out(self):
+        out = numpy.empty_like(self.expected)
+        self.cam.start_exposure()
+        rows = sum(block.shape[0] for row_start, block in self.cam.iter_rows(out = out, block_rows = 7))
+        self.assertEqual(rows, SENSOR_SIZE[1])
+        numpy.testing.assert_array_equal(out, self.expected)
+
+    def test_iter_rows_releases_its_frame(self):
+        pool = self.cam.frame_pool
+        for i in range(3):
+            self.cam.start_exposure()
+            for row_start, block in self.cam.iter_rows(block_rows = 16):
+                numpy.testing.assert_array_equal(block, self.expected[row_start:row_start + 16])
+        stats = pool.get_stats()
+        self.assertEqual(stats['allocated'], 1)
+        self.assertEqual(stats['reused'], 3)
+
+    def test_unstarted_iteration_takes_no_frame(self):
+        self.cam.start_exposure()
+        self.cam.iter_rows().close()
+        self.assertRaises(ValueError, list, self.cam.iter_rows(block_rows = 0))
+        self.assertEqual(self.cam.frame_pool.get_stats()['free'], 1)
+        self.cam.release_frame(self.cam.fetch_image())
+        self.assertEqual(self.cam.frame_pool.get_stats()['allocated'], 1)
+
+    def test_early_stop_reads_the_rest(self):
+        self.cam.start_exposure()
+        rows = self.cam.iter_rows(block_rows = 8)
+        next(rows)
+        rows.close()
+        numpy.testing.assert_array_equal(self.cam.take_photo(), self.expected)
+
+    def test_errors(self):
+        cam = _open_camera(grab_frame = False)
+        cam.set_readout_mode('frame')
+        cam.start_exposure()
+        self.assertRaises(FLIError, list, cam.iter_rows())
+
+if __name__ == '__main__':
+    unittest.main()
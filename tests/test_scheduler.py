@@ -0,0 +1,115 @@
+"""
+ tests/test_scheduler.py
+
+ Tests of the per device command scheduler
+"""
+import os, time, threading, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI.scheduler import CommandScheduler, get_priority, PRIORITY_READOUT,\
+                          PRIORITY_CONTROL, PRIORITY_TELEMETRY
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SETTLE = 0.05 #seconds for a started thread to queue up
+###############################################################################
+def _start(func, *args):
+    thread = threading.Thread(target = func, args = args)
+    thread.daemon = True
+    thread.start()
+    time.sleep(SETTLE)
+    return thread
+
+class CommandSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = CommandScheduler()
+
+    def test_priorities(self):
+        self.assertEqual(get_priority('FLIGrabRow'), PRIORITY_READOUT)
+        self.assertEqual(get_priority('FLIExposeFrame'), PRIORITY_CONTROL)
+        self.assertEqual(get_priority('FLIReadTemperature'), PRIORITY_TELEMETRY)
+        self.assertEqual(get_priority('FLIGetModel'), PRIORITY_TELEMETRY)
+
+    def test_most_urgent_class_goes_first(self):
+        order = []
+        self.scheduler.acquire(PRIORITY_CONTROL)
+        threads = [_start(self.scheduler.call, priority, order.append, priority)
+                   for priority in (PRIORITY_TELEMETRY, PRIORITY_CONTROL, PRIORITY_READOUT)]
+        self.assertEqual(order, [])
+        self.scheduler.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [PRIORITY_READOUT, PRIORITY_CONTROL, PRIORITY_TELEMETRY])
+        stats = self.scheduler.get_stats()
+        self.assertEqual(stats['telemetry']['grants'], 1)
+        self.assertGreaterEqual(stats['telemetry']['max_wait'], 2*SETTLE)
+
+    def test_reentrant(self):
+        with self.scheduler.hold(PRIORITY_READOUT):
+            with self.scheduler.hold(PRIORITY_TELEMETRY):
+                self.assertEqual(self.scheduler.busy_priority, PRIORITY_READOUT)
+        self.assertTrue(self.scheduler.busy_priority is None)
+        self.assertRaises(RuntimeError, self.scheduler.release)
+
+    def test_coalesced(self):
+        calls = []
+        results = []
+        def query():
+            calls.append(1)
+            return 42
+        def ask():
+            results.append(self.scheduler.call_coalesced('query', PRIORITY_TELEMETRY, query))
+        self.scheduler.acquire(PRIORITY_READOUT)
+        threads = [_start(ask) for i in range(3)]
+        self.scheduler.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, [42, 42, 42]))
+        self.assertEqual(self.scheduler.get_stats()['coalesced'], 2)
+        #later calls run again
+        ask()
+        self.assertEqual(len(calls), 2)
+
+    def test_coalesced_errors_shared(self):
+        errors = []
+        def query():
+            raise KeyError
+        def ask():
+            try:
+                self.scheduler.call_coalesced('query', PRIORITY_TELEMETRY, query)
+            except KeyError:
+                errors.append(1)
+        self.scheduler.acquire()
+        threads = [_start(ask) for i in range(2)]
+        self.scheduler.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 2)
+
+    def test_coalesced_while_holding(self):
+        with self.scheduler.hold():
+            self.assertEqual(self.scheduler.call_coalesced('query', PRIORITY_TELEMETRY, len, "ab"), 2)
+
+class DeviceSchedulingTest(unittest.TestCase):
+    def test_telemetry_waits_for_readout(self):
+        dll = zero_latency(sensor_size = (64, 48), filter_wheels = 0, focusers = 0,
+                           usb_bytes_per_second = 64*48*2/0.2)
+        cam = dll.open_devices(USBCamera)[0]
+        cam.set_exposure(0)
+        cam.start_exposure()
+        times = []
+        def read():
+            cam.release_frame(cam.fetch_image())
+            times.append(('readout', time.time()))
+        thread = threading.Thread(target = read)
+        thread.start()
+        time.sleep(SETTLE)
+        cam.get_temperature()
+        times.append(('telemetry', time.time()))
+        thread.join()
+        self.assertEqual([name for name, t in sorted(times, key = lambda item: item[1])],
+                         ['readout', 'telemetry'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+ tests/test_sequencer.py
+
+ Tests of the step graph and of observation sequences run with the simulated
+ camera, filter wheel and focuser
+"""
+import os, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+from FLI.camera import USBCamera
+from FLI.filter_wheel import USBFilterWheel
+from FLI.focuser import USBFocuser
+from FLI.sequencer import StepGraph, ObservationSequencer, Target, HOST_RESOURCE
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (64, 48)
+BASE_FOCUS = 1000
+SAVE_TIME = 0.1 #seconds
+###############################################################################
+def _sleep(seconds, value = None):
+    def step():
+        time.sleep(seconds)
+        return value
+    return step
+
+class StepGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = StepGraph()
+
+    def test_dependencies(self):
+        self.graph.add('a', _sleep(0.02, 1))
+        self.graph.add('b', _sleep(0, 2), after = ['a'])
+        timeline = self.graph.run()
+        self.assertEqual(self.graph.results, {'a': 1, 'b': 2})
+        self.assertGreaterEqual(timeline['b'].start, timeline['a'].end)
+        self.assertGreaterEqual(timeline['b'].ready, timeline['a'].end)
+        self.assertEqual([r.name for r in timeline], ['a', 'b'])
+        self.assertEqual(timeline['a'].resource, HOST_RESOURCE)
+
+    def test_resources(self):
+        for name, resource in (('a', 'x'), ('b', 'x'), ('c', 'y')):
+            self.graph.add(name, _sleep(0.05), resource = resource)
+        timeline = self.graph.run()
+        #one step at a time per resource, in the order they were added
+        self.assertGreaterEqual(timeline['b'].start, timeline['a'].end)
+        self.assertGreater(timeline['b'].wait, 0.03)
+        self.assertLess(timeline['c'].start, timeline['a'].end)
+        self.assertGreaterEqual(timeline.busy_time('x'), 0.1)
+
+    def test_error(self):
+        def fail():
+            raise KeyError('boom')
+        self.graph.add('a', fail)
+        self.graph.add('b', _sleep(0), after = ['a'])
+        self.assertRaises(KeyError, self.graph.run)
+        timeline = self.graph.timeline
+        self.assertTrue(isinstance(timeline['a'].error, KeyError))
+        self.assertTrue(timeline['b'].start is None)
+        self.assertTrue('skipped' in timeline.format())
+
+    def test_bad_steps(self):
+        self.graph.add('a', _sleep(0))
+        self.assertRaises(ValueError, self.graph.add, 'a', _sleep(0))
+        self.assertRaises(ValueError, self.graph.add, 'b', _sleep(0), after = ['c'])
+
+class ObservationSequencerTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = SENSOR_SIZE, filter_slot_time = 0.02,
+                           focuser_speed = 1e5)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.wheel = dll.open_devices(USBFilterWheel)[0]
+        self.foc = dll.open_devices(USBFocuser)[0]
+        self.targets = [Target('a', 20, count = 2, filter = 1, focus_offset = 50),
+                        Target('b', 20, count = 2, filter = 'Filter 3', focus_offset = -50)]
+        self.saved = []
+
+    def save(self, img, target, index):
+        self.saved.append((target.name, index, img.shape))
+        time.sleep(SAVE_TIME)
+
+    def run_sequence(self, pipelined):
+        seq = ObservationSequencer(self.cam, wheel = self.wheel, focuser = self.foc,
+                                   base_focus = BASE_FOCUS, pipelined = pipelined)
+        return seq.run(self.targets, save = self.save)
+
+    def test_pipelined(self):
+        timeline = self.run_sequence(pipelined = True)
+        shape = SENSOR_SIZE[::-1]
+        self.assertEqual(sorted(self.saved), [('a', 0, shape), ('a', 1, shape),
+                                              ('b', 0, shape), ('b', 1, shape)])
+        self.assertEqual(self.wheel.get_filter_pos(), 3)
+        self.assertEqual(self.foc.get_stepper_position(), BASE_FOCUS - 50)
+        #the moves to 'b' only wait for the end of the last integration of 'a'
+        for move in ('b.filter', 'b.focus'):
+            self.assertGreaterEqual(timeline[move].ready, timeline['a.1.expose'].end)
+            self.assertLess(timeline[move].ready, timeline['a.1.readout'].end)
+            self.assertLess(timeline[move].start, timeline['a.1.save'].end)
+            self.assertGreaterEqual(timeline['b.0.expose'].start, timeline[move].end)
+        #saving overlaps the next exposure
+        self.assertLess(timeline['a.1.expose'].start, timeline['a.0.save'].end)
+        for r in timeline:
+            if r.name.endswith('.save'):
+                self.assertGreaterEqual(r.start, timeline[r.name[:-4] + 'readout'].end)
+        stats = self.cam.frame_pool.get_stats()
+        self.assertEqual(stats['free'], stats['allocated'])
+
+    def test_serial(self):
+        timeline = self.run_sequence(pipelined = False)
+        self.assertEqual([(name, index) for name, index, shape in self.saved],
+                         [('a', 0), ('a', 1), ('b', 0), ('b', 1)])
+        records = list(timeline)
+        for before, after in zip(records, records[1:]):
+            self.assertGreaterEqual(after.start, before.end)
+        self.assertGreaterEqual(timeline.elapsed, 4*SAVE_TIME)
+        summary = timeline.summary('camera')
+        self.assertEqual(list(summary), ['a', 'b'])
+
+    def test_frames_kept_without_save(self):
+        seq = ObservationSequencer(self.cam)
+        graph = seq.build([Target('a', 0, count = 2, filter = 1)])
+        self.assertEqual(len(graph), 4)
+        graph.run()
+        self.assertEqual(sorted(graph.results), ['a.0.expose', 'a.0.readout',
+                                                 'a.1.expose', 'a.1.readout'])
+        self.assertEqual(graph.results['a.1.readout'].shape, SENSOR_SIZE[::-1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+ tests/test_sim.py
+
+ Tests of the simulated libfli backend, run from the top of the source tree
+ with
+
+     PYTHONPATH=src python -m unittest discover tests
+
+ The other test modules drive the device classes against it through
+ 'FLI.sim.zero_latency'.
+"""
+import os, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.lib import FLIError
+from FLI.device import USBDevice
+from FLI.camera import USBCamera
+from FLI.focuser import USBFocuser
+from FLI.filter_wheel import USBFilterWheel
+from FLI.sim import SimulatedLibFLI, zero_latency
+###############################################################################
+SENSOR_SIZE = (160, 120) #width, height; not square to catch swapped axes
+EXPTIME = 10             #milliseconds
+###############################################################################
+def _take(cam):
+    "expose and read a frame, returns a copy of it"
+    cam.start_exposure()
+    img = cam.fetch_image()
+    try:
+        return numpy.array(img)
+    finally:
+        cam.release_frame(img)
+
+class OpenDevicesTest(unittest.TestCase):
+    def test_counts(self):
+        dll = zero_latency(cameras = 2, focusers = 1, filter_wheels = 0,
+                           sensor_size = SENSOR_SIZE)
+        self.assertEqual(len(dll.open_devices(USBCamera)), 2)
+        self.assertEqual(len(dll.open_devices(USBFocuser)), 1)
+        self.assertEqual(dll.open_devices(USBFilterWheel), [])
+
+    def test_loaded_library_restored(self):
+        prev = USBDevice._libfli, USBCamera._libfli
+        cam = zero_latency(sensor_size = SENSOR_SIZE).open_devices(USBCamera)[0]
+        self.assertEqual((USBDevice._libfli, USBCamera._libfli), prev)
+        self.assertEqual(cam.get_serial_number(), "SIMCAM0000")
+
+    def test_errors_raised(self):
+        dll = zero_latency(sensor_size = SENSOR_SIZE)
+        cam = dll.open_devices(USBCamera)[0]
+        self.assertRaises(FLIError, cam.set_image_binning, 17, 1)
+
+    def test_bad_rounding(self):
+        self.assertRaises(ValueError, SimulatedLibFLI, timeleft_rounding = 'up')
+
+class CameraTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.cam.set_exposure(EXPTIME)
+
+    def test_frames_repeat(self):
+        img = _take(self.cam)
+        self.assertEqual(img.shape, (SENSOR_SIZE[1], SENSOR_SIZE[0]))
+        numpy.testing.assert_array_equal(_take(self.cam), img)
+
+    def test_binned_frame_from_sensor(self):
+        full = _take(self.cam)
+        self.cam.set_image_binning(2, 3)
+        numpy.testing.assert_array_equal(_take(self.cam), full[::3, ::2])
+
+    def test_exposure_follows_the_clock(self):
+        self.cam.set_exposure(200)
+        self.cam.start_exposure()
+        self.assertTrue(0 < self.cam.get_exposure_timeleft() <= 200)
+        self.assertFalse(self.cam.is_exposure_complete())
+        time.sleep(0.25)
+        self.assertEqual(self.cam.get_exposure_timeleft(), 0)
+        self.cam.release_frame(self.cam.fetch_image())
+
+class FocusSimulationTest(unittest.TestCase):
+    def test_star_sharpest_in_focus(self):
+        dll = zero_latency(sensor_size = (64, 64), filter_wheels = 0,
+                           focuser_speed = 1e6, best_focus = 100)
+        cam = dll.open_devices(USBCamera)[0]
+        foc = dll.open_devices(USBFocuser)[0]
+        cam.set_exposure(0)
+        peaks = []
+        for steps in (100, 500):
+            foc.step_motor(steps)
+            peaks.append(_take(cam).max())
+        self.assertGreater(peaks[0], peaks[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+ tests/test_telemetry.py
+
+ Tests of the telemetry ring buffer and the background sampler
+"""
+import os, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.telemetry import TelemetryRing, TelemetrySampler
+from FLI.scheduler import PRIORITY_READOUT
+from FLI.camera import USBCamera
+from FLI.focuser import USBFocuser
+from FLI.sim import zero_latency
+###############################################################################
+class TelemetryRingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = TelemetryRing(('a', 'b'), capacity = 4)
+
+    def test_empty(self):
+        self.assertTrue(self.ring.latest() is None)
+        times, values = self.ring.history()
+        self.assertEqual(values.shape, (0, 2))
+
+    def test_wraps_around(self):
+        for t in range(6):
+            self.ring.append(t, (t, 10*t))
+        self.assertEqual(len(self.ring), 4)
+        times, values = self.ring.history()
+        numpy.testing.assert_array_equal(times, [2, 3, 4, 5])
+        numpy.testing.assert_array_equal(values[:, 1], [20, 30, 40, 50])
+        t, latest = self.ring.latest()
+        self.assertEqual((t, list(latest)), (5, [5, 50]))
+
+    def test_window_and_channels(self):
+        for t in range(6):
+            self.ring.append(t, (t, 10*t))
+        times, values = self.ring.history(since = 3, until = 5, channels = ['b'])
+        numpy.testing.assert_array_equal(times, [3, 4])
+        numpy.testing.assert_array_equal(values, [[30], [40]])
+
+    def test_summary_ignores_failed_reads(self):
+        self.ring.append(0, (1.0, numpy.nan))
+        self.ring.append(1, (3.0, numpy.nan))
+        summary = self.ring.summary()
+        self.assertEqual((summary['a']['mean'], summary['a']['samples']), (2.0, 2))
+        self.assertTrue(summary['b'] is None)
+
+class TelemetrySamplerTest(unittest.TestCase):
+    def setUp(self):
+        self.dll = zero_latency(sensor_size = (64, 48), filter_wheels = 0)
+        self.cam = self.dll.open_devices(USBCamera)[0]
+
+    def test_channels(self):
+        sampler = TelemetrySampler(self.cam)
+        self.assertEqual(sampler.channels, ('temperature', 'ccd_temperature',
+                                            'base_temperature', 'cooler_power'))
+        foc = self.dll.open_devices(USBFocuser)[0]
+        self.assertEqual(TelemetrySampler(foc).channels,
+                         ('internal_temperature', 'external_temperature'))
+        self.assertRaises(ValueError, TelemetrySampler, self.cam, channels = ['humidity'])
+
+    def test_sample_once(self):
+        sampler = TelemetrySampler(self.cam, channels = ['ccd_temperature'])
+        values = sampler.sample_once()
+        self.assertEqual(values[0], self.cam.read_CCD_temperature())
+        self.assertEqual(sampler.latest('ccd_temperature'), values[0])
+        self.assertEqual(sorted(sampler.latest()), ['ccd_temperature', 'time'])
+
+    def test_background_sampling(self):
+        with TelemetrySampler(self.cam, interval = 0.01) as sampler:
+            time.sleep(0.1)
+        self.assertGreaterEqual(sampler.samples, 5)
+        self.assertEqual(len(sampler.history()[0]), sampler.samples)
+        self.assertEqual(sampler.errors, 0)
+
+    def test_paused_by_readout(self):
+        with TelemetrySampler(self.cam, interval = 0.01) as sampler:
+            time.sleep(0.05)
+            with self.cam.scheduler.hold(PRIORITY_READOUT):
+                t_start = time.time()
+                time.sleep(0.2)
+                t_end = time.time()
+            time.sleep(0.05)
+        self.assertGreater(sampler.paused, 0)
+        times, values = sampler.history(since = t_start, until = t_end)
+        self.assertEqual(len(times), 0)
+        self.assertGreater(len(sampler.history(since = t_end)[0]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+ tests/test_video.py
+
+ Tests of video mode streaming with 'VideoStream'
+"""
+import os, time, unittest
+
+os.environ.setdefault('FLI_BACKEND', 'sim')
+
+import numpy
+
+from FLI.lib import FLIError
+from FLI.camera import USBCamera
+from FLI.sim import zero_latency
+###############################################################################
+SENSOR_SIZE = (64, 48)
+###############################################################################
+class VideoStreamTest(unittest.TestCase):
+    def setUp(self):
+        dll = zero_latency(sensor_size = SENSOR_SIZE, filter_wheels = 0, focusers = 0)
+        self.cam = dll.open_devices(USBCamera)[0]
+        self.cam.set_exposure(10)
+
+    def test_frames(self):
+        expected = numpy.array(self.cam.take_photo())
+        with self.cam.video_stream(nbuffers = 3, max_frames = 7) as stream:
+            frames = [img for img in stream]
+        self.assertEqual(len(frames), 7)
+        self.assertEqual(len(set(id(img) for img in frames)), 3)
+        self.assertTrue(frames[0] is frames[3])
+        numpy.testing.assert_array_equal(frames[-1], expected)
+        stats = stream.get_stats()
+        self.assertEqual((stats['frames'], stats['dropped']), (7, 0))
+        self.assertTrue(50 < stats['fps'] < 150)
+
+    def test_stopped_on_exit(self):
+        try:
+            with self.cam.video_stream(max_frames = 2) as stream:
+                for img in stream:
+                    raise KeyError
+        except KeyError:
+            pass
+        self.assertFalse(stream.active)
+        self.assertRaises(FLIError, self.cam.grab_video_frame)
+
+    def test_dropped_frames(self):
+        with self.cam.video_stream(max_frames = 10) as stream:
+            for img in stream:
+                if stream.frames == 5:
+                    time.sleep(0.045)
+        #about 4 frames are missed, others may be when the host is busy
+        self.assertGreaterEqual(stream.get_stats()['dropped'], 3)
+
+    def test_bad_buffer_count(self):
+        self.assertRaises(ValueError, self.cam.video_stream, nbuffers = 0)
+
+if __name__ == '__main__':
+    unittest.main()